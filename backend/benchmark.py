@@ -0,0 +1,53 @@
+"""Micro-benchmarks for the recipe catalog.
+
+Usage:
+    python benchmark.py            # run every benchmark
+    python benchmark.py lookup     # run a single benchmark by name
+
+The benchmarks live in the benchmarks package, a module per area.
+"""
+import sys
+from typing import Callable, Dict
+
+from benchmarks.concurrency import bench_cache, bench_shards, bench_versions
+from benchmarks.facets import bench_columnar, bench_facet_counts, bench_facets, bench_sort
+from benchmarks.features import bench_ingredients, bench_pantry, bench_similar, bench_suggestions
+from benchmarks.search import (bench_bm25, bench_cursor, bench_fuzzy, bench_highlight, bench_hybrid, bench_paging,
+                               bench_partial, bench_query, bench_search, bench_trigram)
+from benchmarks.storage import bench_lookup, bench_memory, bench_mmap, bench_recovery, bench_sqlite, bench_wal
+
+BENCHMARKS: Dict[str, Callable] = {
+    "lookup": bench_lookup,
+    "search": bench_search,
+    "trigram": bench_trigram,
+    "partial": bench_partial,
+    "facets": bench_facets,
+    "facet_counts": bench_facet_counts,
+    "sort": bench_sort,
+    "columnar": bench_columnar,
+    "sqlite": bench_sqlite,
+    "wal": bench_wal,
+    "recovery": bench_recovery,
+    "mmap": bench_mmap,
+    "memory": bench_memory,
+    "versions": bench_versions,
+    "shards": bench_shards,
+    "bm25": bench_bm25,
+    "paging": bench_paging,
+    "cursor": bench_cursor,
+    "cache": bench_cache,
+    "query": bench_query,
+    "pantry": bench_pantry,
+    "ingredients": bench_ingredients,
+    "suggestions": bench_suggestions,
+    "similar": bench_similar,
+    "hybrid": bench_hybrid,
+    "fuzzy": bench_fuzzy,
+    "highlight": bench_highlight,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
@@ -0,0 +1 @@
+"""Micro-benchmarks for the recipe catalog, one module per area; run them through benchmark.py"""
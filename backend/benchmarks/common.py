@@ -0,0 +1,84 @@
+"""Synthetic recipes and timing helpers shared by the benchmarks"""
+import random
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List
+
+from main import global_recipe_database
+from models import Recipe, RecipeFilter
+from store import RecipeStore
+
+SIZES = [10, 1_000, 100_000, 1_000_000]
+# Index builds are pure Python, so search benchmarks stop short of 1M
+SEARCH_SIZES = [1_000, 10_000, 100_000]
+SEARCH_TERMS = ["paneer", "chick", "chef meera", "ginger-garlic", "butter chicken 1"]
+TRIGRAM_SIZES = [10_000, 100_000, 300_000]
+FACET_SIZES = [10_000, 100_000, 1_000_000]
+FACET_FILTERS = [
+    RecipeFilter(),
+    RecipeFilter(category="Dessert"),
+    RecipeFilter(category="Main Course", difficulty="Hard", maxTime=30),
+    RecipeFilter(difficulty="Easy", maxTime=120),
+]
+PARTIAL_TERMS = ["biry", "chettin", "manchu", "fenugr", "kidney b", "saffr"]
+PARTIAL_SIZES = [20_000, 100_000]
+
+CATEGORIES = ["Main Course", "Breakfast", "Dessert", "Snacks", "Beverages"]
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+DISHES = global_recipe_database
+INGREDIENTS = ["chicken", "paneer", "basmati rice", "tomato puree", "heavy cream", "butter",
+               "garam masala", "red chili powder", "ginger-garlic paste", "cumin powder",
+               "toor dal", "curry leaves", "mustard seeds", "spinach", "chickpeas", "potatoes",
+               "urad dal", "fenugreek seeds", "tamarind paste", "coconut milk", "jaggery",
+               "cardamom", "saffron", "ghee", "yogurt", "mutton", "fish fillets", "prawns",
+               "okra", "brinjal", "cauliflower", "green peas", "semolina", "besan", "rice flour",
+               "kidney beans", "mint leaves", "cilantro", "green chilies", "soy sauce"]
+TAGS = ["Indian", "Vegetarian", "Non-Vegetarian", "Creamy", "Spicy", "South Indian",
+        "North Indian", "Healthy", "Popular", "Traditional"]
+AUTHORS = ["Chef Rajesh", "Chef Krishnan", "Chef Meera", "Chef Raman", "Chef Kamala"]
+
+
+
+def iter_recipe_fields(count: int, seed: int = 42) -> Iterator[Dict]:
+    """Field dicts for synthetic recipes, generated one at a time"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    for i in range(count):
+        dish = rng.choice(DISHES)
+        yield dict(
+            id=str(i),
+            title=f"{dish} {i}",
+            description=f"Homestyle {dish.lower()} variation number {i}",
+            image="",
+            category=rng.choice(CATEGORIES),
+            difficulty=rng.choice(DIFFICULTIES),
+            cookingTime=rng.randrange(10, 181, 5),
+            servings=rng.randrange(1, 9),
+            ingredients=[f"{rng.randrange(1, 4)} cup {name}" for name in rng.sample(INGREDIENTS, 6)],
+            instructions=["Prepare the ingredients", "Cook and serve"],
+            tags=rng.sample(TAGS, 3),
+            rating=round(rng.uniform(3.0, 5.0), 1),
+            author=rng.choice(AUTHORS),
+            createdAt=now,
+            isFavorite=False,
+        )
+
+
+def make_recipes(count: int, seed: int = 42) -> List[Recipe]:
+    """Build synthetic recipes without paying for pydantic validation"""
+    return [Recipe.model_construct(**fields) for fields in iter_recipe_fields(count, seed)]
+
+
+def timed(fn: Callable, repeat: int) -> float:
+    """Average wall time of fn() in microseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def build_store(recipes: List[Recipe]) -> RecipeStore:
+    store = RecipeStore()
+    for recipe in recipes:
+        store.add(recipe)
+    return store
@@ -0,0 +1,178 @@
+"""Benchmarks of concurrent access: catalog versions, shard processes and the result cache"""
+import gc
+import os
+import random
+import threading
+import time
+from typing import List
+
+from benchmarks.common import FACET_FILTERS, build_store, make_recipes, timed
+from models import Recipe, RecipeFilter
+from result_cache import ResultCache
+from shards import ShardPool, ShardedRecipeStore
+from store import RecipeStore
+from versions import VersionedCatalog
+
+
+def check_snapshot_isolation(catalog: VersionedCatalog, batches: List[List[Recipe]]) -> None:
+    """Readers scanning while a writer publishes bulk imports must never see half a batch"""
+    batch_size = len(batches[0])
+    done = threading.Event()
+    seen = []
+
+    def reader() -> None:
+        while not done.is_set():
+            version = catalog.current()
+            stats = version.store.stats()
+            total = sum(stats["categories"].values())
+            assert total == len(version.store) and total % batch_size == 0, (version.number, total)
+            seen.append(version.number)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for batch in batches:
+        with catalog.write() as version:
+            for recipe in batch:
+                version.store.add(recipe)
+    done.set()
+    for thread in readers:
+        thread.join()
+    print(f"snapshot isolation: ok ({len(seen)} scans across {len(set(seen))} versions)")
+
+
+def bench_versions():
+    """Cost of publishing a copy-on-write catalog version per write, through catalog.write()"""
+    print(f"{'recipes':>10} {'empty ms':>9} {'add ms':>7} {'replace ms':>11} {'remove ms':>10} {'500 adds ms':>12}")
+    for size in [1_000, 10_000, 100_000]:
+        recipes = make_recipes(size + 600)
+        catalog = VersionedCatalog(build_store(recipes[:size]))
+        extra = iter(recipes[size:size + 100])
+        victims = iter(recipes[:size])
+
+        def empty_write():
+            with catalog.write():
+                pass
+
+        def add_write():
+            with catalog.write() as version:
+                version.store.add(next(extra))
+
+        def replace_write():
+            recipe = next(victims)
+            with catalog.write() as version:
+                version.store.replace(recipe.id, recipe.model_copy(update={"rating": 1.0}))
+
+        def remove_write():
+            with catalog.write() as version:
+                version.store.remove(next(victims).id)
+
+        empty_ms, add_ms, replace_ms, remove_ms = (
+            timed(fn, 50) / 1000 for fn in (empty_write, add_write, replace_write, remove_write)
+        )
+        start = time.perf_counter()
+        with catalog.write() as version:
+            for recipe in recipes[size + 100:]:
+                version.store.add(recipe)
+        batch_ms = (time.perf_counter() - start) * 1000
+        print(f"{size:>10} {empty_ms:>9.3f} {add_ms:>7.3f} {replace_ms:>11.3f} {remove_ms:>10.3f} {batch_ms:>12.2f}")
+
+    size = 20_000
+    recipes = make_recipes(size)
+    catalog = VersionedCatalog(RecipeStore())
+    start = time.perf_counter()
+    for recipe in recipes:
+        with catalog.write() as version:
+            version.store.add(recipe)
+    print(f"built {size} recipes one write each: {time.perf_counter() - start:.1f} s")
+
+    recipes = make_recipes(20_000)
+    catalog = VersionedCatalog(build_store(recipes[:10_000]))
+    pinned = catalog.current()
+    check_snapshot_isolation(catalog, [recipes[i:i + 500] for i in range(10_000, 20_000, 500)])
+    assert len(pinned.store) == 10_000
+    live = catalog.live_versions()
+    del pinned
+    gc.collect()
+    print(f"live versions: {live} while an old reader held one, {catalog.live_versions()} after")
+
+
+def bench_shards():
+    """Scatter-gather query latency across 1, 2, 4 and 8 shard processes"""
+    size = 100_000
+    recipes = make_recipes(size)
+    queries = [RecipeFilter(search=term) for term in ["chick", "paneer", "biry"]] + [FACET_FILTERS[2]]
+    labels = [filters.search or "Main Course/Hard/30" for filters in queries]
+    print(f"{size} recipes, {os.cpu_count()} CPUs; ms per query, all hits / top 50")
+    print(f"{'shards':>8} " + " ".join(f"{label:>21}" for label in labels))
+
+    local = build_store(recipes)
+    row = [f"{timed(lambda: local.filter(f), 3) / 1000:9.1f} / {timed(lambda: local.search(f, 50), 3) / 1000:9.1f}"
+           for f in queries]
+    print(f"{'local':>8} " + " ".join(f"{cell:>21}" for cell in row))
+    del local
+
+    for shards in [1, 2, 4, 8]:
+        pool = ShardPool(shards)
+        store = ShardedRecipeStore(pool)
+        for recipe in recipes:
+            store.add(recipe)
+        store.flush()
+        row = [f"{timed(lambda: store.filter(f), 3) / 1000:9.1f} / {timed(lambda: store.search(f, 50), 3) / 1000:9.1f}"
+               for f in queries]
+        print(f"{shards:>8} " + " ".join(f"{cell:>21}" for cell in row))
+        del store
+        pool.shutdown()
+
+
+def bench_cache():
+    """Repeated popular filters with writes mixed in: result cache against searching every time"""
+    size = 100_000
+    recipes = make_recipes(size)
+    extra = [recipe.model_copy(update={"id": f"new-{recipe.id}"}) for recipe in make_recipes(2_000, seed=1)]
+    rng = random.Random(0)
+    # A few filter combinations get most of the traffic
+    popular = [RecipeFilter(), RecipeFilter(category="Main Course"), RecipeFilter(category="Dessert"),
+               RecipeFilter(search="chicken"), RecipeFilter(search="paneer"), RecipeFilter(maxTime=30),
+               RecipeFilter(search="rice", category="Main Course"), RecipeFilter(difficulty="Easy")]
+    weights = [1 / (rank + 1) for rank in range(len(popular))]
+    requests = 2_000
+    print(f"{size} recipes, {requests} requests of 20 results, one write per 20 reads")
+    print(f"{'mode':>8} {'read ms':>8} {'write ms':>9} {'hit rate':>9} {'cache KB':>9}")
+    for cached in (False, True):
+        catalog = VersionedCatalog(build_store(recipes))
+        cache = ResultCache(catalog)
+        reads = writes = 0.0
+        pending = list(extra)
+        for i in range(requests):
+            if i % 20 == 19:
+                start = time.perf_counter()
+                with catalog.write() as version:
+                    if rng.random() < 0.5:
+                        recipe = pending.pop()
+                        version.store.add(recipe)
+                        if cached:
+                            cache.added(version.store, recipe)
+                    else:
+                        old_id = recipes[rng.randrange(size)].id
+                        old = version.store.get(old_id)
+                        new = old.to_recipe().model_copy(update={"rating": round(rng.uniform(3, 5), 1)})
+                        version.store.replace(old_id, new)
+                        if cached:
+                            cache.replaced(version.store, old, new)
+                writes += time.perf_counter() - start
+                continue
+            filters = rng.choices(popular, weights)[0]
+            store = catalog.current().store
+            start = time.perf_counter()
+            if cached:
+                total, ids = cache.search(store, filters, 20, None, lambda bound: store.search(filters, bound))
+                page = [store.get(recipe_id) for recipe_id in ids]
+            else:
+                total, page = store.search(filters, 20)
+            reads += time.perf_counter() - start
+        stats = cache.stats()
+        write_count = requests // 20
+        print(f"{'cache' if cached else 'none':>8} {reads / (requests - write_count) * 1000:>8.2f} "
+              f"{writes / write_count * 1000:>9.2f} {stats['hit_rate'] if cached else 0:>9.1%} "
+              f"{stats['memory_bytes'] / 1024:>9.0f}")
@@ -0,0 +1,115 @@
+"""Facet benchmarks: filtering, counts, sorting and the columnar index"""
+from benchmarks.common import FACET_FILTERS, FACET_SIZES, make_recipes, timed
+from bitset import iter_bits, mask_of
+from columnar import ColumnarIndex
+from facet_index import FacetIndex, count_facets
+from filters import SORT_KEYS, matches_ranges, relevance_key, relevance_tier, top_k
+from main import filter_recipes
+from models import RecipeFilter
+from sort_index import SortIndex
+
+
+def bench_facets():
+    """Facet-only browsing: per-recipe predicates against bitset ANDs"""
+    print(f"{'recipes':>10} {'filter':>40} {'scan ms':>9} {'mask ms':>9} {'bitset ms':>10} {'hits':>8}")
+    for size in FACET_SIZES:
+        recipes = make_recipes(size)
+        index = FacetIndex()
+        for slot, recipe in enumerate(recipes):
+            index.add(slot, recipe)
+        for filters in FACET_FILTERS:
+            label = f"{filters.category}/{filters.difficulty}/{filters.maxTime}"
+            repeat = max(1, 100_000 // size)
+            scan_ms = timed(lambda: filter_recipes(recipes, filters), repeat) / 1000
+            mask_ms = timed(lambda: index.mask(filters), repeat * 10) / 1000
+            bitset_ms = timed(lambda: [recipes[slot] for slot in iter_bits(index.mask(filters))], repeat) / 1000
+            hits = int(index.mask(filters)).bit_count()
+            print(f"{size:>10} {label:>40} {scan_ms:>9.2f} {mask_ms:>9.3f} {bitset_ms:>10.2f} {hits:>8}")
+
+
+def bench_facet_counts():
+    """?facets=true at 1M recipes: counting every match against ANDs and popcounts of facet bitsets"""
+    size = 1_000_000
+    recipes = make_recipes(size)
+    index = FacetIndex()
+    for slot, recipe in enumerate(recipes):
+        index.add(slot, recipe)
+    matched = [slot for slot, recipe in enumerate(recipes) if "masala" in recipe.title.lower()]
+    print(f"{size} recipes; a search matching {len(matched)}: bitmask built in "
+          f"{timed(lambda: mask_of(matched), 3) / 1000:.1f} ms")
+    print(f"{'matches':>8} {'filter':>40} {'scan ms':>9} {'bitset ms':>10}")
+    for name, slots in (("all", range(size)), ("search", matched)):
+        mask = int(index.live) if name == "all" else mask_of(slots)
+        for filters in FACET_FILTERS:
+            label = f"{filters.category}/{filters.difficulty}/{filters.maxTime}"
+            scan_ms = timed(lambda: count_facets((recipes[slot] for slot in slots), filters), 1) / 1000
+            bitset_ms = timed(lambda: index.counts(mask, filters), 5) / 1000
+            print(f"{name:>8} {label:>40} {scan_ms:>9.1f} {bitset_ms:>10.2f}")
+
+
+def bench_sort():
+    """?sort= and the range filters at 1M recipes: presorted permutations against sorting and scanning"""
+    size = 1_000_000
+    recipes = make_recipes(size)
+    facets, index = FacetIndex(), SortIndex()
+    for slot, recipe in enumerate(recipes):
+        facets.add(slot, recipe)
+        index.add(slot, recipe)
+    ranges = [RecipeFilter(minRating=4.5), RecipeFilter(minServings=2, maxServings=4),
+              RecipeFilter(createdFrom=recipes[size // 2].createdAt, minRating=4.0)]
+    print(f"{'filter':>60} {'scan ms':>9} {'bitset ms':>10} {'hits':>8}")
+    for filters in ranges:
+        label = ",".join(f"{name}={value}" for name, value in filters.model_dump(exclude_defaults=True).items())
+        scan_ms = timed(lambda: [slot for slot, recipe in enumerate(recipes) if matches_ranges(recipe, filters)], 1)
+        mask_ms = timed(lambda: index.range_mask(filters), 3)
+        print(f"{label:>60} {scan_ms / 1000:>9.1f} {mask_ms / 1000:>10.2f} {index.range_mask(filters).bit_count():>8}")
+
+    print(f"{'sort':>8} {'filter':>40} {'sort ms':>9} {'walk ms':>9}")
+    for sort in SORT_KEYS:
+        for filters in FACET_FILTERS[:3]:
+            label = f"{filters.category}/{filters.difficulty}/{filters.maxTime}"
+            mask = facets.mask(filters)
+            sort_ms = timed(lambda: top_k([recipes[slot] for slot in iter_bits(mask)], 20, key=SORT_KEYS[sort]), 1)
+            walk_ms = timed(lambda: index.ordered(sort, mask, 20), 5)
+            print(f"{sort:>8} {label:>40} {sort_ms / 1000:>9.1f} {walk_ms / 1000:>9.3f}")
+
+
+def bench_columnar():
+    """Python scan against the NumPy columns for browse, ranking and /stats at 1M rows"""
+    size = 1_000_000
+    recipes = make_recipes(size)
+    columns = ColumnarIndex()
+    for slot, recipe in enumerate(recipes):
+        columns.add(slot, recipe)
+
+    print(f"{'filter':>40} {'scan ms':>9} {'columnar ms':>12} {'hits':>8}")
+    for filters in FACET_FILTERS:
+        label = f"{filters.category}/{filters.difficulty}/{filters.maxTime}"
+        scan_ms = timed(lambda: filter_recipes(recipes, filters), 1) / 1000
+        columnar_ms = timed(lambda: [recipes[slot] for slot in columns.mask(filters).nonzero()[0].tolist()], 5) / 1000
+        hits = int(columns.mask(filters).sum())
+        print(f"{label:>40} {scan_ms:>9.2f} {columnar_ms:>12.2f} {hits:>8}")
+
+    term = "masala"
+    matched = [slot for slot, recipe in enumerate(recipes) if term in recipe.title.lower()]
+    tiers = [relevance_tier(recipes[slot], term) for slot in matched]
+    sort_ms = timed(lambda: sorted((recipes[slot] for slot in matched),
+                                   key=lambda r: relevance_key(r, term), reverse=True), 3) / 1000
+    rank_ms = timed(lambda: columns.rank(matched, tiers), 3) / 1000
+    top_ms = timed(lambda: columns.rank(matched, tiers, 20), 3) / 1000
+    print(f"relevance sort of {len(matched)} hits: list.sort {sort_ms:.2f} ms, lexsort {rank_ms:.2f} ms, "
+          f"top 20 {top_ms:.2f} ms")
+
+    def copy_and_write():
+        clone = columns.copy()
+        clone.add(size // 2, recipes[0])
+    print(f"version copy + one write: {timed(copy_and_write, 20) / 1000:.3f} ms")
+
+    def scan_stats():
+        categories, difficulties = {}, {}
+        for recipe in recipes:
+            categories[recipe.category] = categories.get(recipe.category, 0) + 1
+            difficulties[recipe.difficulty] = difficulties.get(recipe.difficulty, 0) + 1
+        return sum(recipe.rating for recipe in recipes)
+    print(f"/stats aggregation: scan {timed(scan_stats, 1) / 1000:.2f} ms, "
+          f"bincount {timed(columns.stats, 5) / 1000:.2f} ms")
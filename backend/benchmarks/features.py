@@ -0,0 +1,86 @@
+"""Benchmarks of the recipe features: pantry matching, ingredient parsing, suggestions and similar recipes"""
+import random
+from typing import List
+
+from benchmarks.common import INGREDIENTS, build_store, make_recipes, timed
+from ingredients import parse_ingredient
+from main import get_search_suggestions
+from pantry import pantry_keys, scan_pantry
+from records import RecipeRecord
+from similarity import features, jaccard
+from suggestions import SuggestionIndex, scan_suggestions
+
+
+def bench_pantry():
+    """Pantry coverage search: the ingredient index against checking every line of every recipe"""
+    size = 100_000
+    recipes = make_recipes(size)
+    store = build_store(recipes)
+    rng = random.Random(0)
+    print(f"{size} recipes, top 20")
+    print(f"{'pantry':>7} {'complete':>9} {'hits':>7} {'scan ms':>8} {'index ms':>9}")
+    for pantry_size in (3, 10, 20):
+        keys = pantry_keys(rng.sample(INGREDIENTS, pantry_size))
+        for complete in (False, True):
+            total, hits = store.pantry(keys, complete, 20)
+            scanned = scan_pantry(recipes, keys, complete, 20)
+            assert total == scanned[0] and [hit.recipe.id for hit in hits] == [hit.recipe.id for hit in scanned[1]]
+            scan_ms = timed(lambda: scan_pantry(recipes, keys, complete, 20), 1) / 1000
+            index_ms = timed(lambda: store.pantry(keys, complete, 20), 10) / 1000
+            print(f"{pantry_size:>7} {str(complete):>9} {total:>7} {scan_ms:>8.1f} {index_ms:>9.2f}")
+
+
+def bench_ingredients():
+    """Parsing ingredient lines at write time, and suggestions served from the parsed names"""
+    size = 100_000
+    recipes = make_recipes(size)
+    lines = [line for recipe in recipes for line in recipe.ingredients]
+    distinct = list(set(lines))
+    parse_ingredient.cache_clear()
+    cold_us = timed(lambda: [parse_ingredient(line) for line in distinct], 1) / len(distinct)
+    warm_us = timed(lambda: [parse_ingredient(line) for line in lines], 1) / len(lines)
+    print(f"{len(lines)} lines, {len(distinct)} distinct: {cold_us:.1f} us to parse a new line, "
+          f"{warm_us:.2f} us for a repeated one")
+    records = [RecipeRecord.from_recipe(recipe) for recipe in recipes]
+    print(f"{'term':>10} {'suggestions ms':>15}")
+    for term in ["masala", "chick", "dal", "seed"]:
+        print(f"{term:>10} {timed(lambda: get_search_suggestions(term, records), 3) / 1000:>15.1f}")
+
+
+def bench_suggestions():
+    """/search/suggestions per keystroke: scanning every recipe's phrases against the prefix index"""
+    print(f"{'recipes':>10} {'build s':>8} {'term':>10} {'scan ms':>9} {'index ms':>9}")
+    for size in [10_000, 100_000, 1_000_000]:
+        records = [RecipeRecord.from_recipe(recipe) for recipe in make_recipes(size)]
+        index = SuggestionIndex()
+        build_s = timed(lambda: [index.add(slot, record) for slot, record in enumerate(records)], 1) / 1e6
+        for term in ["ch", "chick", "butter c", "garam", "12"]:
+            assert index.lookup(term, 10) == scan_suggestions(records, term, 10)
+            scan_ms = timed(lambda: scan_suggestions(records, term, 10), 1) / 1000
+            index_ms = timed(lambda: index.lookup(term, 10), 100) / 1000
+            print(f"{size:>10} {build_s:>8.1f} {term:>10} {scan_ms:>9.1f} {index_ms:>9.3f}")
+
+
+def bench_similar():
+    """/recipes/{id}/similar from MinHash LSH buckets: latency, and recall@10 against exact Jaccard"""
+    print(f"{'recipes':>10} {'exact ms':>9} {'lsh ms':>7} {'recall@10':>10}")
+    rng = random.Random(0)
+    for size in [10_000, 100_000]:
+        recipes = make_recipes(size)
+        store = build_store(recipes)
+        feature_sets = [features(recipe) for recipe in recipes]
+        queries = [rng.randrange(size) for _ in range(50)]
+
+        def exact(q: int) -> List[float]:
+            return sorted((jaccard(feature_sets[q], other) for i, other in enumerate(feature_sets) if i != q),
+                          reverse=True)[:10]
+        exact_ms = timed(lambda: exact(queries[0]), 1) / 1000
+        it = iter(queries * 10)
+        lsh_ms = timed(lambda: store.similar(recipes[next(it)], 10), len(queries) * 10) / 1000
+        found = 0
+        for q in queries:
+            # Ties at the 10th best exact score count as hits
+            cutoff = exact(q)[-1]
+            found += sum(jaccard(feature_sets[q], feature_sets[int(recipe.id)]) >= cutoff
+                         for _, recipe in store.similar(recipes[q], 10))
+        print(f"{size:>10} {exact_ms:>9.1f} {lsh_ms:>7.2f} {found / (10 * len(queries)):>10.2f}")
@@ -0,0 +1,240 @@
+"""Search benchmarks: candidate indexes, ranking, paging, the query syntax, fuzzy matching and highlighting"""
+import json
+import math
+from typing import List
+
+from benchmarks.common import (PARTIAL_SIZES, PARTIAL_TERMS, SEARCH_SIZES, SEARCH_TERMS, TRIGRAM_SIZES, build_store,
+                               make_recipes, timed)
+from highlight import scan_highlights
+from main import correct_search, filter_recipes, init_sample_data, search_recipes
+from models import RecipeFilter
+from query import compile_search
+from ranking import scan_statistics
+from records import to_recipe
+from search_index import TrigramIndex
+from spelling import MAX_DISTANCE, PREFIX_LENGTH, corrections, deletions, edit_distance, max_distance, spelling_words
+from store import RecipeStore
+from vectors import HybridScorer, VectorIndex, embed
+
+
+def bench_search():
+    """Indexed free-text search against a full scan of the same recipes"""
+    print(f"{'recipes':>10} {'term':>18} {'scan ms':>9} {'indexed ms':>11} {'hits':>7}")
+    for size in SEARCH_SIZES:
+        recipes = make_recipes(size)
+        store = build_store(recipes)
+        for term in SEARCH_TERMS:
+            filters = RecipeFilter(search=term)
+            repeat = max(1, 10_000 // size)
+            scan_ms = timed(lambda: filter_recipes(recipes, filters), repeat) / 1000
+            indexed_ms = timed(lambda: filter_recipes(store, filters), repeat) / 1000
+            hits = len(filter_recipes(store, filters))
+            print(f"{size:>10} {term:>18} {scan_ms:>9.2f} {indexed_ms:>11.2f} {hits:>7}")
+
+
+def bench_trigram():
+    """Partial-word candidate lookup in the trigram index, and what the index costs"""
+    for size in TRIGRAM_SIZES:
+        index = TrigramIndex()
+        for slot, recipe in enumerate(make_recipes(size)):
+            index.add(slot, recipe)
+        per_recipe = index.memory_bytes() / size
+        print(f"{size} recipes: trigram index {index.memory_bytes() / 2**20:.1f} MiB, "
+              f"{per_recipe:.0f} bytes/recipe")
+        for term in PARTIAL_TERMS:
+            lookup_us = timed(lambda: index.candidates(term), 100)
+            print(f"    {term:>10} {lookup_us / 1000:>8.3f} ms {index.candidates(term).bit_count():>7} candidates")
+
+
+def bench_partial():
+    """Partial-word searches for a page of 20: counting every match, and with count=False only the page"""
+    page = 20
+    print(f"{'recipes':>10} {'term':>10} {'hits':>7} {'counted ms':>11} {'uncounted ms':>13}")
+    for size in PARTIAL_SIZES:
+        store = build_store(make_recipes(size))
+        recipes = list(store)
+        for term in PARTIAL_TERMS + ["chick", "ch"]:
+            filters = RecipeFilter(search=term)
+            total, hits = search_recipes(store, filters, page)
+            assert hits == search_recipes(store, filters, page, count=False)[1]
+            assert hits == filter_recipes(recipes, filters)[:page]
+            counted_ms = timed(lambda: search_recipes(store, filters, page), 3) / 1000
+            uncounted_ms = timed(lambda: search_recipes(store, filters, page, count=False), 20) / 1000
+            print(f"{size:>10} {term:>10} {total:>7} {counted_ms:>11.2f} {uncounted_ms:>13.3f}")
+
+
+def graded_relevance(recipe, query: str) -> int:
+    """Judgment for the quality benchmark: how many fields are about each query word, title counting triple"""
+    gain = 0
+    for term in query.lower().split():
+        gain += 3 * (term in recipe.title.lower())
+        gain += any(term in tag.lower() for tag in recipe.tags)
+        gain += any(term in ingredient.lower() for ingredient in recipe.ingredients)
+        gain += term in recipe.description.lower()
+    return gain
+
+
+def ndcg(ranked: List, query: str, k: int = 10) -> float:
+    gains = [graded_relevance(recipe, query) for recipe in ranked]
+    ideal = sorted(gains, reverse=True)
+
+    def dcg(values):
+        return sum((2 ** gain - 1) / math.log2(i + 2) for i, gain in enumerate(values[:k]))
+    return dcg(gains) / dcg(ideal) if dcg(ideal) else 1.0
+
+
+def bench_bm25():
+    """Ranking quality (NDCG@10 on graded judgments) and latency of ?rank=bm25 against the default"""
+    size = 100_000
+    store = build_store(make_recipes(size))
+    queries = ["paneer", "chicken", "masala", "dosa", "rice", "spicy", "chicken curry", "dal"]
+    print(f"{size} recipes")
+    print(f"{'query':>15} {'hits':>7} {'NDCG default':>13} {'NDCG bm25':>10} {'default ms':>11} {'bm25 ms':>8}")
+    totals = [0.0, 0.0]
+    for query in queries:
+        default = RecipeFilter(search=query)
+        bm25 = RecipeFilter(search=query, rank="bm25")
+        hits = store.filter(default)
+        quality = [ndcg(hits, query), ndcg(store.filter(bm25), query)]
+        totals = [total + value for total, value in zip(totals, quality)]
+        default_ms = timed(lambda: store.filter(default), 3) / 1000
+        bm25_ms = timed(lambda: store.filter(bm25), 3) / 1000
+        print(f"{query:>15} {len(hits):>7} {quality[0]:>13.3f} {quality[1]:>10.3f} {default_ms:>11.1f} {bm25_ms:>8.1f}")
+    print(f"{'mean':>15} {'':>7} {totals[0] / len(queries):>13.3f} {totals[1] / len(queries):>10.3f}")
+
+
+def bench_paging():
+    """Ranking every match against selecting one page, and the JSON each response carries"""
+    size = 100_000
+    recipes = make_recipes(size)
+    store = build_store(recipes)
+    page = 20
+    print(f"{size} recipes, page of {page}")
+    print(f"{'query':>10} {'rank':>10} {'hits':>7} {'scan all ms':>12} {'scan page ms':>13} "
+          f"{'index all ms':>13} {'index page ms':>14} {'all KB':>8} {'page KB':>8}")
+    for query in ["chicken", "rice", "paneer"]:
+        for rank in ("relevance", "bm25"):
+            filters = RecipeFilter(search=query, rank=rank)
+            total, hits = search_recipes(store, filters, page)
+            assert hits == filter_recipes(store, filters)[:page]
+            times = [
+                timed(lambda: search_recipes(recipes, filters), 1) / 1000,
+                timed(lambda: search_recipes(recipes, filters, page), 1) / 1000,
+                timed(lambda: search_recipes(store, filters), 3) / 1000,
+                timed(lambda: search_recipes(store, filters, page), 3) / 1000,
+            ]
+            sizes = [
+                len(json.dumps([to_recipe(r).model_dump(mode="json") for r in results])) / 1024
+                for results in (filter_recipes(store, filters), hits)
+            ]
+            print(f"{query:>10} {rank:>10} {total:>7} " + " ".join(
+                f"{value:>{width}.1f}" for value, width in zip(times + sizes, (12, 13, 13, 14, 8, 8))))
+
+
+def bench_cursor():
+    """Deep pages by offset against keyset cursors, for browsing and for search"""
+    size = 100_000
+    store = build_store(make_recipes(size))
+    page = 20
+    print(f"{size} recipes, page of {page}")
+    print(f"{'query':>10} {'depth':>7} {'offset ms':>10} {'cursor ms':>10}")
+    for query in ["", "chicken"]:
+        filters = RecipeFilter(search=query)
+        ranked = filter_recipes(store, filters)
+        for depth in [0, 1_000, 10_000, len(ranked) - page]:
+            after = ranked[depth - 1].id if depth else None
+            _, by_offset = search_recipes(store, filters, depth + page)
+            _, by_cursor = search_recipes(store, filters, page, after)
+            assert by_offset[depth:] == by_cursor
+            offset_ms = timed(lambda: search_recipes(store, filters, depth + page), 3) / 1000
+            cursor_ms = timed(lambda: search_recipes(store, filters, page, after), 3) / 1000
+            print(f"{query or '(browse)':>10} {depth:>7} {offset_ms:>10.2f} {cursor_ms:>10.2f}")
+
+
+def bench_query():
+    """Structured queries through the store's indexes against checking every recipe"""
+    size = 100_000
+    recipes = make_recipes(size)
+    store = build_store(recipes)
+    queries = ["chicken curry", "paneer OR tofu", "chicken -spicy", '"butter chicken"',
+               "title:dal rice", "tag:vegetarian OR ingredient:paneer -cream"]
+    print(f"{size} recipes")
+    print(f"{'query':>42} {'hits':>7} {'scan ms':>8} {'index ms':>9}")
+    for query in queries:
+        filters = RecipeFilter(search=query, syntax="query")
+        total, hits = search_recipes(store, filters, 20)
+        scanned = search_recipes(recipes, filters, 20)
+        assert total == scanned[0] and [r.id for r in hits] == [r.id for r in scanned[1]]
+        scan_ms = timed(lambda: search_recipes(recipes, filters, 20), 1) / 1000
+        index_ms = timed(lambda: search_recipes(store, filters, 20), 3) / 1000
+        print(f"{query:>42} {total:>7} {scan_ms:>8.1f} {index_ms:>9.1f}")
+
+
+def bench_hybrid():
+    """?rank=hybrid: scoring every recipe vector with one product per matrix block, and what the matrix costs"""
+    queries = ["creamy curry", "spicy vegetarian dinner", "chicken"]
+    print(f"{'recipes':>10} {'matrix MB':>10} {'embed us':>9} {'query':>24} {'score ms':>9} {'search ms':>10}")
+    for size in [100_000, 1_000_000]:
+        recipes = make_recipes(size)
+        # The full store only at 100k; at 1M the matrix product is timed on its own
+        store = RecipeStore(vectors=True) if size <= 100_000 else None
+        index = store.vector_index if store is not None else VectorIndex()
+        for slot, recipe in enumerate(recipes):
+            if store is not None:
+                store.add(recipe)
+            else:
+                index.add(slot, recipe)
+        embed_us = timed(lambda: [embed(recipe) for recipe in recipes[:10_000]], 1) / 10_000
+        for query in queries:
+            filters = RecipeFilter(search=query, rank="hybrid")
+            count, frequencies, _ = scan_statistics(recipes, query)
+            scorer = HybridScorer(compile_search(filters), count, frequencies.__getitem__)
+            score_ms = timed(lambda: index.similarities(scorer.vector), 5) / 1000
+            search_ms = "-"
+            if store is not None:
+                search_ms = f"{timed(lambda: store.search(filters, 20), 3) / 1000:.1f}"
+            print(f"{size:>10} {index.memory_bytes() / 2**20:>10.0f} {embed_us:>9.1f} {query:>24} "
+                  f"{score_ms:>9.1f} {search_ms:>10}")
+    sample = RecipeStore(vectors=True)
+    init_sample_data(sample)
+    hits = sample.search(RecipeFilter(search="creamy curry", rank="hybrid"))[1]
+    print("sample catalog, creamy curry:", ", ".join(recipe.title for recipe in hits))
+
+
+def bench_fuzzy():
+    """?fuzzy=1 corrections: deletion-index probes against comparing every catalog word"""
+    size = 100_000
+    recipes = make_recipes(size)
+    store = build_store(recipes)
+    vocabulary = sorted({word for recipe in recipes for word in spelling_words(recipe)})
+    keys = {key for word in vocabulary for key in deletions(word[:PREFIX_LENGTH], MAX_DISTANCE)}
+    typos = ["biriyani", "panner", "dosaa", "chiken", "masla", "cardamon", "tandori", "samber"]
+    print(f"{size} recipes, {len(vocabulary)} words, {len(keys)} deletion keys")
+    print(f"{'word':>10} {'correction':>12} {'pairwise ms':>12} {'index ms':>9}")
+    for typo in typos:
+        limit = max_distance(typo)
+        pairwise_ms = timed(lambda: [word for word in vocabulary if edit_distance(typo, word, limit) <= limit], 3)
+        index_ms = timed(lambda: store.spelling([typo]), 20)
+        correction = corrections(store.spelling([typo])).get(typo)
+        print(f"{typo:>10} {str(correction):>12} {pairwise_ms / 1000:>12.2f} {index_ms / 1000:>9.3f}")
+    filters = RecipeFilter(search="chiken biriyani", fuzzy=True)
+    print(f"/recipes?search=chiken biriyani&fuzzy=1: {timed(lambda: correct_search(store, filters), 20) / 1000:.2f} ms "
+          f"to correct, {timed(lambda: search_recipes(store, correct_search(store, filters)[0], 20), 5) / 1000:.1f} ms "
+          f"with the search")
+
+
+def bench_highlight():
+    """?highlight=true: spans from stored token positions against tokenizing each result"""
+    size = 100_000
+    recipes = make_recipes(size)
+    store = build_store(recipes)
+    print(f"{size} recipes, positions {store.position_index.memory_bytes() / 2**20:.1f} MiB")
+    print(f"{'search':>28} {'syntax':>7} {'scan us':>8} {'index us':>9} {'spans':>6}")
+    for search, syntax in [("chicken", "literal"), ("butter chicken", "literal"), ("a", "literal"),
+                           ('paneer OR "garam masala"', "query"), ("title:dal -spicy", "query")]:
+        filters = RecipeFilter(search=search, syntax=syntax)
+        page = search_recipes(store, filters, 20)[1]
+        scan_us = timed(lambda: scan_highlights(page, compile_search(filters)), 20) / len(page)
+        index_us = timed(lambda: store.highlights(page, filters), 20) / len(page)
+        spans = sum(len(found) for result in store.highlights(page, filters) for found in result.values())
+        print(f"{search:>28} {syntax:>7} {scan_us:>8.1f} {index_us:>9.1f} {spans / len(page):>6.1f}")
@@ -0,0 +1,185 @@
+"""Storage benchmarks: lookups by id, SQLite, the write-ahead log and recovery, the mmap file and memory"""
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+from benchmarks.common import (FACET_FILTERS, PARTIAL_TERMS, SIZES, build_store, iter_recipe_fields, make_recipes,
+                               timed)
+from mmap_catalog import MmapRecipeStore, write_catalog
+from models import Recipe, RecipeFilter
+from persistence import CatalogPersistence, WriteAheadLog
+from records import RecipeRecord
+from sqlite_store import SQLiteRecipeStore
+from store import RecipeStore
+from versions import VersionedCatalog
+
+
+def bench_lookup():
+    """Get/update/delete/insert by id should stay flat as the catalog grows"""
+    print(f"{'recipes':>10} {'get us':>9} {'replace us':>11} {'remove+add us':>14}")
+    for size in SIZES:
+        store = build_store(make_recipes(size))
+
+        ids = [str(random.randrange(size)) for _ in range(1000)]
+        it = iter(ids * 10)
+        get_us = timed(lambda: store.get(next(it)), 10_000)
+
+        it = iter(ids * 10)
+        def replace():
+            recipe_id = next(it)
+            store.replace(recipe_id, store.get(recipe_id))
+        replace_us = timed(replace, 10_000)
+
+        it = iter(ids)
+        def churn():
+            recipe = store.remove(next(it))
+            store.add(recipe)
+        churn_us = timed(churn, 1000)
+
+        print(f"{size:>10} {get_us:>9.2f} {replace_us:>11.2f} {churn_us:>14.2f}")
+
+
+def bench_sqlite():
+    """SQLite + FTS5 store against the in-memory store on the same queries"""
+    size = 50_000
+    recipes = make_recipes(size)
+    memory = build_store(recipes)
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite = SQLiteRecipeStore(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        for recipe in recipes:
+            sqlite.add(recipe)
+        print(f"{size} recipes: sqlite load {time.perf_counter() - start:.1f} s")
+
+        queries = [RecipeFilter(search=term) for term in PARTIAL_TERMS + ["ma"]] + FACET_FILTERS[1:]
+        print(f"{'query':>40} {'memory ms':>10} {'sqlite ms':>10} {'hits':>7}")
+        for filters in queries:
+            label = filters.search or f"{filters.category}/{filters.difficulty}/{filters.maxTime}"
+            memory_ms = timed(lambda: memory.filter(filters), 3) / 1000
+            sqlite_ms = timed(lambda: sqlite.filter(filters), 3) / 1000
+            print(f"{label:>40} {memory_ms:>10.2f} {sqlite_ms:>10.2f} {len(sqlite.filter(filters)):>7}")
+        get_us = timed(lambda: sqlite.get(str(random.randrange(size))), 10_000)
+        print(f"get by id: {get_us:.1f} us")
+
+
+def bench_wal():
+    """Write throughput of the write-ahead log at different group-commit batch sizes"""
+    recipes = make_recipes(5_000)
+
+    async def write_all(wal: WriteAheadLog, writers: int) -> None:
+        wal.start()
+
+        async def writer(share: List[Recipe]) -> None:
+            for recipe in share:
+                wal.put(recipe)
+                await wal.commit()
+
+        await asyncio.gather(*(writer(recipes[i::writers]) for i in range(writers)))
+        await wal.stop()
+
+    print(f"{'batch size':>10} {'writers':>8} {'writes/s':>10}")
+    for batch_size in [1, 8, 64, 256]:
+        with tempfile.TemporaryDirectory() as tmp:
+            wal = WriteAheadLog(tmp, 0, batch_size=batch_size)
+            start = time.perf_counter()
+            asyncio.run(write_all(wal, writers=256))
+            elapsed = time.perf_counter() - start
+            wal.close()
+            print(f"{batch_size:>10} {256:>8} {len(recipes) / elapsed:>10.0f}")
+
+
+def bench_recovery():
+    """Startup from a snapshot: one bulk load() against an add() per recipe"""
+    print(f"{'recipes':>8} {'add ms/recipe':>14} {'recover ms/recipe':>18}")
+    for size in [20_000, 100_000]:
+        recipes = make_recipes(size)
+        start = time.perf_counter()
+        store = build_store(recipes)
+        added = (time.perf_counter() - start) / size * 1e3
+        with tempfile.TemporaryDirectory() as tmp:
+            # Snapshot the built store the way the server does, then recover it into an empty one
+            writer = CatalogPersistence(tmp, VersionedCatalog(store), snapshot_interval=None)
+            writer.recover()
+            asyncio.run(writer.snapshot())
+            writer.wal.close()
+            catalog = VersionedCatalog(RecipeStore())
+            persistence = CatalogPersistence(tmp, catalog, snapshot_interval=None)
+            start = time.perf_counter()
+            persistence.recover()
+            recovered = (time.perf_counter() - start) / size * 1e3
+            persistence.wal.close()
+        print(f"{size:>8} {added:>14.3f} {recovered:>18.3f}")
+
+
+def bench_mmap():
+    """Startup and read latency of the memory-mapped catalog against rebuilding Recipe objects"""
+    size = 1_000_000
+    recipes = make_recipes(size)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.bin")
+        start = time.perf_counter()
+        write_catalog(path, recipes)
+        print(f"{size} recipes: wrote {os.path.getsize(path) / 2**20:.0f} MiB "
+              f"in {time.perf_counter() - start:.1f} s")
+
+        open_ms = timed(lambda: MmapRecipeStore(path), 10) / 1000
+        store = MmapRecipeStore(path)
+        get_us = timed(lambda: store.get(str(random.randrange(size))), 10_000)
+        print(f"open (startup): {open_ms:.2f} ms, get by id: {get_us:.1f} us")
+
+        filters = RecipeFilter(category="Main Course", difficulty="Hard", maxTime=30)
+        browse_ms = timed(lambda: store.filter(filters), 1) / 1000
+        print(f"browse {filters.category}/{filters.difficulty}/{filters.maxTime}: "
+              f"{browse_ms:.0f} ms for {len(store.filter(filters))} hits")
+
+        sample = [recipe.model_dump_json() for recipe in recipes[:100_000]]
+        rebuild_s = timed(lambda: [Recipe.model_validate_json(line) for line in sample], 1) / 1e6
+        print(f"rebuilding Recipe objects instead: {rebuild_s * size / len(sample):.1f} s per {size} recipes")
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _measure_storage(size: int, kind: str, conn) -> None:
+    """Parse recipes like the API does; keep them as models, records, or a store (store+optional: every index)"""
+    gc.collect()
+    before = _rss_bytes()
+    kept = []
+    for fields in iter_recipe_fields(size):
+        recipe = Recipe.model_validate_json(json.dumps(fields, default=str))
+        kept.append(recipe if kind == "models" else RecipeRecord.from_recipe(recipe))
+    if kind.startswith("store"):
+        store = RecipeStore(vectors=kind == "store+optional")
+        store.load(kept)
+        if kind == "store+optional":
+            # What the first similar, fuzzy, highlight and hybrid requests build
+            store.similarity_index, store.spell_index, store.position_index, store.vector_index
+    gc.collect()
+    conn.send((_rss_bytes() - before) / size)
+
+
+def bench_memory():
+    """Resident bytes per stored recipe: pydantic models, compact records, and the indexed store holding them"""
+    # Each measurement runs in a fresh child so freed heap from the last one doesn't hide growth
+    context = multiprocessing.get_context("fork")
+    print(f"{'recipes':>10} {'Recipe B':>10} {'record B':>10} {'saved':>7} {'store B':>9} {'+optional B':>12}")
+    for size in [100_000, 1_000_000]:
+        kinds = ["models", "records"] + (["store", "store+optional"] if size <= 100_000 else [])
+        per_recipe = []
+        for kind in kinds:
+            receiver, sender = context.Pipe(duplex=False)
+            child = context.Process(target=_measure_storage, args=(size, kind, sender))
+            child.start()
+            per_recipe.append(receiver.recv())
+            child.join()
+        model, record = per_recipe[:2]
+        stores = [f"{per_recipe[i]:.0f}" if i < len(per_recipe) else "-" for i in (2, 3)]
+        print(f"{size:>10} {model:>10.0f} {record:>10.0f} {1 - record / model:>7.0%} {stores[0]:>9} {stores[1]:>12}")
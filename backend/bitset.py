@@ -0,0 +1,102 @@
+import re
+from typing import Iterator, List, Sequence
+
+from versions import CopyOnWriteList
+
+try:
+    import numpy as np
+except ImportError:  # mask_of sets bits one at a time
+    np = None
+
+_NONZERO_RUN = re.compile(rb"[^\x00]+")
+_BYTE_BITS: List[List[int]] = [[bit for bit in range(8) if byte >> bit & 1] for byte in range(256)]
+
+
+class Bitset:
+    """Mutable bitset over store slots.
+
+    Bits live in bytearray chunks of a CopyOnWriteList, so setting or
+    clearing one is O(1) and a copy shares the chunks it doesn't change. Set
+    algebra goes through int(bitset), which converts once and caches the
+    result until the next write.
+    """
+
+    __slots__ = ("_bytes", "_int", "_count")
+
+    def __init__(self):
+        self._bytes: CopyOnWriteList[int] = CopyOnWriteList(bytearray)
+        self._int = 0
+        self._count = 0
+
+    def copy(self) -> "Bitset":
+        clone = Bitset()
+        clone._bytes = self._bytes.copy()
+        clone._int = self._int
+        clone._count = self._count
+        return clone
+
+    @classmethod
+    def of(cls, slots: Sequence[int]) -> "Bitset":
+        """Bitset of the given slots, built in one pass rather than an add() each"""
+        bitset = cls()
+        mask = mask_of(slots)
+        bitset._bytes.extend(mask.to_bytes((mask.bit_length() + 7) >> 3, "little"))
+        bitset._int = mask
+        bitset._count = mask.bit_count()
+        return bitset
+
+    def add(self, slot: int) -> None:
+        byte, bit = slot >> 3, 1 << (slot & 7)
+        self._bytes.grow(byte + 1, 0)
+        value = self._bytes[byte]
+        if not value & bit:
+            self._bytes[byte] = value | bit
+            self._count += 1
+            self._int = None
+
+    def discard(self, slot: int) -> None:
+        byte, bit = slot >> 3, 1 << (slot & 7)
+        if byte < len(self._bytes) and self._bytes[byte] & bit:
+            self._bytes[byte] &= ~bit
+            self._count -= 1
+            self._int = None
+
+    def __int__(self) -> int:
+        if self._int is None:
+            self._int = int.from_bytes(b"".join(self._bytes.chunks()), "little")
+        return self._int
+
+    def __bool__(self) -> bool:
+        return self._count != 0
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def mask_of(slots: Sequence[int]) -> int:
+    """Bitmask with the given bit positions set"""
+    if not len(slots):
+        return 0
+    if np is not None:
+        slots = np.asarray(slots)
+        bits = np.zeros(int(slots.max()) + 1, dtype=bool)
+        bits[slots] = True
+        return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+    data = bytearray((max(slots) >> 3) + 1)
+    for slot in slots:
+        data[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(data, "little")
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    """Yield the set bit positions of mask in ascending order"""
+    if mask <= 0:
+        return
+    data = mask.to_bytes((mask.bit_length() + 7) >> 3, "little")
+    # Let the regex engine skip the zero bytes so sparse masks stay cheap
+    for run in _NONZERO_RUN.finditer(data):
+        base = run.start()
+        for offset, byte in enumerate(run.group()):
+            position = (base + offset) << 3
+            for bit in _BYTE_BITS[byte]:
+                yield position + bit
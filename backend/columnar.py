@@ -0,0 +1,229 @@
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the columnar catalog mode
+    np = None
+
+from filters import has_ranges, timestamp
+from models import Recipe, RecipeFilter
+
+
+class _Codes:
+    """Maps enum-like string values to small int codes and back"""
+
+    def __init__(self):
+        self.code: Dict[str, int] = {}
+        self.value: List[str] = []
+
+    def copy(self) -> "_Codes":
+        clone = _Codes()
+        clone.code = dict(self.code)
+        clone.value = list(self.value)
+        return clone
+
+    def encode(self, value: str) -> int:
+        code = self.code.get(value)
+        if code is None:
+            code = self.code[value] = len(self.value)
+            self.value.append(value)
+        return code
+
+
+class ColumnarIndex:
+    """Struct-of-arrays copy of the numeric and enum Recipe fields.
+
+    Columns are NumPy arrays indexed by store slot, so the facet filters, the
+    relevance sort and /stats run as vectorized masks, partitions and
+    bincount instead of per-recipe Python. Each column is kept in CHUNK-slot
+    chunks that copies share until one side writes to them, so a version
+    copy and each write after it touch O(n / CHUNK + CHUNK) values rather
+    than every column; the live column marks which slots hold a recipe.
+    Readers get each column as one array, joined once per version.
+    cookingTime and servings start out as int32 and widen (see _fit) when a
+    recipe holds a value past that, so any int the API accepts is kept.
+    """
+
+    CHUNK = 4096
+    COLUMNS = (("live", "bool"), ("cooking_time", "int32"), ("servings", "int32"), ("rating", "float64"),
+               ("created", "float64"), ("category", "int32"), ("difficulty", "int32"))
+    # The next dtype of an integer column that overflows; object holds Python ints
+    WIDER = {"int32": "int64", "int64": "object"}
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("The columnar catalog mode needs numpy (pip install numpy)")
+        self.size = 0
+        self.categories = _Codes()
+        self.difficulties = _Codes()
+        self._dtypes: Dict[str, str] = dict(self.COLUMNS)
+        self._chunks: Dict[str, List] = {name: [] for name, _ in self.COLUMNS}
+        # Chunks this side may change in place
+        self._owned: Set[int] = set()
+        # Joined columns of this version, dropped by every write
+        self._joined: Dict[str, object] = {}
+
+    def copy(self) -> "ColumnarIndex":
+        clone = ColumnarIndex.__new__(ColumnarIndex)
+        clone.size = self.size
+        clone.categories = self.categories.copy()
+        clone.difficulties = self.difficulties.copy()
+        clone._dtypes = dict(self._dtypes)
+        clone._chunks = {name: list(chunks) for name, chunks in self._chunks.items()}
+        clone._owned = set()
+        clone._joined = dict(self._joined)
+        # Everything is shared now, so this side must copy before writing too
+        self._owned = set()
+        return clone
+
+    def _writable(self, slot: int) -> Tuple[int, int]:
+        """(chunk, offset) of slot, its chunks made private to this side"""
+        chunk, offset = divmod(slot, self.CHUNK)
+        while len(self._chunks["live"]) <= chunk:
+            for name, dtype in self._dtypes.items():
+                self._chunks[name].append(np.zeros(self.CHUNK, dtype=dtype))
+            self._owned.add(len(self._chunks["live"]) - 1)
+        if chunk not in self._owned:
+            for chunks in self._chunks.values():
+                chunks[chunk] = chunks[chunk].copy()
+            self._owned.add(chunk)
+        self._joined = {}
+        return chunk, offset
+
+    def column(self, name: str):
+        """The first size slots of a column as one array; don't change it"""
+        joined = self._joined.get(name)
+        if joined is None:
+            chunks = self._chunks[name]
+            if len(chunks) == 1:
+                joined = chunks[0][:self.size]
+            elif chunks:
+                joined = np.concatenate(chunks)[:self.size]
+            else:
+                joined = np.zeros(0, dtype=self._dtypes[name])
+            self._joined[name] = joined
+        return joined
+
+    def _fit(self, name: str, value: int) -> None:
+        """Widen the integer column name until its dtype holds value; the wider chunks are private"""
+        dtype = self._dtypes[name]
+        while dtype != "object" and not np.iinfo(dtype).min <= value <= np.iinfo(dtype).max:
+            dtype = self.WIDER[dtype]
+        if dtype != self._dtypes[name]:
+            self._dtypes[name] = dtype
+            self._chunks[name] = [chunk.astype(dtype) for chunk in self._chunks[name]]
+            self._joined = {}
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        self._fit("cooking_time", recipe.cookingTime)
+        self._fit("servings", recipe.servings)
+        chunk, offset = self._writable(slot)
+        columns = self._chunks
+        columns["live"][chunk][offset] = True
+        columns["cooking_time"][chunk][offset] = recipe.cookingTime
+        columns["servings"][chunk][offset] = recipe.servings
+        columns["rating"][chunk][offset] = recipe.rating
+        columns["created"][chunk][offset] = timestamp(recipe.createdAt)
+        columns["category"][chunk][offset] = self.categories.encode(recipe.category)
+        columns["difficulty"][chunk][offset] = self.difficulties.encode(recipe.difficulty)
+        self.size = max(self.size, slot + 1)
+
+    def load(self, recipes: Sequence[Recipe]) -> None:
+        """Columns of recipes at slots 0, 1, ... of an empty index, built whole and cut into chunks"""
+        values = {
+            "live": [True] * len(recipes),
+            "cooking_time": [recipe.cookingTime for recipe in recipes],
+            "servings": [recipe.servings for recipe in recipes],
+            "rating": [recipe.rating for recipe in recipes],
+            "created": [timestamp(recipe.createdAt) for recipe in recipes],
+            "category": [self.categories.encode(recipe.category) for recipe in recipes],
+            "difficulty": [self.difficulties.encode(recipe.difficulty) for recipe in recipes],
+        }
+        for name in ("cooking_time", "servings"):
+            if recipes:
+                self._fit(name, min(values[name]))
+                self._fit(name, max(values[name]))
+        chunks = -(-len(recipes) // self.CHUNK)
+        for name, column in values.items():
+            padded = np.zeros(chunks * self.CHUNK, dtype=self._dtypes[name])
+            padded[:len(column)] = column
+            self._chunks[name] = list(padded.reshape(chunks, self.CHUNK))
+        self._owned = set(range(chunks))
+        self._joined = {}
+        self.size = len(recipes)
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        chunk, offset = self._writable(slot)
+        self._chunks["live"][chunk][offset] = False
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def mask(self, filters: RecipeFilter):
+        """Boolean array over slots passing the category, difficulty, maxTime and range filters"""
+        column = self.column
+        mask = column("live") & (column("cooking_time") <= filters.maxTime)
+        if filters.category != "All Categories":
+            code = self.categories.code.get(filters.category)
+            if code is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= column("category") == code
+        if filters.difficulty != "All":
+            code = self.difficulties.code.get(filters.difficulty)
+            if code is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= column("difficulty") == code
+        if has_ranges(filters):
+            if filters.minRating is not None:
+                mask &= column("rating") >= filters.minRating
+            if filters.minServings is not None:
+                mask &= column("servings") >= filters.minServings
+            if filters.maxServings is not None:
+                mask &= column("servings") <= filters.maxServings
+            if filters.createdFrom is not None:
+                mask &= column("created") >= timestamp(filters.createdFrom)
+            if filters.createdBefore is not None:
+                mask &= column("created") < timestamp(filters.createdBefore)
+        return mask
+
+    def rank(self, slots: Sequence[int], tiers: Sequence[int], limit: Optional[int] = None) -> List[int]:
+        """The first limit positions in slots by (tier, rating) descending, ties kept in input order.
+
+        With a limit only the candidates for it are sorted: np.partition
+        finds the limit-th tier and, within it, the limit-th rating, and
+        just the positions at or above those (ties included) are lexsorted.
+        """
+        tiers = -np.asarray(tiers, dtype=np.int64)
+        ratings = -self.column("rating")[np.asarray(slots, dtype=np.int64)]
+        positions = np.arange(len(tiers))
+        if limit is not None and limit < len(tiers):
+            if limit <= 0:
+                return []
+            tier = np.partition(tiers, limit - 1)[limit - 1]
+            above = tiers < tier
+            at = (tiers == tier).nonzero()[0]
+            wanted = limit - int(above.sum())
+            rating = np.partition(ratings[at], wanted - 1)[wanted - 1]
+            candidates = above
+            candidates[at[ratings[at] <= rating]] = True
+            positions = candidates.nonzero()[0]
+            tiers, ratings = tiers[positions], ratings[positions]
+        return positions[np.lexsort((ratings, tiers))][:limit].tolist()
+
+    def counts(self, codes, names: _Codes) -> Dict[str, int]:
+        """Count live slots per code, keyed by name in order of first appearance"""
+        live_codes = codes[self.column("live")]
+        if not len(live_codes):
+            return {}
+        counts = np.bincount(live_codes, minlength=len(names.value))
+        # There are only a handful of codes, so one argmax per code beats sorting
+        present = counts.nonzero()[0].tolist()
+        present.sort(key=lambda code: int(np.argmax(live_codes == code)))
+        return {names.value[code]: int(counts[code]) for code in present}
+
+    def stats(self) -> Dict:
+        return {
+            "categories": self.counts(self.column("category"), self.categories),
+            "difficulties": self.counts(self.column("difficulty"), self.difficulties),
+            "rating_sum": float(self.column("rating")[self.column("live")].sum()),
+        }
@@ -0,0 +1,189 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from typing import Dict, Iterable, List, Sequence
+
+from bitset import Bitset
+from models import Recipe, RecipeFilter
+from versions import CopyOnWriteMap
+
+# Upper bounds of the cookingTime buckets facet counts report; the last is open
+TIME_BUCKETS = (15, 30, 60, 120)
+TIME_BUCKET_LABELS = ("<=15", "16-30", "31-60", "61-120", ">120")
+# A maxTime every recipe the columns and SQLite can hold passes (int64)
+NO_TIME_LIMIT = 2 ** 63 - 1
+
+FacetCounts = Dict[str, Dict[str, int]]
+
+
+def time_bucket(minutes: int) -> str:
+    return TIME_BUCKET_LABELS[bisect_left(TIME_BUCKETS, minutes)]
+
+
+def unfaceted(filters: RecipeFilter) -> RecipeFilter:
+    """filters without their category, difficulty and maxTime restrictions"""
+    return filters.model_copy(update={"category": "All Categories", "difficulty": "All", "maxTime": NO_TIME_LIMIT})
+
+
+def _sorted_counts(counts: FacetCounts) -> FacetCounts:
+    """Values with matches only, categories and difficulties by name and time buckets in order"""
+    times = counts["cookingTime"]
+    return {
+        "categories": {value: n for value, n in sorted(counts["categories"].items()) if n},
+        "difficulties": {value: n for value, n in sorted(counts["difficulties"].items()) if n},
+        "cookingTime": {label: times[label] for label in TIME_BUCKET_LABELS if times.get(label)},
+    }
+
+
+def count_facets(matches: Iterable[Recipe], filters: RecipeFilter) -> FacetCounts:
+    """Facet counts by looking at each of matches, the search's hits for unfaceted(filters).
+
+    Each facet counts the matches passing the other two filters, so a count
+    is what choosing that value would return.
+    """
+    counts: FacetCounts = {"categories": {}, "difficulties": {}, "cookingTime": {}}
+    for recipe in matches:
+        in_category = filters.category == "All Categories" or recipe.category == filters.category
+        in_difficulty = filters.difficulty == "All" or recipe.difficulty == filters.difficulty
+        in_time = recipe.cookingTime <= filters.maxTime
+        if in_difficulty and in_time:
+            counts["categories"][recipe.category] = counts["categories"].get(recipe.category, 0) + 1
+        if in_category and in_time:
+            counts["difficulties"][recipe.difficulty] = counts["difficulties"].get(recipe.difficulty, 0) + 1
+        if in_category and in_difficulty:
+            bucket = time_bucket(recipe.cookingTime)
+            counts["cookingTime"][bucket] = counts["cookingTime"].get(bucket, 0) + 1
+    return _sorted_counts(counts)
+
+
+def merge_facets(results: Iterable[FacetCounts]) -> FacetCounts:
+    """Add up the facet counts of disjoint parts of a catalog"""
+    merged: FacetCounts = {"categories": {}, "difficulties": {}, "cookingTime": {}}
+    for result in results:
+        for facet, counts in result.items():
+            for value, n in counts.items():
+                merged[facet][value] = merged[facet].get(value, 0) + n
+    return _sorted_counts(merged)
+
+
+class FacetIndex:
+    """Per-value bitsets for the category, difficulty and cookingTime filters.
+
+    cookingTime keeps one bitset per distinct value plus the sorted list of
+    those values, so a maxTime filter is a bisect followed by OR-ing the
+    bitsets on the smaller side of the cut, and one bitset per TIME_BUCKETS
+    bucket for facet counts.
+    """
+
+    def __init__(self):
+        self.live = Bitset()
+        self.categories: CopyOnWriteMap[str, Bitset] = CopyOnWriteMap(Bitset, Bitset.copy)
+        self.difficulties: CopyOnWriteMap[str, Bitset] = CopyOnWriteMap(Bitset, Bitset.copy)
+        self._times: CopyOnWriteMap[int, Bitset] = CopyOnWriteMap(Bitset, Bitset.copy)
+        self._sorted_times: List[int] = []
+        self.time_buckets: CopyOnWriteMap[str, Bitset] = CopyOnWriteMap(Bitset, Bitset.copy)
+
+    def copy(self) -> "FacetIndex":
+        """Copy that shares the per-value bitsets until either side changes one"""
+        clone = FacetIndex()
+        clone.live = self.live.copy()
+        clone.categories = self.categories.copy()
+        clone.difficulties = self.difficulties.copy()
+        clone._times = self._times.copy()
+        clone._sorted_times = list(self._sorted_times)
+        clone.time_buckets = self.time_buckets.copy()
+        return clone
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        self.live.add(slot)
+        self.categories.writable(recipe.category).add(slot)
+        self.difficulties.writable(recipe.difficulty).add(slot)
+        if recipe.cookingTime not in self._times:
+            insort(self._sorted_times, recipe.cookingTime)
+        self._times.writable(recipe.cookingTime).add(slot)
+        self.time_buckets.writable(time_bucket(recipe.cookingTime)).add(slot)
+
+    def load(self, recipes: Sequence[Recipe]) -> None:
+        """Index recipes at slots 0, 1, ... of an empty index, one Bitset.of() per value"""
+        values: Dict[tuple, List[int]] = defaultdict(list)
+        for slot, recipe in enumerate(recipes):
+            values["category", recipe.category].append(slot)
+            values["difficulty", recipe.difficulty].append(slot)
+            values["time", recipe.cookingTime].append(slot)
+            values["bucket", time_bucket(recipe.cookingTime)].append(slot)
+        self.live = Bitset.of(range(len(recipes)))
+        bitsets = {"category": self.categories, "difficulty": self.difficulties, "time": self._times,
+                   "bucket": self.time_buckets}
+        for (facet, value), slots in values.items():
+            bitsets[facet][value] = Bitset.of(slots)
+        self._sorted_times = sorted(self._times)
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        self.live.discard(slot)
+        self._discard(self.categories, recipe.category, slot)
+        self._discard(self.difficulties, recipe.difficulty, slot)
+        if self._discard(self._times, recipe.cookingTime, slot):
+            self._sorted_times.remove(recipe.cookingTime)
+        self._discard(self.time_buckets, time_bucket(recipe.cookingTime), slot)
+
+    def clear(self) -> None:
+        self.__init__()
+
+    @staticmethod
+    def _discard(bitsets: CopyOnWriteMap, value, slot: int) -> bool:
+        """Clear slot in the bitset for value; True if that emptied it"""
+        if value not in bitsets:
+            return False
+        bitset = bitsets.writable(value)
+        bitset.discard(slot)
+        if not bitset:
+            bitsets.pop(value)
+            return True
+        return False
+
+    def time_mask(self, max_time: int) -> int:
+        """Bitmask of slots with cookingTime <= max_time"""
+        cut = bisect_right(self._sorted_times, max_time)
+        if cut == len(self._sorted_times):
+            return int(self.live)
+        if cut <= len(self._sorted_times) - cut:
+            return reduce(or_, (int(self._times[t]) for t in self._sorted_times[:cut]), 0)
+        slower = reduce(or_, (int(self._times[t]) for t in self._sorted_times[cut:]), 0)
+        return int(self.live) & ~slower
+
+    def mask(self, filters: RecipeFilter) -> int:
+        """Bitmask of slots passing the category, difficulty and maxTime filters"""
+        mask = self.time_mask(filters.maxTime)
+        if filters.category != "All Categories":
+            category = self.categories.get(filters.category)
+            mask &= int(category) if category is not None else 0
+        if filters.difficulty != "All":
+            difficulty = self.difficulties.get(filters.difficulty)
+            mask &= int(difficulty) if difficulty is not None else 0
+        return mask
+
+    def _value_mask(self, bitsets: CopyOnWriteMap, value: str, everything: str) -> int:
+        if value == everything:
+            return int(self.live)
+        bitset = bitsets.get(value)
+        return int(bitset) if bitset is not None else 0
+
+    def counts(self, matches: int, filters: RecipeFilter) -> FacetCounts:
+        """count_facets() of the slots in bitmask matches: an AND and a popcount per facet value"""
+        category = self._value_mask(self.categories, filters.category, "All Categories")
+        difficulty = self._value_mask(self.difficulties, filters.difficulty, "All")
+        time = self.time_mask(filters.maxTime)
+        others = matches & difficulty & time
+        counts: FacetCounts = {"categories": {
+            value: (others & int(bitset)).bit_count() for value, bitset in self.categories.items()
+        }}
+        others = matches & category & time
+        counts["difficulties"] = {
+            value: (others & int(bitset)).bit_count() for value, bitset in self.difficulties.items()
+        }
+        others = matches & category & difficulty
+        counts["cookingTime"] = {
+            label: (others & int(bitset)).bit_count() for label, bitset in self.time_buckets.items()
+        }
+        return _sorted_counts(counts)
@@ -0,0 +1,128 @@
+import heapq
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from models import Recipe, RecipeFilter
+
+# The filter semantics shared by the plain scan in main.filter_recipes and
+# the indexed paths in RecipeStore. search_term is always lowercased.
+
+# Results are ordered by a sort key descending, then by catalog position. A
+# cursor is the (sort key, position) of the last result a client has seen;
+# the next page is whatever orders after it.
+Cursor = Tuple[tuple, int]
+
+
+def timestamp(value: datetime) -> float:
+    """Seconds since the epoch of a createdAt; naive datetimes count as UTC, which main stamps recipes in"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+# Explicit sort orders (?sort=): a recipe's sort key, compared descending
+SORT_KEYS: Dict[str, Callable[[Recipe], tuple]] = {
+    "rating": lambda recipe: (recipe.rating,),
+    "time": lambda recipe: (-recipe.cookingTime,),
+    "newest": lambda recipe: (timestamp(recipe.createdAt),),
+}
+
+
+def matches_search(recipe: Recipe, search_term: str) -> bool:
+    if "\0" not in search_term:
+        # One lowercased string with the fields NUL-separated: a term without
+        # NUL can't match across two fields
+        return search_term in "\0".join((recipe.title, recipe.description, recipe.author,
+                                          *recipe.tags, *recipe.ingredients)).lower()
+    return (
+        search_term in recipe.title.lower() or
+        search_term in recipe.description.lower() or
+        search_term in recipe.author.lower() or
+        any(search_term in tag.lower() for tag in recipe.tags) or
+        any(search_term in ingredient.lower() for ingredient in recipe.ingredients)
+    )
+
+
+def matches_facets(recipe: Recipe, filters: RecipeFilter) -> bool:
+    # Category filter
+    matches_category = (
+        filters.category == "All Categories" or
+        recipe.category == filters.category
+    )
+
+    # Difficulty filter
+    matches_difficulty = (
+        filters.difficulty == "All" or
+        recipe.difficulty == filters.difficulty
+    )
+
+    # Time filter
+    matches_time = recipe.cookingTime <= filters.maxTime
+
+    return matches_category and matches_difficulty and matches_time and matches_ranges(recipe, filters)
+
+
+def has_ranges(filters: RecipeFilter) -> bool:
+    return (filters.minRating is not None or filters.minServings is not None or filters.maxServings is not None or
+            filters.createdFrom is not None or filters.createdBefore is not None)
+
+
+def matches_ranges(recipe: Recipe, filters: RecipeFilter) -> bool:
+    """The minRating, servings and createdAt range filters"""
+    if not has_ranges(filters):
+        return True
+    if filters.minRating is not None and recipe.rating < filters.minRating:
+        return False
+    if filters.minServings is not None and recipe.servings < filters.minServings:
+        return False
+    if filters.maxServings is not None and recipe.servings > filters.maxServings:
+        return False
+    if filters.createdFrom is not None or filters.createdBefore is not None:
+        created = timestamp(recipe.createdAt)
+        if filters.createdFrom is not None and created < timestamp(filters.createdFrom):
+            return False
+        if filters.createdBefore is not None and created >= timestamp(filters.createdBefore):
+            return False
+    return True
+
+
+def relevance_tier(recipe: Recipe, search_term: str) -> int:
+    """2 for a title hit, 1 for a tag hit, 0 otherwise"""
+    if search_term in recipe.title.lower():
+        return 2
+    if any(search_term in tag.lower() for tag in recipe.tags):
+        return 1
+    return 0
+
+
+def relevance_key(recipe: Recipe, search_term: str) -> Tuple[int, float]:
+    """Sort key for search results, used with reverse=True"""
+    return relevance_tier(recipe, search_term), recipe.rating
+
+
+def top_k(items: list, k: Optional[int], key: Callable) -> list:
+    """sorted(items, key=key, reverse=True)[:k], using a heap instead of a full sort when k is small"""
+    if k is None or k >= len(items):
+        return sorted(items, key=key, reverse=True)
+    # nlargest is stable too: equal keys keep their input order
+    return heapq.nlargest(k, items, key=key)
+
+
+def follows(key: tuple, position: int, cursor: Cursor) -> bool:
+    """Whether a result with this sort key and position orders after cursor"""
+    cursor_key, cursor_position = cursor
+    return key < cursor_key or (key == cursor_key and position > cursor_position)
+
+
+def index_cursor(cursor: Cursor, positions: Sequence[int]) -> Cursor:
+    """cursor with its catalog position turned into an index into matches at the sorted positions"""
+    key, position = cursor
+    return key, bisect_right(positions, position) - 1
+
+
+def after_cursor(items: list, key: Callable, cursor: Optional[Cursor]) -> list:
+    """The items, in catalog order, that order after cursor, whose position is an index into items"""
+    if cursor is None:
+        return items
+    return [item for index, item in enumerate(items) if follows(key(item), index, cursor)]
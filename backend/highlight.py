@@ -0,0 +1,157 @@
+"""Match spans for /recipes?highlight=true.
+
+Every word token of a recipe's searchable fields is stored with where it
+sits: the field, the tag or ingredient line within it, and its character
+offset. A search term is located on those tokens rather than on the text: a
+one-word term inside any token ("chick" in "chickpeas"), a longer one on a
+run of consecutive tokens of the same line whose first token ends with the
+term's first word, whose middle tokens are its middle words and whose last
+token starts with its last word ("ken tik" in "Chicken Tikka"). That mirrors
+the substring match of both the literal and the query syntax, and a result
+costs one pass over its own tokens, stopped after MAX_SPANS spans.
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from models import Recipe
+from query import SearchQuery, positive_terms
+from search_index import TOKEN_RE, tokenize
+from versions import CopyOnWriteList
+
+FIELDS = ("title", "description", "author", "tags", "ingredients")
+# Most spans reported per recipe
+MAX_SPANS = 32
+# A place packs the field (3 bits) and line (13 bits) over a 16-bit offset;
+# tokens past these limits are stored nowhere and never highlighted
+MAX_LINES = 1 << 13
+MAX_OFFSET = 1 << 16
+
+# (token, field, line, offset)
+Occurrence = Tuple[str, int, int, int]
+# (line, start, end): end is exclusive, line is 0 outside tags and ingredients
+Span = Tuple[int, int, int]
+
+
+def field_lines(recipe: Recipe) -> List[Sequence[str]]:
+    """The lines of each of FIELDS"""
+    return [(recipe.title,), (recipe.description,), (recipe.author,), recipe.tags, recipe.ingredients]
+
+
+def occurrences(recipe: Recipe) -> Iterator[Occurrence]:
+    """Every storable word token of the recipe, in field and text order"""
+    for field, lines in enumerate(field_lines(recipe)):
+        for line, text in enumerate(lines[:MAX_LINES]):
+            for match in TOKEN_RE.finditer(text.lower()):
+                if match.start() >= MAX_OFFSET:
+                    break
+                yield match.group(), field, line, match.start()
+
+
+def _spans(found: List[Tuple[int, int, int, int]]) -> Dict[str, List[Span]]:
+    """(field, line, start, end) matches merged where they overlap, grouped by field name"""
+    grouped: Dict[str, List[Span]] = {}
+    last = None
+    for field, line, start, end in sorted(found):
+        if last is not None and last[:2] == (field, line) and start <= last[3]:
+            last[3] = max(last[3], end)
+            continue
+        last = [field, line, start, end]
+        grouped.setdefault(FIELDS[field], []).append(last)
+    return {name: [(line, start, end) for _, line, start, end in spans] for name, spans in grouped.items()}
+
+
+def highlight(tokens: Sequence[Occurrence], query: Optional[SearchQuery]) -> Dict[str, List[Span]]:
+    """Spans of a recipe's tokens matching the positive terms of query, per field name"""
+    if query is None:
+        return {}
+    found = []
+    for term in dict.fromkeys(positive_terms(query.plan)):
+        words = tokenize(term.text)
+        if not words:
+            continue
+        fields = range(len(FIELDS)) if term.field is None else (FIELDS.index(term.field),)
+        first, last, middle = words[0], words[-1], words[1:-1]
+        for i, (token, field, line, offset) in enumerate(tokens):
+            if field not in fields:
+                continue
+            if len(words) == 1:
+                at = token.find(first)
+                while at >= 0 and len(found) < MAX_SPANS:
+                    found.append((field, line, offset + at, offset + at + len(first)))
+                    at = token.find(first, at + 1)
+            elif token.endswith(first) and i + len(words) <= len(tokens):
+                run = tokens[i + 1:i + len(words)]
+                if (all(other[1:3] == (field, line) for other in run)
+                        and [other[0] for other in run[:-1]] == middle and run[-1][0].startswith(last)):
+                    found.append((field, line, offset + len(token) - len(first), run[-1][3] + len(last)))
+            if len(found) >= MAX_SPANS:
+                return _spans(found)
+    return _spans(found)
+
+
+def scan_highlights(recipes: Iterable[Recipe], query: Optional[SearchQuery]) -> List[Dict[str, List[Span]]]:
+    """Store.highlights() for stores without a position index: tokenizes each recipe"""
+    return [highlight(list(occurrences(recipe)), query) for recipe in recipes]
+
+
+class PositionIndex:
+    """Every slot's token occurrences, for highlighting.
+
+    A slot holds a uint32 array of (token id, place) pairs, the place packing
+    field, line and offset. Token ids point into a vocabulary that only ever
+    grows, shared by every catalog version like the spelling index; a version
+    copy shares the slot arrays, which are never changed once stored.
+    """
+
+    def __init__(self):
+        self._slots: CopyOnWriteList[Optional[array]] = CopyOnWriteList()
+        self._ids: Dict[str, int] = {}
+        self._tokens: List[str] = []
+
+    def copy(self) -> "PositionIndex":
+        clone = PositionIndex.__new__(PositionIndex)
+        clone._slots = self._slots.copy()
+        clone._ids = self._ids
+        clone._tokens = self._tokens
+        return clone
+
+    def _id(self, token: str) -> int:
+        token_id = self._ids.get(token)
+        if token_id is None:
+            # Appended before it is published, so readers never see a missing id
+            self._tokens.append(token)
+            token_id = self._ids[token] = len(self._tokens) - 1
+        return token_id
+
+    def _packed(self, recipe: Recipe) -> array:
+        packed = array("I")
+        for token, field, line, offset in occurrences(recipe):
+            packed.append(self._id(token))
+            packed.append((line << 3 | field) << 16 | offset)
+        return packed
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        packed = self._packed(recipe)
+        self._slots.grow(slot + 1, None)
+        self._slots[slot] = packed
+
+    def load(self, recipes: Sequence[Recipe]) -> None:
+        """Index recipes at slots 0, 1, ... of an empty index in bulk; None is a hole"""
+        self._slots.extend([None if recipe is None else self._packed(recipe) for recipe in recipes])
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        self._slots[slot] = None
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def occurrences(self, slot: int) -> List[Occurrence]:
+        packed = self._slots[slot]
+        tokens = self._tokens
+        return [
+            (tokens[packed[i]], packed[i + 1] >> 16 & 7, packed[i + 1] >> 19, packed[i + 1] & 0xFFFF)
+            for i in range(0, len(packed), 2)
+        ]
+
+    def memory_bytes(self) -> int:
+        return sum(packed.itemsize * len(packed) for packed in self._slots if packed is not None)
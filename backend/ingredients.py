@@ -0,0 +1,139 @@
+"""Ingredient lines parsed into amount, unit, name and preparation note.
+
+Recipes list ingredients as free text ("1 kg chicken, cut into pieces",
+"½ cup heavy cream", "4-5 green chilies", "Salt to taste"). Lines are parsed
+once when a recipe is written (RecipeRecord keeps the result) and the parse
+of each distinct line is cached, so suggestions, pantry search and the
+ingredient index work on names instead of re-splitting the text.
+"""
+import re
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+_FRACTIONS = {"½": 0.5, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 0.25, "¾": 0.75, "⅛": 0.125,
+              "⅜": 0.375, "⅝": 0.625, "⅞": 0.875, "⅕": 0.2, "⅙": 1 / 6}
+_NUMBER = r"(?:\d+/\d+|\d+(?:\.\d+)?(?:\s*[{0}]|\s+\d+/\d+)?|[{0}])".format("".join(_FRACTIONS))
+# An amount or a range of them at the start of the line: "1", "1 1/2", "1½", "4-5", "2 to 3"
+_AMOUNT_RE = re.compile(rf"^\s*(?:(a|an)\s+|({_NUMBER})(?:\s*(?:-|–|to)\s*({_NUMBER}))?\s*)", re.IGNORECASE)
+_PARENTHESES_RE = re.compile(r"\s*\(([^)]*)\)?")
+# Trailing notes that aren't part of the name: "to taste", "as needed", "for frying"
+_NOTE_RE = re.compile(r"\s+((?:to taste|as|for)\b.*)", re.IGNORECASE)
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+UNITS = {
+    "cup": "cup", "cups": "cup", "c": "cup",
+    "tbsp": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp", "tbs": "tbsp",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "kg": "kg", "kgs": "kg", "kilogram": "kg", "kilograms": "kg",
+    "g": "g", "gm": "g", "gms": "g", "gram": "g", "grams": "g", "mg": "mg",
+    "l": "l", "litre": "l", "litres": "l", "liter": "l", "liters": "l", "ml": "ml",
+    "oz": "oz", "ounce": "oz", "ounces": "oz", "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "pinch": "pinch", "pinches": "pinch", "dash": "dash", "handful": "handful", "handfuls": "handful",
+    "piece": "piece", "pieces": "piece", "clove": "clove", "cloves": "clove",
+    "inch": "inch", "inches": "inch", "bunch": "bunch", "bunches": "bunch",
+    "can": "can", "cans": "can", "sprig": "sprig", "sprigs": "sprig", "stalk": "stalk", "stalks": "stalk",
+}
+_UNIT_RE = re.compile(r"^({})\b\.?\s*(?:of\s+)?".format("|".join(sorted(UNITS, key=len, reverse=True))),
+                      re.IGNORECASE)
+_BARE_UNITS = {"pinch", "dash", "handful"}
+# Words that start a preparation note when the name has no comma before it
+PREPARATIONS = {
+    "chopped", "sliced", "diced", "minced", "grated", "crushed", "cubed", "peeled", "boiled",
+    "soaked", "beaten", "melted", "mashed", "shredded", "julienned", "halved", "roasted", "deseeded",
+}
+
+
+class Ingredient(NamedTuple):
+    quantity: Optional[float]  # None for "to taste" and the like
+    quantity_max: Optional[float]  # upper end of a range ("4-5"), else None
+    unit: Optional[str]  # canonical unit ("cup", "tbsp", "g"), else None
+    name: str  # as written, minus amount, unit and note: "heavy cream"
+    note: Optional[str]  # preparation or serving note: "cut into pieces"
+
+
+def _number(text: Optional[str]) -> Optional[float]:
+    if text is None:
+        return None
+    total = 0.0
+    for part in text.split():
+        if part in _FRACTIONS:
+            total += _FRACTIONS[part]
+        elif part[-1] in _FRACTIONS:
+            total += float(part[:-1]) + _FRACTIONS[part[-1]]
+        elif "/" in part:
+            numerator, denominator = part.split("/")
+            total += int(numerator) / int(denominator) if int(denominator) else 0.0
+        else:
+            total += float(part)
+    return total
+
+
+@lru_cache(maxsize=65536)
+def parse_ingredient(text: str) -> Ingredient:
+    """Split one ingredient line; unparseable lines come back as a bare name"""
+    notes = [note.strip() for note in _PARENTHESES_RE.findall(text)]
+    rest = _PARENTHESES_RE.sub("", text).strip()
+    rest, _, comma_note = rest.partition(",")
+
+    quantity = quantity_max = None
+    amount = _AMOUNT_RE.match(rest)
+    if amount and amount.end():
+        article, low, high = amount.groups()
+        quantity = 1.0 if article else _number(low)
+        quantity_max = _number(high)
+        rest = rest[amount.end():]
+
+    unit = None
+    match = _UNIT_RE.match(rest)
+    # Without an amount only a few units read as one: "Pinch of salt", but "Cup noodles"
+    if match and rest[match.end():].strip() and (quantity is not None or UNITS[match.group(1).lower()] in _BARE_UNITS):
+        unit = UNITS[match.group(1).lower()]
+        rest = rest[match.end():]
+
+    trailing = _NOTE_RE.search(rest)
+    if trailing:
+        notes.insert(0, trailing.group(1))
+        rest = rest[:trailing.start()]
+    words = rest.split()
+    for i, word in enumerate(words):
+        if i and word.lower() in PREPARATIONS:
+            notes.insert(0, " ".join(words[i:]))
+            words = words[:i]
+            break
+    if comma_note.strip():
+        notes.append(comma_note.strip())
+    name = " ".join(words)
+    return Ingredient(quantity, quantity_max, unit, name, "; ".join(notes) or None)
+
+
+def parse_ingredients(lines: Sequence[str]) -> Tuple[Ingredient, ...]:
+    return tuple(map(parse_ingredient, lines))
+
+
+def parsed_ingredients(recipe) -> Tuple[Ingredient, ...]:
+    """The parsed ingredient lines of any recipe a store hands out"""
+    parsed = getattr(recipe, "parsed_ingredients", None)
+    return parsed if parsed is not None else parse_ingredients(recipe.ingredients)
+
+
+def _singular(word: str) -> str:
+    """Crude plural folding, applied the same way to pantry items and recipe lines"""
+    if word.endswith(("oes", "ies")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def name_words(name: str) -> Tuple[str, ...]:
+    """Matching form of an ingredient name: lowercased words, plurals folded"""
+    return tuple(_singular(word) for word in _WORD_RE.findall(name.lower()))
+
+
+def ingredient_words(text: str) -> List[str]:
+    """Matching words of an ingredient line's name.
+
+    "1 kg chicken, cut into pieces" -> ["chicken"], "2 Tomatoes" -> ["tomato"]
+    """
+    return list(name_words(parse_ingredient(text).name))
@@ -1,20 +1,56 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Tuple, Union
 import uvicorn
-from datetime import datetime
+from datetime import datetime, timezone
+import base64
+import binascii
 import json
+import os
 import re
 from difflib import SequenceMatcher
 from typing import Set
 import asyncio
+from contextlib import asynccontextmanager
+
+from facet_index import FacetCounts, count_facets, unfaceted
+from filters import SORT_KEYS, after_cursor, index_cursor, matches_facets, top_k
+from highlight import Span, scan_highlights
+from ingredients import parsed_ingredients
+from mmap_catalog import MmapRecipeStore
+from models import (HighlightedRecipe, MatchSpan, PantryMatch, ParsedIngredient, Recipe, RecipeFilter, SearchSuggestion,
+                    SimilarRecipe)
+from pantry import covers, pantry_keys
+from persistence import CatalogPersistence
+from query import compile_search
+from ranking import rank_bm25, scan_bm25, sort_key
+from records import to_recipe
+from result_cache import ResultCache
+from shards import ShardPool, ShardedRecipeStore
+from spelling import apply_corrections, corrections, scan_spelling, search_words
+from sqlite_store import SQLiteRecipeStore, sqlite_path
+from store import RecipeStore
+from suggestions import SuggestionIndex, scan_suggestions
+from vectors import HYBRID_AVAILABLE, rank_hybrid, scan_hybrid
+from versions import CatalogVersion, VersionedCatalog
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Group-commit flusher and periodic snapshots for the write-ahead log
+    if persistence is not None:
+        persistence.start()
+    yield
+    if persistence is not None:
+        await persistence.stop()
+    if shard_pool is not None:
+        shard_pool.shutdown()
 
 app = FastAPI(
     title="Recipe Search API",
     description="Real-time recipe search and management API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware to allow frontend requests
@@ -24,37 +60,112 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Catalog-Version", "X-Total-Count", "X-Next-Cursor", "X-Search-Corrections", "X-Facet-Counts"],
 )
 
-# Pydantic models
-class Recipe(BaseModel):
-    id: str
-    title: str
-    description: str
-    image: str
-    category: str
-    difficulty: str
-    cookingTime: int
-    servings: int
-    ingredients: List[str]
-    instructions: List[str]
-    tags: List[str]
-    rating: float
-    author: str
-    createdAt: datetime
-    isFavorite: Optional[bool] = False
-
-class RecipeFilter(BaseModel):
-    search: Optional[str] = ""
-    category: Optional[str] = "All Categories"
-    difficulty: Optional[str] = "All"
-    maxTime: Optional[int] = 180
-
-class SearchSuggestion(BaseModel):
-    suggestions: List[str]
-
-# In-memory database (replace with actual database in production)
-recipes_db: List[Recipe] = []
+# Storage backend: "memory" (default), "sqlite", which persists recipes to
+# DATABASE_URL and searches through an FTS5 table, or "mmap", which serves a
+# binary catalog file (see mmap_catalog.py) with writes kept in memory and, with
+# RECIPE_DATA_DIR set, in a write-ahead log replayed over the file on startup
+STORAGE_BACKEND = os.getenv("RECIPE_STORAGE", "memory")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./recipes.db")
+CATALOG_FILE = os.getenv("RECIPE_CATALOG_FILE", "catalog.bin")
+
+# Catalog mode: "columnar" adds NumPy column arrays for vectorized filtering,
+# ranking and stats on big catalogs (needs numpy)
+CATALOG_MODE = os.getenv("RECIPE_CATALOG_MODE", "default")
+
+# Number of worker processes the in-memory catalog is partitioned across;
+# queries are fanned out to all of them. 1 keeps everything in this process
+SHARDS = int(os.getenv("RECIPE_SHARDS", "1"))
+shard_pool = None
+
+# ?rank=hybrid scores searches against a float32 matrix of recipe vectors kept
+# up to date on write (vectors.DIMENSIONS * 4 bytes per recipe, needs numpy);
+# "off" saves the memory and embeds every recipe on each hybrid search instead
+VECTOR_INDEX = os.getenv("RECIPE_VECTOR_INDEX", "on") == "on" and HYBRID_AVAILABLE
+
+# Stores that answer searches, suggestions, corrections, facets and highlights
+# from their own indexes; the helpers below scan any other iterable of recipes
+INDEXED_STORES = (RecipeStore, SQLiteRecipeStore, MmapRecipeStore, ShardedRecipeStore)
+
+def create_store():
+    """Build the recipe store selected by the environment"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteRecipeStore(sqlite_path(DATABASE_URL))
+    if STORAGE_BACKEND == "mmap":
+        if not os.path.exists(CATALOG_FILE):
+            raise RuntimeError(f"RECIPE_STORAGE=mmap serves {CATALOG_FILE}, which does not exist; "
+                               f"build it with: python mmap_catalog.py {CATALOG_FILE}")
+        return MmapRecipeStore(CATALOG_FILE)
+    if STORAGE_BACKEND != "memory":
+        raise ValueError(f"Unknown RECIPE_STORAGE: {STORAGE_BACKEND}")
+    if SHARDS > 1:
+        global shard_pool
+        shard_pool = ShardPool(SHARDS, columnar=CATALOG_MODE == "columnar", vectors=VECTOR_INDEX)
+        return ShardedRecipeStore(shard_pool)
+    return RecipeStore(columnar=CATALOG_MODE == "columnar", vectors=VECTOR_INDEX)
+
+async def run_store(fn, *args):
+    """fn(*args), run in a worker thread when the store waits on shard processes so the event loop doesn't"""
+    if shard_pool is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+# Every request reads one immutable catalog version; writes publish a new one
+catalog = VersionedCatalog(create_store())
+VERSION_HEADER = "X-Catalog-Version"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+CORRECTIONS_HEADER = "X-Search-Corrections"
+FACETS_HEADER = "X-Facet-Counts"
+
+# Result id lists of popular filters, patched by every write below
+result_cache = ResultCache(catalog)
+
+def read_catalog(response: Response) -> CatalogVersion:
+    """Pin the current catalog version for a request and report its number"""
+    version = catalog.current()
+    response.headers[VERSION_HEADER] = str(version.number)
+    return version
+
+# Directory for the write-ahead log and snapshots that let the in-memory store
+# survive restarts; unset keeps the catalog in memory only. The mmap store logs
+# its writes there too, without snapshots: its catalog file is the base
+DATA_DIR = os.getenv("RECIPE_DATA_DIR")
+WAL_BATCH_SIZE = int(os.getenv("RECIPE_WAL_BATCH_SIZE", "64"))
+persistence = (
+    CatalogPersistence(DATA_DIR, catalog, batch_size=WAL_BATCH_SIZE,
+                       snapshot_interval=None if STORAGE_BACKEND == "mmap" else 60.0)
+    if DATA_DIR and STORAGE_BACKEND in ("memory", "mmap") else None
+)
+
+def log_put(recipe: Recipe):
+    """Append a create/update to the write-ahead log, if there is one"""
+    if persistence is not None:
+        persistence.wal.put(recipe)
+
+def log_delete(recipe_id: str):
+    if persistence is not None:
+        persistence.wal.delete(recipe_id)
+
+async def commit_log():
+    """Wait until the logged writes are durable; writers publish their version only then"""
+    if persistence is not None:
+        await persistence.wal.commit()
+
+async def publish_durable(version: CatalogVersion):
+    """Publish a written version once its log records are durable, or discard it if they can't be made so"""
+    try:
+        await commit_log()
+    except Exception:
+        catalog.discard(version)
+        raise HTTPException(status_code=503, detail="Could not persist the change")
+    try:
+        catalog.publish(version)
+    except ValueError:
+        # An earlier unpublished write it built on failed to persist
+        raise HTTPException(status_code=503, detail="Could not persist the change")
 global_recipe_database = [
     # Breads & Rice
     'Naan', 'Roti', 'Chapati', 'Aloo Paratha', 'Paneer Paratha', 'Methi Paratha', 'Puri',
@@ -97,60 +208,40 @@ global_recipe_database = [
     'Pizza', 'Pasta', 'Burger', 'Sandwich', 'Fried Chicken', 'Curry', 'Noodles'
 ]
 
+# The dish list never changes, so its prefix index is built once
+dish_index = SuggestionIndex()
+for position, dish in enumerate(global_recipe_database):
+    dish_index.add_phrase(position, dish)
+
+# Catalog phrases ranked per suggestion request, alongside the matching dishes
+SUGGESTION_CANDIDATES = 10
+
 def calculate_similarity(text1: str, text2: str) -> float:
     """Calculate similarity between two strings"""
     return SequenceMatcher(None, text1.lower(), text2.lower()).ratio()
 
-def get_search_suggestions(search_term: str, recipes: List[Recipe]) -> List[str]:
-    """Generate smart search suggestions with enhanced fuzzy matching"""
+def get_search_suggestions(search_term: str, recipes: Iterable[Recipe]) -> List[str]:
+    """Generate smart search suggestions with enhanced fuzzy matching.
+
+    Candidates come from prefix indexes (see suggestions.py), so a keystroke
+    costs a few binary searches rather than a pass over the catalog.
+    """
     if not search_term or len(search_term) < 2:
         return []
     
     search_term_lower = search_term.lower()
-    suggestions = set()
     
-    # 1. Add exact matches from current recipes
-    for recipe in recipes:
-        # Title matches
-        if search_term_lower in recipe.title.lower():
-            suggestions.add(recipe.title)
-        
-        # Tag matches
-        for tag in recipe.tags:
-            if search_term_lower in tag.lower():
-                suggestions.add(tag)
-        
-        # Ingredient matches (only main ingredients)
-        for ingredient in recipe.ingredients[:5]:  # First 5 ingredients only
-            ingredient_lower = ingredient.lower()
-            if search_term_lower in ingredient_lower:
-                # Extract the main ingredient name (first 2-3 words)
-                main_ingredient = ' '.join(ingredient.split()[:3])
-                suggestions.add(main_ingredient)
+    # 1. Titles, tags and main ingredient names (parsed at write time) starting with the term or with a word that does
+    if isinstance(recipes, INDEXED_STORES):
+        suggestions = set(recipes.suggestions(search_term, SUGGESTION_CANDIDATES))
+    else:
+        suggestions = set(scan_suggestions(recipes, search_term, SUGGESTION_CANDIDATES))
     
-    # 2. Add suggestions from global database with enhanced matching
-    for recipe_name in global_recipe_database:
-        recipe_lower = recipe_name.lower()
-        
-        # Exact substring match
-        if search_term_lower in recipe_lower:
-            suggestions.add(recipe_name)
-            continue
-        
-        # Word-based matching
-        search_words = search_term_lower.split()
-        recipe_words = recipe_lower.split()
-        
-        # Check if any search word matches any recipe word
-        for search_word in search_words:
-            for recipe_word in recipe_words:
-                if (search_word in recipe_word or recipe_word in search_word or
-                    search_word.startswith(recipe_word[:3]) or recipe_word.startswith(search_word[:3])):
-                    suggestions.add(recipe_name)
-                    break
-            else:
-                continue
-            break
+    # 2. Add suggestions from global database: dishes with a word starting with the term,
+    # or with the first three letters of any search word
+    suggestions.update(dish_index.lookup(search_term))
+    for search_word in search_term_lower.split():
+        suggestions.update(dish_index.lookup(search_word[:3]))
     
     # 3. Add fuzzy matches for short suggestions list
     if len(suggestions) < 6:
@@ -159,73 +250,137 @@ def get_search_suggestions(search_term: str, recipes: List[Recipe]) -> List[str]
             if similarity > 0.4:  # Lower threshold for better suggestions
                 suggestions.add(recipe_name)
     
-    # 4. Convert to list and sort by relevance
-    suggestion_list = list(suggestions)[:10]  # Limit to 10 suggestions
-    
-    # Sort by relevance: exact matches first, then by similarity
-    suggestion_list.sort(key=lambda x: (
+    # 4. Sort by relevance: exact matches first, then by similarity
+    suggestion_list = sorted(suggestions, key=lambda x: (
         # Exact matches first
         0 if search_term_lower in x.lower() else 1,
         # Then by starts with
         0 if x.lower().startswith(search_term_lower) else 1,
         # Then by similarity score (descending)
         -calculate_similarity(search_term, x),
-        # Finally by length (shorter names first)
-        len(x)
+        # Then by length (shorter names first), and alphabetically
+        len(x),
+        x
     ))
     
     return suggestion_list[:8]  # Return top 8 suggestions
 
-def filter_recipes(recipes: List[Recipe], filters: RecipeFilter) -> List[Recipe]:
-    """Filter recipes based on search criteria"""
-    filtered = []
-    
-    for recipe in recipes:
-        # Search filter
-        matches_search = True
-        if filters.search:
-            search_term = filters.search.lower()
-            matches_search = (
-                search_term in recipe.title.lower() or
-                search_term in recipe.description.lower() or
-                search_term in recipe.author.lower() or
-                any(search_term in tag.lower() for tag in recipe.tags) or
-                any(search_term in ingredient.lower() for ingredient in recipe.ingredients)
-            )
-        
-        # Category filter
-        matches_category = (
-            filters.category == "All Categories" or 
-            recipe.category == filters.category
-        )
-        
-        # Difficulty filter
-        matches_difficulty = (
-            filters.difficulty == "All" or 
-            recipe.difficulty == filters.difficulty
-        )
-        
-        # Time filter
-        matches_time = recipe.cookingTime <= filters.maxTime
-        
-        if matches_search and matches_category and matches_difficulty and matches_time:
+def search_recipes(recipes: Iterable[Recipe], filters: RecipeFilter, limit: Optional[int] = None,
+                   after: Optional[str] = None, count: bool = True) -> Tuple[Optional[int], List[Recipe]]:
+    """Count the recipes matching filters and return the first limit of them in ranked order.
+
+    With after, the id of the last recipe already returned, the page starts
+    right behind it; KeyError if that recipe is gone. With count=False an
+    indexed store may skip counting a search and return None for the total.
+    """
+    # The stores answer from their indexes; anything else is scanned
+    if isinstance(recipes, INDEXED_STORES):
+        return recipes.search(filters, limit, after, count)
+
+    query = compile_search(filters)
+    # An explicit sort replaces the ranking altogether
+    by = SORT_KEYS.get(filters.sort)
+    if query and filters.rank == "hybrid" and by is None:
+        return search_hybrid(recipes, filters, limit, after)
+    positions, filtered = [], []
+    for position, recipe in enumerate(recipes):
+        if (query is None or query.matches(recipe)) and matches_facets(recipe, filters):
+            positions.append(position)
             filtered.append(recipe)
+
+    scorer = scan_bm25(recipes, query.ranking_text) if query and filters.rank == "bm25" and by is None else None
+    cursor = None
+    if after is not None:
+        position, recipe = next(((p, r) for p, r in enumerate(recipes) if r.id == after), (None, None))
+        if recipe is None:
+            raise KeyError(after)
+        cursor = index_cursor((sort_key(recipe, filters, scorer), position), positions)
     
-    # Sort by relevance if search term exists
-    if filters.search:
-        search_term_lower = filters.search.lower()
-        filtered.sort(key=lambda r: (
-            2 if search_term_lower in r.title.lower() else 
-            1 if any(search_term_lower in tag.lower() for tag in r.tags) else 0,
-            r.rating
-        ), reverse=True)
+    # Sort by relevance if search term exists; only the requested page is ordered
+    if scorer is not None:
+        scored = rank_bm25(filtered, scorer, limit, cursor)
+        return len(filtered), [recipe for _, recipe in scored]
+    key = by or (query.key if query else (lambda r: ()))
+    remaining = after_cursor(filtered, key, cursor)
+    if query or by:
+        return len(filtered), top_k(remaining, limit, key=key)
     
-    return filtered
+    return len(filtered), remaining[:limit]
+
+def search_hybrid(recipes: Iterable[Recipe], filters: RecipeFilter, limit: Optional[int] = None,
+                  after: Optional[str] = None) -> Tuple[int, List[Recipe]]:
+    """search_recipes for rank=hybrid: search matches and similar recipes, by embedding every recipe"""
+    recipes = list(recipes)
+    scorer = scan_hybrid(recipes, compile_search(filters))
+    positions = [position for position, recipe in enumerate(recipes) if matches_facets(recipe, filters)]
+    cursor = None
+    if after is not None:
+        position = next((p for p, r in enumerate(recipes) if r.id == after), None)
+        if position is None:
+            raise KeyError(after)
+        cursor = sort_key(recipes[position], filters, scorer), position
+    total, scored = rank_hybrid([recipes[p] for p in positions], positions, scorer, limit, cursor)
+    return total, [recipe for _, recipe in scored]
+
+def encode_cursor(version: CatalogVersion, recipe_id: str, filters: RecipeFilter) -> str:
+    """Opaque cursor for the page after recipe_id, tied to a catalog version and a query"""
+    payload = [version.number, recipe_id, filters.model_dump(mode="json")]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode()
+
+def decode_cursor(cursor: str, filters: RecipeFilter) -> Tuple[int, str]:
+    """The catalog version number and last recipe id in a cursor from encode_cursor"""
+    try:
+        number, recipe_id, query = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    if query != filters.model_dump(mode="json"):
+        raise HTTPException(status_code=400, detail="Cursor belongs to a different query")
+    return number, recipe_id
+
+def cached_search(store, filters: RecipeFilter, limit: Optional[int] = None,
+                  after: Optional[str] = None, count: bool = True) -> Tuple[Optional[int], List[Recipe]]:
+    """search_recipes through the result cache"""
+    cached = result_cache.search(store, filters, limit, after, lambda bound: search_recipes(store, filters, bound),
+                                 count)
+    if cached is None:
+        return search_recipes(store, filters, limit, after, count)
+    total, ids = cached
+    return total, store.get_many(ids)
+
+def correct_search(recipes: Iterable[Recipe], filters: RecipeFilter) -> Tuple[RecipeFilter, Dict[str, str]]:
+    """filters with misspelled search words corrected against the catalog vocabulary, and the corrections"""
+    query = compile_search(filters)
+    if query is None:
+        return filters, {}
+    words = search_words(query)
+    if isinstance(recipes, INDEXED_STORES):
+        fixes = corrections(recipes.spelling(words))
+    else:
+        fixes = corrections(scan_spelling(recipes, words))
+    if not fixes:
+        return filters, {}
+    return filters.model_copy(update={"search": apply_corrections(filters.search, fixes)}), fixes
+
+def facet_counts(recipes: Iterable[Recipe], filters: RecipeFilter) -> FacetCounts:
+    """Matches of the search of filters per category, difficulty and cookingTime bucket"""
+    if isinstance(recipes, INDEXED_STORES):
+        return recipes.facets(filters)
+    return count_facets(search_recipes(recipes, unfaceted(filters))[1], filters)
+
+def highlight_recipes(recipes: Iterable[Recipe], page: List[Recipe],
+                      filters: RecipeFilter) -> List[Dict[str, List[Span]]]:
+    """Spans of each page recipe matching the search of filters, per field"""
+    if isinstance(recipes, INDEXED_STORES):
+        return recipes.highlights(page, filters)
+    return scan_highlights(page, compile_search(filters))
+
+def filter_recipes(recipes: Iterable[Recipe], filters: RecipeFilter) -> List[Recipe]:
+    """Filter recipes based on search criteria"""
+    return search_recipes(recipes, filters)[1]
 
 # Initialize with sample data
-def init_sample_data():
+def init_sample_data(recipes_db):
     """Initialize with comprehensive Indian recipes"""
-    global recipes_db
     recipes_db.clear()  # Clear existing data
     
     sample_recipes = [
@@ -260,7 +415,7 @@ def init_sample_data():
             "tags": ["Indian", "Non-Vegetarian", "Creamy", "Popular", "North Indian"],
             "rating": 4.8,
             "author": "Chef Rajesh",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "2",
@@ -290,7 +445,7 @@ def init_sample_data():
             "tags": ["South Indian", "Breakfast", "Vegetarian", "Fermented", "Tamil Nadu"],
             "rating": 4.9,
             "author": "Chef Krishnan",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "3",
@@ -322,7 +477,7 @@ def init_sample_data():
             "tags": ["Indian", "Biryani", "Chicken", "Aromatic", "Hyderabadi"],
             "rating": 4.9,
             "author": "Chef Hyderabadi",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "4",
@@ -354,7 +509,7 @@ def init_sample_data():
             "tags": ["Indian", "Vegetarian", "Paneer", "Creamy", "North Indian"],
             "rating": 4.7,
             "author": "Chef Meera",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "5",
@@ -386,7 +541,7 @@ def init_sample_data():
             "tags": ["South Indian", "Tamil Nadu", "Vegetarian", "Lentils", "Traditional"],
             "rating": 4.8,
             "author": "Chef Raman",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "6",
@@ -418,7 +573,7 @@ def init_sample_data():
             "tags": ["Indian", "Vegetarian", "Spinach", "Paneer", "Healthy"],
             "rating": 4.6,
             "author": "Chef Meera",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "7",
@@ -445,7 +600,7 @@ def init_sample_data():
             "tags": ["South Indian", "Breakfast", "Steamed", "Healthy", "Vegetarian"],
             "rating": 4.7,
             "author": "Chef Kamala",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "8",
@@ -475,7 +630,7 @@ def init_sample_data():
             "tags": ["Indian", "Chicken", "Tandoori", "Grilled", "Protein-rich"],
             "rating": 4.8,
             "author": "Chef Ashok",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "9",
@@ -505,7 +660,7 @@ def init_sample_data():
             "tags": ["Indian", "Vegetarian", "Protein-rich", "Spicy", "Punjabi"],
             "rating": 4.8,
             "author": "Chef Harpreet",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         },
         {
             "id": "10",
@@ -535,134 +690,313 @@ def init_sample_data():
             "tags": ["Indo-Chinese", "Vegetarian", "Spicy", "Fried"],
             "rating": 4.5,
             "author": "Chef Wong",
-            "createdAt": datetime.now().isoformat()
+            "createdAt": datetime.now(timezone.utc).isoformat()
         }
     ]
     
     for recipe_data in sample_recipes:
         recipe_data["createdAt"] = datetime.fromisoformat(recipe_data["createdAt"].replace("Z", "+00:00"))
         recipe = Recipe(**recipe_data)
-        recipes_db.append(recipe)
+        recipes_db.add(recipe)
+
+def load_catalog():
+    """Recover the catalog from disk if possible, otherwise load the sample recipes"""
+    if persistence is not None and persistence.recover():
+        return
+    # A persistent store that already has recipes keeps them
+    if len(catalog.current().store) == 0:
+        with catalog.write() as version:
+            init_sample_data(version.store)
+            for recipe in version.store:
+                log_put(to_recipe(recipe))
+        if persistence is not None:
+            persistence.wal.flush()
 
 # Initialize sample data on startup
-init_sample_data()
+load_catalog()
 
 # API Routes
 @app.get("/")
 async def root():
     return {"message": "Recipe Search API is running!"}
 
-@app.get("/recipes", response_model=List[Recipe])
+@app.get("/recipes", response_model=List[Union[HighlightedRecipe, Recipe]])
 async def get_recipes(
+    response: Response,
     search: Optional[str] = Query(None, description="Search term"),
     category: Optional[str] = Query("All Categories", description="Recipe category"),
     difficulty: Optional[str] = Query("All", description="Recipe difficulty"),
-    maxTime: Optional[int] = Query(180, description="Maximum cooking time in minutes")
+    maxTime: Optional[int] = Query(180, description="Maximum cooking time in minutes"),
+    minRating: Optional[float] = Query(None, description="Minimum rating"),
+    minServings: Optional[int] = Query(None, description="Minimum servings"),
+    maxServings: Optional[int] = Query(None, description="Maximum servings"),
+    createdFrom: Optional[datetime] = Query(None, description="Created at or after (ISO 8601; UTC unless offset)"),
+    createdBefore: Optional[datetime] = Query(None, description="Created before (ISO 8601; UTC unless offset)"),
+    sort: str = Query("relevance", pattern="^(relevance|rating|time|newest)$",
+                      description="Order: relevance (see rank), rating, time (quickest first), or newest"),
+    rank: str = Query("relevance", pattern="^(relevance|bm25|hybrid)$",
+                      description="Search ranking: relevance, bm25, or hybrid (lexical blended with vector similarity)"),
+    syntax: str = Query("literal", pattern="^(literal|query)$",
+                        description="literal substring, or query syntax: AND, OR, \"phrases\", -term, field:term"),
+    fuzzy: bool = Query(False, description="Correct misspelled search words; see X-Search-Corrections"),
+    highlight: bool = Query(False, description="Add the search's match spans per field to every recipe"),
+    facets: bool = Query(False, description="Count matches per category, difficulty and time; see X-Facet-Counts"),
+    count: bool = Query(False, description="Count every match into X-Total-Count, however many there are"),
+    limit: Optional[int] = Query(None, ge=1, description="Page size; all matches when omitted"),
+    offset: int = Query(0, ge=0, description="Matches to skip before the page"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    version: CatalogVersion = Depends(read_catalog)
 ):
     """Get filtered recipes"""
+    if rank == "hybrid" and not HYBRID_AVAILABLE:
+        raise HTTPException(status_code=400, detail="rank=hybrid needs numpy on the server")
+    if sort != "relevance" and rank != "relevance":
+        raise HTTPException(status_code=400, detail=f"sort={sort} replaces the ranking; drop rank={rank}")
     filters = RecipeFilter(
         search=search or "",
         category=category,
         difficulty=difficulty,
-        maxTime=maxTime
+        maxTime=maxTime,
+        minRating=minRating,
+        minServings=minServings,
+        maxServings=maxServings,
+        createdFrom=createdFrom,
+        createdBefore=createdBefore,
+        sort=sort,
+        rank=rank,
+        syntax=syntax,
+        fuzzy=fuzzy
     )
+    query = compile_search(filters)
+    if query is not None and not query.terms:
+        raise HTTPException(status_code=400, detail="The search needs at least one term that isn't negated")
     
-    filtered_recipes = filter_recipes(recipes_db, filters)
-    return filtered_recipes
+    def respond(version: CatalogVersion):
+        after = None
+        if cursor is not None:
+            number, after = decode_cursor(cursor, filters)
+            # Later pages come from the first page's version while it is pinned;
+            # after that they continue from the cursor's recipe in the current one
+            version = catalog.pinned(number) or version
+            response.headers[VERSION_HEADER] = str(version.number)
+
+        # Corrections depend on the catalog, so later pages redo them on the same version
+        searched = filters
+        if fuzzy:
+            searched, fixes = correct_search(version.store, filters)
+            if fixes:
+                response.headers[CORRECTIONS_HEADER] = json.dumps(fixes)
+
+        # Only offset + limit matches (plus one, to tell if there are more) are
+        # ranked; X-Total-Count reports all of them, unless a search page was
+        # cheaper to find than they are to count and count=true wasn't asked for
+        try:
+            total, ranked = cached_search(version.store, searched, None if limit is None else offset + limit + 1,
+                                          after, count)
+        except KeyError:
+            raise HTTPException(status_code=410, detail="Cursor expired; start again from the first page")
+        if total is not None:
+            response.headers[TOTAL_COUNT_HEADER] = str(total)
+        if facets:
+            response.headers[FACETS_HEADER] = json.dumps(facet_counts(version.store, searched))
+        page = ranked[offset:offset + limit] if limit is not None else ranked[offset:]
+        if len(page) < len(ranked) - offset:
+            catalog.pin(version)
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(version, page[-1].id, filters)
+        if highlight:
+            return [
+                HighlightedRecipe(**dict(to_recipe(recipe)), highlights={
+                    field: [MatchSpan(index=line, start=start, end=end) for line, start, end in spans]
+                    for field, spans in found.items()
+                })
+                for recipe, found in zip(page, highlight_recipes(version.store, page, searched))
+            ]
+        return [to_recipe(recipe) for recipe in page]
+
+    return await run_store(respond, version)
 
 @app.get("/recipes/{recipe_id}", response_model=Recipe)
-async def get_recipe(recipe_id: str):
+async def get_recipe(recipe_id: str, version: CatalogVersion = Depends(read_catalog)):
     """Get a specific recipe by ID"""
-    recipe = next((r for r in recipes_db if r.id == recipe_id), None)
+    recipe = await run_store(version.store.get, recipe_id)
     if not recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    return recipe
+    return to_recipe(recipe)
+
+@app.get("/recipes/{recipe_id}/ingredients", response_model=List[ParsedIngredient])
+async def get_recipe_ingredients(recipe_id: str, version: CatalogVersion = Depends(read_catalog)):
+    """A recipe's ingredient lines split into quantity, unit, name and note"""
+    recipe = await run_store(version.store.get, recipe_id)
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return [
+        ParsedIngredient(text=line, quantity=ingredient.quantity, quantityMax=ingredient.quantity_max,
+                         unit=ingredient.unit, name=ingredient.name, note=ingredient.note)
+        for line, ingredient in zip(recipe.ingredients, parsed_ingredients(recipe))
+    ]
+
+@app.get("/recipes/{recipe_id}/similar", response_model=List[SimilarRecipe])
+async def get_similar_recipes(
+    recipe_id: str,
+    limit: int = Query(6, ge=1, le=50, description="Number of similar recipes"),
+    version: CatalogVersion = Depends(read_catalog)
+):
+    """Recipes sharing the most ingredients and tags with this one"""
+    recipe = await run_store(version.store.get, recipe_id)
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return [
+        SimilarRecipe(recipe=to_recipe(other), similarity=round(score, 4))
+        for score, other in await run_store(version.store.similar, recipe, limit)
+    ]
 
 @app.post("/recipes", response_model=Recipe)
-async def create_recipe(recipe: Recipe):
+async def create_recipe(recipe: Recipe, response: Response):
     """Create a new recipe"""
-    # Check if recipe with same ID exists
-    if any(r.id == recipe.id for r in recipes_db):
-        raise HTTPException(status_code=400, detail="Recipe with this ID already exists")
-    
-    recipe.createdAt = datetime.now()
-    recipes_db.append(recipe)
+    def write() -> CatalogVersion:
+        with catalog.write(publish=False) as version:
+            # Check if recipe with same ID exists
+            if recipe.id in version.store:
+                raise HTTPException(status_code=400, detail="Recipe with this ID already exists")
+
+            recipe.createdAt = datetime.now(timezone.utc)
+            version.store.add(recipe)
+            result_cache.added(version.store, recipe)
+            log_put(recipe)
+        return version
+    version = await run_store(write)
+    response.headers[VERSION_HEADER] = str(version.number)
+    await publish_durable(version)
     return recipe
 
 @app.put("/recipes/{recipe_id}", response_model=Recipe)
-async def update_recipe(recipe_id: str, recipe_update: Recipe):
+async def update_recipe(recipe_id: str, recipe_update: Recipe, response: Response):
     """Update an existing recipe"""
-    recipe_index = next((i for i, r in enumerate(recipes_db) if r.id == recipe_id), None)
-    if recipe_index is None:
-        raise HTTPException(status_code=404, detail="Recipe not found")
-    
-    recipe_update.id = recipe_id  # Ensure ID doesn't change
-    recipes_db[recipe_index] = recipe_update
+    def write() -> CatalogVersion:
+        with catalog.write(publish=False) as version:
+            if recipe_id not in version.store:
+                raise HTTPException(status_code=404, detail="Recipe not found")
+
+            recipe_update.id = recipe_id  # Ensure ID doesn't change
+            old_recipe = version.store.get(recipe_id)
+            version.store.replace(recipe_id, recipe_update)
+            result_cache.replaced(version.store, old_recipe, recipe_update)
+            log_put(recipe_update)
+        return version
+    version = await run_store(write)
+    response.headers[VERSION_HEADER] = str(version.number)
+    await publish_durable(version)
     return recipe_update
 
 @app.delete("/recipes/{recipe_id}")
-async def delete_recipe(recipe_id: str):
+async def delete_recipe(recipe_id: str, response: Response):
     """Delete a recipe"""
-    recipe_index = next((i for i, r in enumerate(recipes_db) if r.id == recipe_id), None)
-    if recipe_index is None:
-        raise HTTPException(status_code=404, detail="Recipe not found")
-    
-    deleted_recipe = recipes_db.pop(recipe_index)
+    def write() -> Tuple[CatalogVersion, Recipe]:
+        with catalog.write(publish=False) as version:
+            if recipe_id not in version.store:
+                raise HTTPException(status_code=404, detail="Recipe not found")
+
+            deleted_recipe = version.store.remove(recipe_id)
+            result_cache.removed(version.store, deleted_recipe)
+            log_delete(recipe_id)
+        return version, deleted_recipe
+    version, deleted_recipe = await run_store(write)
+    response.headers[VERSION_HEADER] = str(version.number)
+    await publish_durable(version)
     return {"message": f"Recipe '{deleted_recipe.title}' deleted successfully"}
 
+@app.get("/pantry/recipes", response_model=List[PantryMatch])
+async def get_pantry_recipes(
+    response: Response,
+    ingredients: List[str] = Query(..., description="What you have; repeat the parameter or separate with commas"),
+    complete: bool = Query(False, description="Only recipes whose every ingredient is covered"),
+    limit: Optional[int] = Query(None, ge=1, description="Number of recipes; all matches when omitted"),
+    version: CatalogVersion = Depends(read_catalog)
+):
+    """Recipes ranked by how much of their ingredient list the pantry covers"""
+    keys = pantry_keys(item for value in ingredients for item in value.split(","))
+    total, hits = await run_store(version.store.pantry, keys, complete, limit)
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
+    keys = set(keys)
+    return [
+        PantryMatch(
+            recipe=to_recipe(hit.recipe),
+            coverage=round(hit.coverage, 4),
+            matched=hit.matched,
+            total=hit.total,
+            missing=[line for line, ingredient in zip(hit.recipe.ingredients, parsed_ingredients(hit.recipe))
+                     if not covers(keys, ingredient.name)],
+        )
+        for hit in hits
+    ]
+
 @app.get("/search/suggestions", response_model=SearchSuggestion)
-async def get_search_suggestions_endpoint(q: str = Query(..., description="Search query")):
+async def get_search_suggestions_endpoint(
+    q: str = Query(..., description="Search query"),
+    version: CatalogVersion = Depends(read_catalog)
+):
     """Get search suggestions based on query"""
-    suggestions = get_search_suggestions(q, recipes_db)
+    suggestions = await run_store(get_search_suggestions, q, version.store)
     return SearchSuggestion(suggestions=suggestions)
 
 @app.get("/categories")
-async def get_categories():
+async def get_categories(version: CatalogVersion = Depends(read_catalog)):
     """Get all available recipe categories"""
-    categories = list(set([recipe.category for recipe in recipes_db]))
+    categories = list(set(await run_store(version.store.categories)))
     categories.sort()
     return {"categories": ["All Categories"] + categories}
 
 @app.get("/stats")
-async def get_stats():
+async def get_stats(version: CatalogVersion = Depends(read_catalog)):
     """Get recipe statistics"""
-    total_recipes = len(recipes_db)
-    categories = {}
-    difficulties = {}
+    total_recipes = len(version.store)
+    stats = await run_store(version.store.stats)
     avg_rating = 0
     
     if total_recipes > 0:
-        for recipe in recipes_db:
-            categories[recipe.category] = categories.get(recipe.category, 0) + 1
-            difficulties[recipe.difficulty] = difficulties.get(recipe.difficulty, 0) + 1
-        
-        avg_rating = sum(recipe.rating for recipe in recipes_db) / total_recipes
+        avg_rating = stats["rating_sum"] / total_recipes
     
     return {
         "total_recipes": total_recipes,
-        "categories": categories,
-        "difficulties": difficulties,
+        "categories": stats["categories"],
+        "difficulties": stats["difficulties"],
         "average_rating": round(avg_rating, 2),
         "global_database_size": len(global_recipe_database)
     }
 
+@app.get("/stats/cache")
+async def get_cache_stats():
+    """Hit rate and memory use of the /recipes result cache"""
+    return result_cache.stats()
+
 @app.post("/bulk-import")
-async def bulk_import_recipes(recipes: List[Recipe]):
+async def bulk_import_recipes(recipes: List[Recipe], response: Response):
     """Bulk import recipes"""
-    imported_count = 0
     errors = []
+
+    def write() -> Tuple[CatalogVersion, int]:
+        imported_count = 0
+        # In memory readers see either none of the batch or all of it; SQLite commits it as one transaction
+        with catalog.write(publish=False) as version:
+            for recipe in recipes:
+                try:
+                    # Check if recipe already exists
+                    if recipe.id not in version.store:
+                        recipe.createdAt = datetime.now(timezone.utc)
+                        version.store.add(recipe)
+                        result_cache.added(version.store, recipe)
+                        log_put(recipe)
+                        imported_count += 1
+                    else:
+                        errors.append(f"Recipe with ID {recipe.id} already exists")
+                except Exception as e:
+                    errors.append(f"Error importing recipe {recipe.title}: {str(e)}")
+        return version, imported_count
+    version, imported_count = await run_store(write)
+    response.headers[VERSION_HEADER] = str(version.number)
     
-    for recipe in recipes:
-        try:
-            # Check if recipe already exists
-            if not any(r.id == recipe.id for r in recipes_db):
-                recipe.createdAt = datetime.now()
-                recipes_db.append(recipe)
-                imported_count += 1
-            else:
-                errors.append(f"Recipe with ID {recipe.id} already exists")
-        except Exception as e:
-            errors.append(f"Error importing recipe {recipe.title}: {str(e)}")
+    # One group commit covers the whole batch
+    await publish_durable(version)
     
     return {
         "imported_count": imported_count,
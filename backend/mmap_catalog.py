@@ -0,0 +1,676 @@
+"""Memory-mapped binary catalog snapshots.
+
+File layout (little-endian; big-endian hosts byteswap on write and read):
+
+    magic "RCAT" | u32 version | u32 header length | JSON header | sections...
+
+The JSON header maps each section name to [offset, length, typecode]. Numeric
+fields are fixed-width columns (cookingTime and servings int32, or int64 when
+a value needs it), category and difficulty are u16 codes into
+small string tables, and every text field has a u64 offset table (count + 1
+entries) into one UTF-8 string heap. List fields are stored as their items,
+each followed by ITEM_END, so scans split them rather than parse JSON; a row
+with an item containing ITEM_END falls back to JSON text, which ends in "]".
+"id_order" holds the rows sorted by id so lookups are a binary search.
+
+Opening a catalog only parses the header, so startup time does not depend on
+the catalog size, and the read-only mapping is shared between processes. The
+text, pantry, suggestion, spelling, similarity and vector indexes live in RAM
+next to the mapping, each built the first time a request needs it.
+Writes never touch the file; main logs them to RECIPE_DATA_DIR and replays
+them over it on startup (see persistence.py).
+
+Build one from a write-ahead log snapshot (or the sample data) with:
+
+    python mmap_catalog.py catalog.bin [snapshot.jsonl]
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from datetime import datetime
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # facet filters fall back to a Python loop over the columns
+    np = None
+
+from bitset import iter_bits, mask_of
+from filters import SORT_KEYS, after_cursor, has_ranges, index_cursor, matches_facets, top_k
+from facet_index import FacetCounts, count_facets, unfaceted
+from highlight import Span, scan_highlights
+from models import Recipe, RecipeFilter
+from pantry import PantryHit, PantryIndex
+from query import compile_search
+from search_index import TokenIndex, TrigramIndex
+from similarity import SimilarityIndex, signature
+from spelling import Candidate, SpellIndex
+from suggestions import SuggestionIndex
+from ranking import BM25, FieldLengths, rank_bm25, sort_key
+from vectors import MIN_SIMILARITY, HybridScorer, VectorIndex, rank_hybrid
+from versions import CopyOnWriteDict, CopyOnWriteList
+
+MAGIC = b"RCAT"
+VERSION = 2
+PREAMBLE = struct.Struct("<4sII")
+
+TEXT_FIELDS = ["id", "title", "description", "image", "author", "createdAt"]
+LIST_FIELDS = ["ingredients", "instructions", "tags"]
+ENUM_FIELDS = ["category", "difficulty"]
+# Ends every item of a list field
+ITEM_END = "\x1f"
+
+# Held while an in-RAM index is built (see MmapRecipeStore._optional)
+_BUILDING = threading.Lock()
+
+# isFavorite is Optional[bool]
+_FAVORITE_CODES = {False: 0, True: 1, None: 2}
+_FAVORITE_VALUES = [False, True, None]
+
+
+def write_catalog(path: str, recipes: Iterable[Recipe]) -> int:
+    """Write recipes to a binary catalog file; returns the number of rows"""
+    recipes = list(recipes)
+    sections: Dict[str, tuple] = {}
+    columns = {
+        "cookingTime": _int_column([r.cookingTime for r in recipes]),
+        "servings": _int_column([r.servings for r in recipes]),
+        "rating": array("d", (r.rating for r in recipes)),
+        "isFavorite": array("B", (_FAVORITE_CODES[r.isFavorite] for r in recipes)),
+    }
+
+    enums: Dict[str, List[str]] = {}
+    for field in ENUM_FIELDS:
+        codes: Dict[str, int] = {}
+        column = array("H")
+        for recipe in recipes:
+            value = getattr(recipe, field)
+            column.append(codes.setdefault(value, len(codes)))
+        columns[field] = column
+        enums[field] = list(codes)
+
+    heap = bytearray()
+    for field in TEXT_FIELDS + LIST_FIELDS:
+        offsets = array("Q", [len(heap)])
+        for recipe in recipes:
+            value = getattr(recipe, field)
+            if field == "createdAt":
+                value = value.isoformat()
+            elif field in LIST_FIELDS:
+                value = _encode_list(value)
+            heap += value.encode("utf-8")
+            offsets.append(len(heap))
+        columns[f"{field}.offsets"] = offsets
+
+    ids = [recipe.id.encode("utf-8") for recipe in recipes]
+    columns["id_order"] = array("I", sorted(range(len(recipes)), key=ids.__getitem__))
+
+    if sys.byteorder == "big":
+        for column in columns.values():
+            column.byteswap()
+    # Lay the sections out after the header, 8-byte aligned
+    blobs = [(name, column.tobytes(), column.typecode) for name, column in columns.items()]
+    blobs.append(("heap", bytes(heap), "B"))
+    header = {"count": len(recipes), "enums": enums, "sections": sections}
+    header_len = 4096
+    while True:
+        offset = _align(PREAMBLE.size + header_len)
+        for name, blob, typecode in blobs:
+            sections[name] = (offset, len(blob), typecode)
+            offset = _align(offset + len(blob))
+        encoded = json.dumps(header).encode("utf-8")
+        if len(encoded) <= header_len:
+            break
+        header_len = len(encoded)
+
+    with open(path, "wb") as out:
+        out.write(PREAMBLE.pack(MAGIC, VERSION, header_len))
+        out.write(encoded.ljust(header_len, b" "))
+        for name, blob, _ in blobs:
+            out.seek(sections[name][0])
+            out.write(blob)
+    return len(recipes)
+
+
+def _int_column(values: List[int]) -> array:
+    """int32 column, or int64 if a value needs it; wider values don't fit the fixed-width format"""
+    for typecode in ("i", "q"):
+        try:
+            return array(typecode, values)
+        except OverflowError:
+            pass
+    raise ValueError("integer field past the 64-bit range; serve this catalog from another store")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _encode_list(items: List[str]) -> str:
+    if any(ITEM_END in item for item in items):
+        return json.dumps(items)
+    return "".join(item + ITEM_END for item in items)
+
+
+def _decode_list(text: str) -> List[str]:
+    if text.endswith("]"):
+        return json.loads(text)
+    return text.split(ITEM_END)[:-1]
+
+
+class MmapCatalog:
+    """Read-only, lazily decoded view of a binary catalog file"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} recipe catalog; rebuild it with mmap_catalog.py")
+        header = json.loads(self._mmap[PREAMBLE.size:PREAMBLE.size + header_len])
+        self.count: int = header["count"]
+        self.enums: Dict[str, List[str]] = header["enums"]
+
+        view = memoryview(self._mmap)
+        self._sections = {}
+        for name, (offset, length, typecode) in header["sections"].items():
+            section = view[offset:offset + length]
+            if typecode == "B":
+                self._sections[name] = section
+            elif sys.byteorder == "big":
+                # Decoded into native order once, at the cost of the zero-copy mapping
+                self._sections[name] = array(typecode, section.tobytes())
+                self._sections[name].byteswap()
+            else:
+                self._sections[name] = section.cast(typecode)
+        self.heap = self._sections["heap"]
+        self.cooking_time = self._sections["cookingTime"]
+        self.servings = self._sections["servings"]
+        self.rating = self._sections["rating"]
+        self.category = self._sections["category"]
+        self.difficulty = self._sections["difficulty"]
+
+    def text(self, field: str, row: int) -> str:
+        offsets = self._sections[f"{field}.offsets"]
+        return str(self.heap[offsets[row]:offsets[row + 1]], "utf-8")
+
+    def items(self, field: str, row: int) -> List[str]:
+        return _decode_list(self.text(field, row))
+
+    def find(self, recipe_id: str) -> Optional[int]:
+        """Row holding recipe_id, by binary search over id_order"""
+        target = recipe_id.encode("utf-8")
+        order = self._sections["id_order"]
+        offsets = self._sections["id.offsets"]
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = order[mid]
+            if bytes(self.heap[offsets[row]:offsets[row + 1]]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            row = order[lo]
+            if bytes(self.heap[offsets[row]:offsets[row + 1]]) == target:
+                return row
+        return None
+
+
+class RecipeView:
+    """Recipe-shaped view of one catalog row that decodes fields on access"""
+
+    __slots__ = ("_catalog", "_row")
+
+    def __init__(self, catalog: MmapCatalog, row: int):
+        self._catalog = catalog
+        self._row = row
+
+    id = property(lambda self: self._catalog.text("id", self._row))
+    title = property(lambda self: self._catalog.text("title", self._row))
+    description = property(lambda self: self._catalog.text("description", self._row))
+    image = property(lambda self: self._catalog.text("image", self._row))
+    author = property(lambda self: self._catalog.text("author", self._row))
+    ingredients = property(lambda self: self._catalog.items("ingredients", self._row))
+    instructions = property(lambda self: self._catalog.items("instructions", self._row))
+    tags = property(lambda self: self._catalog.items("tags", self._row))
+    category = property(lambda self: self._catalog.enums["category"][self._catalog.category[self._row]])
+    difficulty = property(lambda self: self._catalog.enums["difficulty"][self._catalog.difficulty[self._row]])
+    cookingTime = property(lambda self: self._catalog.cooking_time[self._row])
+    servings = property(lambda self: self._catalog.servings[self._row])
+    rating = property(lambda self: self._catalog.rating[self._row])
+
+    @property
+    def createdAt(self) -> datetime:
+        return datetime.fromisoformat(self._catalog.text("createdAt", self._row))
+
+    @property
+    def isFavorite(self) -> Optional[bool]:
+        return _FAVORITE_VALUES[self._catalog._sections["isFavorite"][self._row]]
+
+    def to_recipe(self) -> Recipe:
+        return Recipe.model_construct(**{field: getattr(self, field) for field in Recipe.model_fields})
+
+
+class MmapRecipeStore:
+    """RecipeStore-compatible catalog served from a memory-mapped snapshot.
+
+    The file is never modified: writes go to an in-memory overlay, which main
+    makes durable with the write-ahead log. Replaced or deleted snapshot rows
+    are shadowed by row number, so they keep their catalog position, and new
+    recipes follow the snapshot rows. Scans work on RecipeViews, which the
+    API materializes with to_recipe() only for the recipes a response returns.
+    The overlay is copy-on-write, so a catalog version costs what it writes.
+
+    The indexes are the in-memory store's, over catalog positions, built
+    from the rows the first time a version is asked for one and from then on
+    kept in step and carried over to later versions. A search term only
+    looks at the facet rows its text candidates name; facet-only filters,
+    categories and stats read the mapped columns.
+    """
+
+    def __init__(self, path: str):
+        self.catalog = MmapCatalog(path)
+        # Snapshot row -> replacement recipe, or None once deleted
+        self._shadowed: CopyOnWriteDict[int, Optional[Recipe]] = CopyOnWriteDict()
+        self._deleted = 0
+        # New recipes in catalog order, None once deleted; the id maps to the index
+        self._appended: CopyOnWriteList[Optional[Recipe]] = CopyOnWriteList()
+        self._appended_ids: CopyOnWriteDict[str, int] = CopyOnWriteDict()
+        # The in-RAM indexes built so far, by name; see _optional
+        self._built: Dict[str, object] = {}
+
+    def copy(self) -> "MmapRecipeStore":
+        """Copy sharing the read-only mapping and, until either side writes to them, the overlay's buckets"""
+        clone = MmapRecipeStore.__new__(MmapRecipeStore)
+        clone.catalog = self.catalog
+        clone._shadowed = self._shadowed.copy()
+        clone._deleted = self._deleted
+        clone._appended = self._appended.copy()
+        clone._appended_ids = self._appended_ids.copy()
+        clone._built = {name: index.copy() for name, index in self._built.items()}
+        return clone
+
+    def _optional(self, name: str, factory: Callable[[], object]):
+        """The in-RAM index called name, built from the rows and overlay on first use"""
+        index = self._built.get(name)
+        if index is None:
+            # Readers of one version may race to build it; they take turns and the first one wins
+            with _BUILDING:
+                index = self._built.get(name)
+                if index is None:
+                    index = factory()
+                    index.load([self._at(position) for position in range(self.catalog.count + len(self._appended))])
+                    # Swapped in whole, so a concurrent copy() sees the index complete or not at all
+                    self._built = {**self._built, name: index}
+        return index
+
+    text_index = property(lambda self: self._optional("tokens", TokenIndex))
+    trigram_index = property(lambda self: self._optional("trigrams", TrigramIndex))
+    field_lengths = property(lambda self: self._optional("lengths", FieldLengths))
+    pantry_index = property(lambda self: self._optional("pantry", PantryIndex))
+    suggestion_index = property(lambda self: self._optional("suggestions", SuggestionIndex))
+    spell_index = property(lambda self: self._optional("spelling", SpellIndex))
+    similarity_index = property(lambda self: self._optional("similarity", SimilarityIndex))
+    vector_index = property(lambda self: self._optional("vectors", VectorIndex))
+
+    def _indexed(self, position: int, old, new) -> None:
+        """Keep the built indexes in step with a write at position: old leaves it, new takes it"""
+        for index in self._built.values():
+            if old is not None:
+                index.remove(position, old)
+            if new is not None:
+                index.add(position, new)
+
+    def __len__(self) -> int:
+        return self.catalog.count - self._deleted + len(self._appended_ids)
+
+    def _row(self, recipe_id: str) -> Optional[int]:
+        """Snapshot row of a live recipe, or None"""
+        row = self.catalog.find(recipe_id)
+        if row is None or (row in self._shadowed and self._shadowed[row] is None):
+            return None
+        return row
+
+    def __contains__(self, recipe_id: str) -> bool:
+        return recipe_id in self._appended_ids or self._row(recipe_id) is not None
+
+    def _rows(self, rows: Iterable[int]) -> Iterator:
+        """Views (or their replacements) for snapshot rows, skipping deleted ones"""
+        for row in rows:
+            if row in self._shadowed:
+                if self._shadowed[row] is not None:
+                    yield self._shadowed[row]
+            else:
+                yield RecipeView(self.catalog, row)
+
+    def _added(self, start: int = 0) -> Iterator[Tuple[int, Recipe]]:
+        """Catalog positions and recipes of the live appended recipes, from index start on"""
+        for index in range(start, len(self._appended)):
+            recipe = self._appended[index]
+            if recipe is not None:
+                yield self.catalog.count + index, recipe
+
+    def _at(self, position: int):
+        """The recipe (or view) at a catalog position, or None if it was deleted"""
+        if position >= self.catalog.count:
+            return self._appended[position - self.catalog.count]
+        if position in self._shadowed:
+            return self._shadowed[position]
+        return RecipeView(self.catalog, position)
+
+    def __iter__(self) -> Iterator:
+        yield from self._rows(range(self.catalog.count))
+        for _, recipe in self._added():
+            yield recipe
+
+    def get(self, recipe_id: str):
+        """Return the recipe (or a view of its row) with this id, or None"""
+        if recipe_id in self._appended_ids:
+            return self._appended[self._appended_ids[recipe_id]]
+        row = self._row(recipe_id)
+        if row is None:
+            return None
+        return next(self._rows([row]))
+
+    def get_many(self, recipe_ids: Sequence[str]) -> List:
+        """get() for each id, in order"""
+        return [self.get(recipe_id) for recipe_id in recipe_ids]
+
+    def add(self, recipe: Recipe) -> None:
+        """Append a new recipe; raises KeyError if the id is taken"""
+        if recipe.id in self:
+            raise KeyError(recipe.id)
+        self._appended_ids[recipe.id] = len(self._appended)
+        self._indexed(self.catalog.count + len(self._appended), None, recipe)
+        self._appended.append(recipe)
+
+    def replace(self, recipe_id: str, recipe: Recipe) -> None:
+        """Swap the recipe stored under recipe_id, keeping its position"""
+        if recipe_id in self._appended_ids:
+            index = self._appended_ids[recipe_id]
+            self._indexed(self.catalog.count + index, self._appended[index], recipe)
+            self._appended[index] = recipe
+            return
+        row = self._row(recipe_id)
+        if row is None:
+            raise KeyError(recipe_id)
+        self._indexed(row, self._at(row), recipe)
+        self._shadowed[row] = recipe
+
+    def remove(self, recipe_id: str):
+        """Delete and return the recipe with this id; raises KeyError if missing"""
+        if recipe_id in self._appended_ids:
+            index = self._appended_ids.pop(recipe_id)
+            recipe = self._appended[index]
+            self._indexed(self.catalog.count + index, recipe, None)
+            self._appended[index] = None
+            return recipe
+        recipe = self.get(recipe_id)
+        if recipe is None:
+            raise KeyError(recipe_id)
+        row = self.catalog.find(recipe_id)
+        self._indexed(row, recipe, None)
+        self._shadowed[row] = None
+        self._deleted += 1
+        return recipe
+
+    def clear(self) -> None:
+        self._shadowed = CopyOnWriteDict()
+        for row in range(self.catalog.count):
+            self._shadowed[row] = None
+        self._deleted = self.catalog.count
+        self._appended = CopyOnWriteList()
+        self._appended_ids = CopyOnWriteDict()
+        # Nothing is left to index; they are rebuilt, empty, if asked for again
+        self._built = {}
+
+    def _facet_rows(self, filters: RecipeFilter) -> List[int]:
+        """Snapshot rows passing the facet filters, judged from the fixed-width columns"""
+        catalog = self.catalog
+        codes = {}
+        for field, value, everything in (("category", filters.category, "All Categories"),
+                                         ("difficulty", filters.difficulty, "All")):
+            if value != everything:
+                if value not in catalog.enums[field]:
+                    return []
+                codes[field] = catalog.enums[field].index(value)
+
+        if np is not None:
+            # Zero-copy arrays over the mapped columns
+            mask = np.asarray(catalog.cooking_time) <= filters.maxTime
+            for field, code in codes.items():
+                mask &= np.asarray(getattr(catalog, field)) == code
+            return mask.nonzero()[0].tolist()
+
+        cooking_time = catalog.cooking_time
+        rows = [row for row in range(catalog.count) if cooking_time[row] <= filters.maxTime]
+        for field, code in codes.items():
+            column = getattr(catalog, field)
+            rows = [row for row in rows if column[row] == code]
+        return rows
+
+    def position(self, recipe_id: str) -> int:
+        """Catalog position of a live recipe: its snapshot row, or past the rows if appended"""
+        if recipe_id in self._appended_ids:
+            return self.catalog.count + self._appended_ids[recipe_id]
+        row = self._row(recipe_id)
+        if row is None:
+            raise KeyError(recipe_id)
+        return row
+
+    def search(self, filters: RecipeFilter, limit: Optional[int] = None, after: Optional[str] = None,
+               count: bool = True) -> Tuple[int, List]:
+        """Total matches and the first limit of them in main.filter_recipes order, as lazy views.
+
+        after is the id of the last recipe already returned; the page starts
+        right behind it.
+        The total is counted whatever count says.
+        """
+        query = compile_search(filters)
+        by = SORT_KEYS.get(filters.sort)
+        if query is None and by is None and not has_ranges(filters):
+            return self._browse(filters, limit, after)
+
+        if query and filters.rank == "hybrid" and by is None:
+            scorer = HybridScorer(query, len(self), self.text_index.document_frequency)
+            cursor = None if after is None else (sort_key(self.get(after), filters, scorer), self.position(after))
+            # Hits are the search matches plus the recipes whose vectors are similar enough
+            positions = set(self._matching(filters, query)[0])
+            similarity = self.vector_index.similarities(scorer.vector)
+            for position in (similarity >= MIN_SIMILARITY).nonzero()[0].tolist():
+                recipe = self._at(position)
+                if recipe is not None and matches_facets(recipe, filters):
+                    positions.add(position)
+            positions = sorted(positions)
+            total, scored = rank_hybrid([self._at(position) for position in positions], positions, scorer, limit,
+                                        cursor, self.vector_index.rows(positions))
+            return total, [recipe for _, recipe in scored]
+        positions, filtered = self._matching(filters, query)
+        scorer = None
+        if query and filters.rank == "bm25" and by is None:
+            scorer = BM25(query.ranking_text, len(self), self.text_index.document_frequency,
+                          self.field_lengths.averages())
+        cursor = None
+        if after is not None:
+            position = self.position(after)
+            cursor = index_cursor((sort_key(self.get(after), filters, scorer), position), positions)
+        if by is not None:
+            return len(filtered), top_k(after_cursor(filtered, by, cursor), limit, key=by)
+        if query is None:
+            start = 0 if cursor is None else cursor[1] + 1
+            return len(filtered), filtered[start:start + limit if limit is not None else None]
+        if scorer is not None:
+            scored = rank_bm25(filtered, scorer, limit, cursor)
+            return len(filtered), [recipe for _, recipe in scored]
+        return len(filtered), top_k(after_cursor(filtered, query.key, cursor), limit, key=query.key)
+
+    def _candidates(self, text: str) -> Optional[int]:
+        """Bitmask of the positions that may contain text, or None when the indexes can't narrow it down"""
+        positions = self.trigram_index.candidates(text)
+        if positions is None:
+            positions = self.text_index.candidates(text)
+        return positions
+
+    def _matching(self, filters: RecipeFilter, query) -> Tuple[List[int], List]:
+        """Catalog positions and recipes passing the filters and matching query (if any), in catalog order"""
+        mask = None if query is None else query.candidates(self._candidates)
+        if mask is None:
+            # Replaced rows are judged on their new values, so merge them back in
+            rows = set(self._facet_rows(filters))
+            rows.update(row for row, recipe in self._shadowed.items() if recipe is not None)
+            positions = [row for row in sorted(rows) if self._shadowed.get(row, True) is not None]
+            candidates = list(self._rows(positions))
+            for position, recipe in self._added():
+                positions.append(position)
+                candidates.append(recipe)
+        else:
+            # Only the text candidates among the facet rows are looked at; the overlay's are judged on their values
+            overlay = mask_of(list(self._shadowed)) | ((1 << len(self._appended)) - 1) << self.catalog.count
+            positions = list(iter_bits(mask & (mask_of(self._facet_rows(filters)) | overlay)))
+            candidates = [self._at(position) for position in positions]
+        matched = [
+            (position, recipe) for position, recipe in zip(positions, candidates)
+            if matches_facets(recipe, filters) and (query is None or query.matches(recipe))
+        ]
+        return [position for position, _ in matched], [recipe for _, recipe in matched]
+
+    def _browse(self, filters: RecipeFilter, limit: Optional[int], after: Optional[str]) -> Tuple[int, List]:
+        """search() without a search term, sort or range: the facet columns decide the snapshot rows,
+        which page in row order, so only the overlay and the returned rows are looked at"""
+        rows = self._facet_rows(filters)
+        # Replaced rows are judged on their new values, deleted ones dropped
+        replaced = []
+        total = len(rows)
+        for row, recipe in self._shadowed.items():
+            i = bisect_left(rows, row)
+            if i < len(rows) and rows[i] == row:
+                total -= 1
+            if recipe is not None and matches_facets(recipe, filters):
+                replaced.append(row)
+        replaced.sort()
+        total += len(replaced)
+        added = [(position, recipe) for position, recipe in self._added() if matches_facets(recipe, filters)]
+        total += len(added)
+
+        start = 0 if after is None else self.position(after) + 1
+        page = []
+        last = None
+        for row in merge(rows[bisect_left(rows, start):], replaced[bisect_left(replaced, start):]):
+            if limit is not None and len(page) >= limit:
+                return total, page
+            if row == last:
+                continue
+            last = row
+            if row not in self._shadowed:
+                page.append(RecipeView(self.catalog, row))
+            elif self._shadowed[row] is not None and matches_facets(self._shadowed[row], filters):
+                page.append(self._shadowed[row])
+        page.extend(recipe for position, recipe in added if position >= start)
+        return total, page[:limit]
+
+    def filter(self, filters: RecipeFilter) -> List:
+        """Same results as scanning with main.filter_recipes, as lazy views"""
+        return self.search(filters)[1]
+
+    def pantry(self, keys: Sequence[str], complete: bool = False,
+               limit: Optional[int] = None) -> Tuple[int, List[PantryHit]]:
+        """Recipes the pantry keys cover lines of, from the ingredient index"""
+        total, hits = self.pantry_index.search(keys, complete, limit)
+        return total, [PantryHit(self._at(position), matched, lines) for position, matched, lines in hits]
+
+    def similar(self, recipe, limit: int) -> List[Tuple[float, object]]:
+        """The limit recipes most like recipe, from the MinHash buckets"""
+        position = self.position(recipe.id) if recipe.id in self else None
+        sig = signature(recipe) if position is None else self.similarity_index.signature(position)
+        return [(score, self._at(other)) for score, other in self.similarity_index.similar(sig, limit, position)]
+
+    def spelling(self, words: Sequence[str]) -> Dict[str, Optional[List[Candidate]]]:
+        """For each search word, None if some recipe contains it, else its spelling candidates"""
+        return {
+            word: None if self.text_index.contains(word) else self.spell_index.candidates(word, self.text_index.count)
+            for word in words
+        }
+
+    def suggestions(self, term: str, limit: Optional[int] = None) -> List[str]:
+        """Titles, tags and main ingredient names starting with term or with a word that does"""
+        return self.suggestion_index.lookup(term, limit)
+
+    def facets(self, filters: RecipeFilter) -> FacetCounts:
+        """Matches per category, difficulty and cookingTime bucket, counting the unfaceted search's hits"""
+        return count_facets(self.search(unfaceted(filters))[1], filters)
+
+    def highlights(self, recipes: Sequence, filters: RecipeFilter) -> List[Dict[str, List[Span]]]:
+        """Spans of each recipe matching the search, per field, by tokenizing: the snapshot keeps no positions"""
+        return scan_highlights(recipes, compile_search(filters))
+
+    def _live_rows(self):
+        """Snapshot rows nothing shadows: a numpy array, or a list without numpy"""
+        if np is None:
+            return [row for row in range(self.catalog.count) if row not in self._shadowed]
+        live = np.ones(self.catalog.count, dtype=bool)
+        live[list(self._shadowed)] = False
+        return live.nonzero()[0]
+
+    def _overlay(self) -> Iterator[Tuple[int, Recipe]]:
+        """Catalog positions and recipes of the live replacements and appended recipes"""
+        replaced = ((row, recipe) for row, recipe in self._shadowed.items() if recipe is not None)
+        return chain(replaced, self._added())
+
+    def _tally(self, field: str, rows) -> Dict[str, int]:
+        """Live recipes per value of an enum field, in the order the values first appear"""
+        names = self.catalog.enums[field]
+        column = getattr(self.catalog, field)
+        first: Dict[str, int] = {}
+        counts: Dict[str, int] = {}
+        if np is not None:
+            codes, starts, sizes = np.unique(np.asarray(column)[rows], return_index=True, return_counts=True)
+            for code, start, size in zip(codes.tolist(), starts.tolist(), sizes.tolist()):
+                first[names[code]], counts[names[code]] = int(rows[start]), size
+        else:
+            for row in rows:
+                value = names[column[row]]
+                first.setdefault(value, row)
+                counts[value] = counts.get(value, 0) + 1
+        for position, recipe in self._overlay():
+            value = getattr(recipe, field)
+            first[value] = min(first.get(value, position), position)
+            counts[value] = counts.get(value, 0) + 1
+        return {value: counts[value] for value in sorted(first, key=first.__getitem__)}
+
+    def categories(self) -> List[str]:
+        """Categories in the order they first appear, from the mapped category codes"""
+        return list(self._tally("category", self._live_rows()))
+
+    def stats(self) -> Dict:
+        """Per-category and per-difficulty counts plus the sum of ratings, from the mapped columns"""
+        rows = self._live_rows()
+        if np is not None:
+            rating_sum = float(np.asarray(self.catalog.rating)[rows].sum())
+        else:
+            rating_sum = sum(self.catalog.rating[row] for row in rows)
+        rating_sum += sum(recipe.rating for _, recipe in self._overlay())
+        return {"categories": self._tally("category", rows), "difficulties": self._tally("difficulty", rows),
+                "rating_sum": rating_sum}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python mmap_catalog.py OUTPUT [snapshot.jsonl]")
+    if len(sys.argv) == 3:
+        with open(sys.argv[2], encoding="utf-8") as snapshot:
+            snapshot.readline()  # header
+            source = [Recipe.model_validate_json(line) for line in snapshot]
+    else:
+        # The sample data, whatever store the environment selects
+        os.environ["RECIPE_STORAGE"] = "memory"
+        from main import catalog
+        source = list(catalog.current().store)
+    print(f"Wrote {write_catalog(sys.argv[1], source)} recipes to {sys.argv[1]}")
@@ -0,0 +1,79 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+from datetime import datetime
+
+# Pydantic models
+class Recipe(BaseModel):
+    id: str
+    title: str
+    description: str
+    image: str
+    category: str
+    difficulty: str
+    cookingTime: int
+    servings: int
+    ingredients: List[str]
+    instructions: List[str]
+    tags: List[str]
+    rating: float
+    author: str
+    createdAt: datetime
+    isFavorite: Optional[bool] = False
+
+class MatchSpan(BaseModel):
+    # Tag or ingredient line the match is in; 0 for the other fields
+    index: int
+    # Character offsets of the match in that text, end exclusive
+    start: int
+    end: int
+
+class HighlightedRecipe(Recipe):
+    # Search matches by field: title, description, author, tags, ingredients
+    highlights: Dict[str, List[MatchSpan]]
+
+class RecipeFilter(BaseModel):
+    search: Optional[str] = ""
+    category: Optional[str] = "All Categories"
+    difficulty: Optional[str] = "All"
+    maxTime: Optional[int] = 180
+    # "relevance" (title hit, tag hit, then rating), "bm25" or "hybrid"
+    rank: Optional[str] = "relevance"
+    # "literal" (one substring) or "query" (terms, OR, phrases, -negation, field:)
+    syntax: Optional[str] = "literal"
+    # Replace search words no recipe contains with their closest catalog word
+    fuzzy: Optional[bool] = False
+    # Range filters; None leaves that side open. createdBefore is exclusive
+    minRating: Optional[float] = None
+    minServings: Optional[int] = None
+    maxServings: Optional[int] = None
+    createdFrom: Optional[datetime] = None
+    createdBefore: Optional[datetime] = None
+    # "relevance" (rank decides; catalog order without a search), "rating"
+    # (highest first), "time" (quickest first) or "newest"; ties in catalog order
+    sort: Optional[str] = "relevance"
+
+class SearchSuggestion(BaseModel):
+    suggestions: List[str]
+
+class ParsedIngredient(BaseModel):
+    text: str
+    quantity: Optional[float] = None
+    # Upper end of a range such as "4-5"
+    quantityMax: Optional[float] = None
+    unit: Optional[str] = None
+    name: str
+    note: Optional[str] = None
+
+class SimilarRecipe(BaseModel):
+    recipe: Recipe
+    # Estimated Jaccard similarity of their ingredient and tag sets
+    similarity: float
+
+class PantryMatch(BaseModel):
+    recipe: Recipe
+    # Share of the recipe's ingredient lines the pantry covers
+    coverage: float
+    matched: int
+    total: int
+    # Ingredient lines the pantry doesn't cover
+    missing: List[str]
@@ -0,0 +1,188 @@
+from array import array
+from collections import Counter, defaultdict
+from functools import partial
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pantry counts fall back to a Counter
+    np = None
+
+from filters import top_k
+from ingredients import ingredient_words, name_words, parsed_ingredients
+from models import Recipe
+from postings import copy_postings, discard_posting, insert_posting, load_postings, new_postings
+from versions import CopyOnWriteList, CopyOnWriteMap
+
+# "Cook with what I have": a pantry item covers every ingredient line whose
+# normalized name ends in it, so "cream" covers "1/2 cup heavy cream" and
+# "chili powder" covers "1 tsp red chili powder". Recipes are ranked by the
+# share of their ingredient lines the pantry covers, then by how many lines,
+# then by rating, then catalog order.
+
+# Searches whose postings number at least 1 / DENSE_SHARE of the slots count
+# them with np.bincount over every slot; smaller ones sort just the postings
+DENSE_SHARE = 8
+
+
+class PantryHit(NamedTuple):
+    recipe: object
+    matched: int  # ingredient lines the pantry covers
+    total: int  # ingredient lines with a name
+
+    @property
+    def coverage(self) -> float:
+        return self.matched / self.total
+
+
+def hit_key(hit: PantryHit) -> Tuple[float, int, float]:
+    """Sort key of a pantry hit, compared descending"""
+    return hit.matched / hit.total, hit.matched, hit.recipe.rating
+
+
+def name_keys(name: str) -> List[str]:
+    """Every word suffix of an ingredient name: the pantry items that cover it"""
+    words = name_words(name)
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def recipe_keys(recipe) -> List[List[str]]:
+    """name_keys of each of the recipe's ingredient lines that has a name"""
+    return [keys for keys in (name_keys(ingredient.name) for ingredient in parsed_ingredients(recipe)) if keys]
+
+
+def pantry_keys(pantry: Iterable[str]) -> List[str]:
+    """Normalized pantry items, minus those another item already covers.
+
+    Two items that both cover a line are suffixes of one another, so after
+    this each line is covered by at most one key and counts add up.
+    """
+    names = {" ".join(words) for words in map(ingredient_words, pantry) if words}
+    return sorted(name for name in names
+                  if not any(other != name and name.endswith(" " + other) for other in names))
+
+
+def covers(keys: Set[str], name: str) -> bool:
+    return any(key in keys for key in name_keys(name))
+
+
+def scan_pantry(recipes: Iterable[Recipe], keys: Sequence[str], complete: bool = False,
+                limit: Optional[int] = None) -> Tuple[int, List[PantryHit]]:
+    """Pantry search by checking every ingredient line of every recipe"""
+    keys = set(keys)
+    hits = []
+    for recipe in recipes:
+        lines = recipe_keys(recipe)
+        matched = sum(1 for suffixes in lines if any(key in keys for key in suffixes))
+        if matched and (not complete or matched == len(lines)):
+            hits.append(PantryHit(recipe, matched, len(lines)))
+    return len(hits), top_k(hits, limit, key=hit_key)
+
+
+class PantryIndex:
+    """Inverted index from ingredient name suffixes to store slots.
+
+    A slot is posted once per ingredient line under each suffix of the line's
+    name, so merging the postings of a pantry's keys and counting each slot's
+    run gives the number of lines the pantry covers; the work is proportional
+    to those postings, not to the catalog. The line count and rating of every
+    slot sit in chunked arrays for ranking, read only for the candidates.
+    """
+
+    def __init__(self):
+        self._postings: CopyOnWriteMap[str, array] = CopyOnWriteMap(new_postings, copy_postings)
+        self._totals: CopyOnWriteList[int] = CopyOnWriteList(partial(array, "I"))
+        self._ratings: CopyOnWriteList[float] = CopyOnWriteList(partial(array, "d"))
+
+    def copy(self) -> "PantryIndex":
+        """Copy that shares posting arrays with this index until either side changes one"""
+        clone = PantryIndex()
+        clone._postings = self._postings.copy()
+        clone._totals = self._totals.copy()
+        clone._ratings = self._ratings.copy()
+        return clone
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        lines = recipe_keys(recipe)
+        for keys in lines:
+            for key in keys:
+                insert_posting(self._postings, key, slot)
+        self._totals.grow(slot + 1, 0)
+        self._ratings.grow(slot + 1, 0.0)
+        self._totals[slot] = len(lines)
+        self._ratings[slot] = recipe.rating
+
+    def load(self, recipes: Sequence[Optional[Recipe]]) -> None:
+        """Index recipes at slots 0, 1, ... of an empty index in bulk; None is a hole"""
+        postings: Dict[str, List[int]] = defaultdict(list)
+        totals = array("I")
+        for slot, recipe in enumerate(recipes):
+            lines = [] if recipe is None else recipe_keys(recipe)
+            for keys in lines:
+                for key in keys:
+                    postings[key].append(slot)
+            totals.append(len(lines))
+        load_postings(self._postings, postings)
+        self._totals.extend(totals)
+        self._ratings.extend(array("d", (0.0 if recipe is None else recipe.rating for recipe in recipes)))
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        for keys in recipe_keys(recipe):
+            for key in keys:
+                discard_posting(self._postings, key, slot)
+        self._totals[slot] = 0
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def search(self, keys: Sequence[str], complete: bool = False,
+               limit: Optional[int] = None) -> Tuple[int, List[Tuple[int, int, int]]]:
+        """Number of slots the keys cover lines of, and the best limit as (slot, matched, total)"""
+        postings = [slots for slots in map(self._postings.get, keys) if slots]
+        if not postings:
+            return 0, []
+        if np is None:
+            counts = Counter()
+            for slots in postings:
+                counts.update(slots)
+            hits = [(slot, matched, self._totals[slot]) for slot, matched in sorted(counts.items())
+                    if not complete or matched == self._totals[slot]]
+            ranked = top_k(hits, limit, key=lambda hit: (hit[1] / hit[2], hit[1], self._ratings[hit[0]]))
+            return len(hits), ranked
+
+        merged = np.concatenate([np.frombuffer(slots.tobytes(), dtype=np.uint32) for slots in postings])
+        if len(merged) * DENSE_SHARE < len(self._totals):
+            # Few postings: sort them and count each slot's run
+            merged.sort()
+            starts = np.flatnonzero(np.concatenate(([True], merged[1:] != merged[:-1])))
+            slots = merged[starts].astype(np.int64)
+            matched = np.diff(np.append(starts, len(merged)))
+        else:
+            # Postings about as many as slots: one count per slot is cheaper than sorting
+            counts = np.bincount(merged, minlength=len(self._totals))
+            slots = counts.nonzero()[0]
+            matched = counts[slots]
+        totals = _gather(self._totals, slots, np.uint32).astype(np.int64)
+        keep = (matched == totals) if complete else (totals > 0)
+        slots, matched, totals = slots[keep], matched[keep], totals[keep]
+        total = len(slots)
+        coverage = matched / totals
+        if limit is not None and limit < total:
+            # Only slots covered at least as well as the limit-th best can make the page
+            keep = coverage >= np.partition(coverage, total - limit)[total - limit]
+            slots, matched, totals, coverage = slots[keep], matched[keep], totals[keep], coverage[keep]
+        ratings = _gather(self._ratings, slots, np.float64)
+        # lexsort sorts by its last key first; slots are ascending, so ties keep catalog order
+        order = np.lexsort((-ratings, -matched, -coverage))[:limit]
+        return total, list(zip(slots[order].tolist(), matched[order].tolist(), totals[order].tolist()))
+
+
+def _gather(column: CopyOnWriteList, slots, dtype):
+    """column[slot] for each of the ascending slots, reading only the chunks they fall in"""
+    chunks = column.chunks()
+    values = np.empty(len(slots), dtype=dtype)
+    bounds = np.searchsorted(slots, np.arange(len(chunks) + 1) * column.CHUNK)
+    for i in np.flatnonzero(np.diff(bounds)).tolist():
+        lo, hi = bounds[i], bounds[i + 1]
+        values[lo:hi] = np.frombuffer(chunks[i], dtype=dtype)[slots[lo:hi] - i * column.CHUNK]
+    return values
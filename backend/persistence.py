@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+from typing import List, Optional
+
+from models import Recipe
+from records import to_recipe
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "snapshot.jsonl"
+LOG_PATTERN = re.compile(r"^wal-(\d+)\.log$")
+
+
+def _log_name(generation: int) -> str:
+    return f"wal-{generation:08d}.log"
+
+
+class _Recovered(dict):
+    """Recipes by id in catalog order, replayed like a store, for an empty store to load() in one go.
+
+    Like the stores, a replace keeps the recipe's place and a delete
+    followed by a put moves it to the end.
+    """
+
+    def add(self, recipe: Recipe) -> None:
+        self[recipe.id] = recipe
+
+    def replace(self, recipe_id: str, recipe: Recipe) -> None:
+        self[recipe_id] = recipe
+
+    def remove(self, recipe_id: str) -> None:
+        del self[recipe_id]
+
+
+def _fsync_dir(path: str) -> None:
+    """Make renames and unlinks in path durable (a no-op where unsupported)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """Append-only JSON-lines log of catalog writes with group commit.
+
+    Records are ["put", recipe] or ["del", recipe_id]. append() only buffers;
+    commit() waits until the record is on disk. Pending records are fsynced
+    together, either as soon as batch_size of them queue up or when the
+    background flusher wakes up after max_delay seconds; the fsync runs in a
+    worker thread so the event loop keeps serving. Writers may append from
+    other threads (sharded stores write in an executor), so appends, flushes
+    and rotation take one lock.
+    """
+
+    def __init__(self, directory: str, generation: int, batch_size: int = 64, max_delay: float = 0.005):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.generation = generation
+        self.records_since_snapshot = 0
+        self._file = open(os.path.join(directory, _log_name(generation)), "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self._synced_future: Optional[asyncio.Future] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    def append(self, record: list) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._written += 1
+            self.records_since_snapshot += 1
+
+    def put(self, recipe: Recipe) -> None:
+        self.append(["put", recipe.model_dump(mode="json")])
+
+    def delete(self, recipe_id: str) -> None:
+        self.append(["del", recipe_id])
+
+    def flush(self) -> None:
+        """fsync everything appended so far"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        # Read before the fsync: a record appended after this isn't covered by it
+        target = self._written
+        if self._synced == target:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._synced = target
+
+    async def _sync(self) -> None:
+        """flush() in a worker thread, then wake up committers; a failed fsync is raised to all of them"""
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as error:
+            waiters, self._synced_future = self._synced_future, None
+            if waiters is not None:
+                waiters.set_exception(error)
+            raise
+        waiters, self._synced_future = self._synced_future, None
+        if waiters is not None:
+            waiters.set_result(None)
+
+    async def commit(self) -> None:
+        """Wait until every record appended so far is durable; raises if the fsync covering them failed"""
+        target = self._written
+        if self._flusher is None or target - self._synced >= self.batch_size:
+            await self._sync()
+        while self._synced < target:
+            if self._synced_future is None:
+                self._synced_future = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._synced_future)
+
+    def rotate(self) -> int:
+        """Seal the current log file and start the next one; returns the new generation"""
+        with self._lock:
+            self._flush_locked()
+            self._file.close()
+            self.generation += 1
+            self.records_since_snapshot = 0
+            self._file = open(os.path.join(self.directory, _log_name(self.generation)), "a", encoding="utf-8")
+            return self.generation
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self._sync()
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.max_delay)
+            try:
+                await self._sync()
+            except Exception:
+                # The committers waiting on this round got the error; keep flushing for later ones
+                logger.exception("write-ahead log fsync failed")
+
+
+class CatalogPersistence:
+    """Snapshots plus write-ahead log that let the in-memory store survive restarts.
+
+    snapshot.jsonl starts with a header naming the first log generation it does
+    not cover, followed by one recipe per line. Recovery loads the snapshot and
+    replays every log from that generation on, ignoring a torn final line left
+    by a crash mid-write; a store with load() gets the result in one bulk
+    load rather than a write per record. Snapshots are written from an immutable catalog
+    version in a worker thread after the log has been rotated, then older logs
+    are deleted. Writers must log inside catalog.write() for the snapshot's
+    version and log generation to line up, and publish the version only
+    once wal.commit() says the log is durable.
+
+    With snapshot_interval=None no snapshots are taken: recovery replays
+    every log over the store as it was opened. The mmap store keeps its
+    writes this way, the logs holding all of them since its file was built.
+    """
+
+    def __init__(self, directory: str, catalog, batch_size: int = 64, max_delay: float = 0.005,
+                 snapshot_interval: Optional[float] = 60.0, snapshot_min_records: int = 1000):
+        self.directory = directory
+        self.catalog = catalog
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_min_records = snapshot_min_records
+        self.wal: Optional[WriteAheadLog] = None
+        self._snapshotter: Optional[asyncio.Task] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _generations(self) -> List[int]:
+        generations = []
+        for name in os.listdir(self.directory):
+            match = LOG_PATTERN.match(name)
+            if match:
+                generations.append(int(match.group(1)))
+        return sorted(generations)
+
+    def recover(self) -> bool:
+        """Load the snapshot and replay the log tail; False if there was nothing on disk"""
+        first_generation = 0
+        found = False
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        # The whole recovery is published as one version
+        with self.catalog.write() as version:
+            store = version.store
+            bulk = hasattr(store, "load") and not len(store)
+            recovered = _Recovered() if bulk else store
+            if os.path.exists(snapshot_path):
+                found = True
+                with open(snapshot_path, encoding="utf-8") as snapshot:
+                    first_generation = json.loads(snapshot.readline())["next_log"]
+                    for line in snapshot:
+                        recovered.add(Recipe.model_validate_json(line))
+
+            generations = [g for g in self._generations() if g >= first_generation]
+            for generation in generations:
+                found = True
+                self._replay(os.path.join(self.directory, _log_name(generation)), recovered)
+            if bulk:
+                store.load(recovered.values())
+
+        # Always append to a fresh log so a torn tail is never extended
+        next_generation = max(generations[-1] + 1 if generations else 0, first_generation)
+        self.wal = WriteAheadLog(self.directory, next_generation, self.batch_size, self.max_delay)
+        return found
+
+    def _replay(self, path: str, store) -> None:
+        with open(path, encoding="utf-8") as log:
+            for line in log:
+                try:
+                    op, value = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash: nothing after it was acknowledged
+                    break
+                if op == "put":
+                    recipe = Recipe.model_validate(value)
+                    if recipe.id in store:
+                        store.replace(recipe.id, recipe)
+                    else:
+                        store.add(recipe)
+                elif op == "del" and value in store:
+                    store.remove(value)
+
+    async def snapshot(self) -> None:
+        """Write a snapshot of the current catalog and drop the logs it covers"""
+        # Holding the writer lock, the head version has exactly the writes
+        # logged before the new generation; it never changes, so no copy is needed
+        with self.catalog.lock:
+            next_log = self.wal.rotate()
+            version = self.catalog.head()
+        await asyncio.to_thread(self._write_snapshot, version.store, next_log)
+        for generation in self._generations():
+            if generation < next_log:
+                os.remove(os.path.join(self.directory, _log_name(generation)))
+        _fsync_dir(self.directory)
+
+    def _write_snapshot(self, recipes, next_log: int) -> None:
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as snapshot:
+            snapshot.write(json.dumps({"next_log": next_log, "recipes": len(recipes)}) + "\n")
+            for recipe in recipes:
+                snapshot.write(to_recipe(recipe).model_dump_json() + "\n")
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(self.directory)
+
+    def start(self) -> None:
+        """Start the group-commit flusher and the periodic snapshot task"""
+        self.wal.start()
+        if self._snapshotter is None and self.snapshot_interval is not None:
+            self._snapshotter = asyncio.get_running_loop().create_task(self._snapshot_loop())
+
+    async def stop(self) -> None:
+        if self._snapshotter is not None:
+            self._snapshotter.cancel()
+            self._snapshotter = None
+        await self.wal.stop()
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self.wal.records_since_snapshot >= self.snapshot_min_records:
+                await self.snapshot()
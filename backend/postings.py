@@ -0,0 +1,164 @@
+"""Posting lists: sorted uint32 slot arrays under keys of a CopyOnWriteMap.
+
+The text, trigram, pantry, similarity and suggestion indexes all file slots
+under keys this way. A list starts out as an array("I") and turns into
+chunked Postings once it outgrows a chunk, so a catalog version copies at
+most a chunk of each list it changes.
+"""
+import sys
+from array import array
+from bisect import bisect_left, insort
+from operator import itemgetter
+from typing import Dict, Hashable, Iterator, List, Set, Union
+
+from versions import CopyOnWriteMap
+
+
+class Postings:
+    """A long posting list: sorted slots as uint32 arrays of at most CHUNK, shared between copies.
+
+    Postings start out as one array, which a catalog version copies whole
+    when it changes them. Past CHUNK slots insert_posting() switches them to
+    this, whose copy() only copies the chunk list; the first write to a
+    shared chunk duplicates just that chunk. Adding a recipe under a key
+    nearly every recipe has so costs a chunk, not the whole list.
+    """
+
+    __slots__ = ("_chunks", "_owned", "_len")
+
+    CHUNK = 1024
+
+    def __init__(self, slots: array):
+        self._chunks: List[array] = [slots[i:i + self.CHUNK] for i in range(0, len(slots), self.CHUNK)]
+        self._owned: Set[int] = set(range(len(self._chunks)))
+        self._len = len(slots)
+
+    def copy(self) -> "Postings":
+        clone = Postings.__new__(Postings)
+        clone._chunks = list(self._chunks)
+        clone._owned = set()
+        clone._len = self._len
+        self._owned = set()
+        return clone
+
+    def _writable_chunk(self, i: int) -> array:
+        if i not in self._owned:
+            self._chunks[i] = self._chunks[i][:]
+            self._owned.add(i)
+        return self._chunks[i]
+
+    def _chunk_of(self, slot: int) -> int:
+        """Index of the chunk slot belongs in"""
+        return min(bisect_left(self._chunks, slot, key=itemgetter(-1)), len(self._chunks) - 1)
+
+    def add(self, slot: int) -> None:
+        self._len += 1
+        if self._chunks[-1][-1] < slot:
+            # New recipes always get the highest slot: append, starting a chunk once the last is full
+            if len(self._chunks[-1]) >= self.CHUNK:
+                self._chunks.append(array("I"))
+                self._owned.add(len(self._chunks) - 1)
+            self._writable_chunk(len(self._chunks) - 1).append(slot)
+            return
+        i = self._chunk_of(slot)
+        chunk = self._writable_chunk(i)
+        insort(chunk, slot)
+        if len(chunk) > self.CHUNK:
+            self._chunks.insert(i + 1, chunk[self.CHUNK // 2:])
+            del chunk[self.CHUNK // 2:]
+            self._owned = {j + (j > i) for j in self._owned} | {i + 1}
+
+    def discard(self, slot: int) -> None:
+        if slot not in self:
+            return
+        i = self._chunk_of(slot)
+        chunk = self._writable_chunk(i)
+        del chunk[bisect_left(chunk, slot)]
+        self._len -= 1
+        if not chunk:
+            del self._chunks[i]
+            self._owned = {j - (j > i) for j in self._owned if j != i}
+
+    def tobytes(self) -> bytes:
+        """The slots as one uint32 buffer, like array.tobytes()"""
+        return b"".join(self._chunks)
+
+    def __contains__(self, slot: int) -> bool:
+        if not self._chunks:
+            return False
+        chunk = self._chunks[self._chunk_of(slot)]
+        i = bisect_left(chunk, slot)
+        return i < len(chunk) and chunk[i] == slot
+
+    def __iter__(self) -> Iterator[int]:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sys.getsizeof(self._chunks) + sum(map(sys.getsizeof, self._chunks))
+
+
+def new_postings() -> array:
+    return array("I")
+
+
+def copy_postings(postings: Union[array, Postings]) -> Union[array, Postings]:
+    return postings[:] if isinstance(postings, array) else postings.copy()
+
+
+def as_array(postings: Union[array, Postings]) -> array:
+    """The slots of postings as one uint32 array"""
+    if isinstance(postings, array):
+        return postings
+    slots = array("I")
+    slots.frombytes(postings.tobytes())
+    return slots
+
+
+def insert_posting(index: CopyOnWriteMap, key, slot: int) -> None:
+    """Add slot to the postings under key"""
+    postings = index.writable(key)
+    if isinstance(postings, Postings):
+        postings.add(slot)
+    elif len(postings) >= Postings.CHUNK:
+        postings = index[key] = Postings(postings)
+        postings.add(slot)
+    elif not postings or postings[-1] < slot:
+        # New recipes always get the highest slot
+        postings.append(slot)
+    else:
+        insort(postings, slot)
+
+
+def load_postings(index: CopyOnWriteMap, postings: Dict[Hashable, List[int]]) -> None:
+    """Store postings collected in bulk, each a list of ascending slots, in an empty index.
+
+    Each list is frozen into an array, or Postings chunks if it is longer
+    than a chunk, once, rather than growing by insert_posting() a slot at a time.
+    """
+    for key, slots in postings.items():
+        slots = array("I", slots)
+        index[key] = Postings(slots) if len(slots) > Postings.CHUNK else slots
+
+
+def discard_posting(index: CopyOnWriteMap, key, slot: int) -> None:
+    """Drop slot from the postings under key, and the key once they are empty"""
+    postings = index.get(key)
+    if postings is None:
+        return
+    if isinstance(postings, Postings):
+        if slot not in postings:
+            return
+        postings = index.writable(key)
+        postings.discard(slot)
+    else:
+        i = bisect_left(postings, slot)
+        if i == len(postings) or postings[i] != slot:
+            return
+        postings = index.writable(key)
+        del postings[i]
+    if not postings:
+        index.pop(key)
@@ -0,0 +1,209 @@
+"""Search query plans.
+
+With syntax=literal (the default) the search parameter is one substring,
+matched against every searchable field. With syntax=query it is parsed:
+
+    chicken curry          both terms (AND)
+    paneer OR tofu         either term; OR binds tighter than AND
+    "butter chicken"       a phrase, matched as one substring
+    -spicy                 recipes without the term
+    title:dal              only in that field: title, tag, ingredient, author
+
+Terms keep the substring semantics of literal search. A query with no term
+outside a negation ("OR", '""', "-spicy") searches for nothing and matches
+nothing; the API rejects it. A plan narrows the
+store's slots through the indexes first (intersecting the postings of AND
+terms, uniting those of OR terms) and then checks each candidate, which is
+where negations are applied.
+"""
+import re
+from functools import lru_cache
+from typing import Callable, List, NamedTuple, Optional, Tuple, Union
+
+from filters import matches_search, relevance_tier
+from models import Recipe, RecipeFilter
+
+
+class Term(NamedTuple):
+    field: Optional[str]  # None searches every field
+    text: str  # lowercased
+
+
+class And(NamedTuple):
+    parts: tuple
+
+
+class Or(NamedTuple):
+    parts: tuple
+
+
+class Not(NamedTuple):
+    part: "Plan"
+
+
+Plan = Union[Term, And, Or, Not]
+
+# The plan of a query without positive terms
+NOTHING = Or(())
+
+FIELD_ALIASES = {
+    "title": "title", "author": "author",
+    "tag": "tags", "tags": "tags",
+    "ingredient": "ingredients", "ingredients": "ingredients",
+}
+
+_FIELD_MATCHERS = {
+    "title": lambda recipe, text: text in recipe.title.lower(),
+    "author": lambda recipe, text: text in recipe.author.lower(),
+    "tags": lambda recipe, text: any(text in tag.lower() for tag in recipe.tags),
+    "ingredients": lambda recipe, text: any(text in ingredient.lower() for ingredient in recipe.ingredients),
+}
+
+_TOKEN_RE = re.compile(r'(-?)(?:(\w+):)?(?:"([^"]*)"?|([^\s"]+))')
+
+
+def parse(text: str) -> Plan:
+    """Parse the query syntax into a plan; anything unrecognized is a plain term"""
+    groups: List[List[Plan]] = []
+    pending_or = False
+    for match in _TOKEN_RE.finditer(text):
+        negate, field, phrase, word = match.groups()
+        if not negate and not field and word == "OR":
+            pending_or = bool(groups)
+            continue
+        value = phrase if phrase is not None else word
+        if field is not None and field.lower() not in FIELD_ALIASES:
+            # Not a field we know: the colon is part of the term
+            value = f"{field}:{value}"
+            field = None
+        if not value:
+            continue
+        node: Plan = Term(FIELD_ALIASES[field.lower()] if field else None, value.lower())
+        if negate:
+            node = Not(node)
+        if pending_or:
+            groups[-1].append(node)
+        else:
+            groups.append([node])
+        pending_or = False
+
+    parts = [group[0] if len(group) == 1 else Or(tuple(group)) for group in groups]
+    plan = parts[0] if len(parts) == 1 else And(tuple(parts))
+    return plan if positive_terms(plan) else NOTHING
+
+
+def matches(plan: Plan, recipe: Recipe) -> bool:
+    if isinstance(plan, Term):
+        if plan.field is None:
+            return matches_search(recipe, plan.text)
+        return _FIELD_MATCHERS[plan.field](recipe, plan.text)
+    if isinstance(plan, And):
+        return all(matches(part, recipe) for part in plan.parts)
+    if isinstance(plan, Or):
+        return any(matches(part, recipe) for part in plan.parts)
+    return not matches(plan.part, recipe)
+
+
+def positive_terms(plan: Plan) -> List[Term]:
+    """Terms a match is ranked on: everything outside a negation"""
+    if isinstance(plan, Term):
+        return [plan]
+    if isinstance(plan, Not):
+        return []
+    return [term for part in plan.parts for term in positive_terms(part)]
+
+
+def required_terms(plan: Plan) -> List[Term]:
+    """Terms every match contains somewhere in its searchable text"""
+    if isinstance(plan, Term):
+        return [plan]
+    if isinstance(plan, And):
+        return [part for part in plan.parts if isinstance(part, Term)]
+    return []
+
+
+def excluded_parts(plan: Plan) -> List[Plan]:
+    """Negated parts no match may contain"""
+    if isinstance(plan, Not):
+        return [plan.part]
+    if isinstance(plan, And):
+        return [part.part for part in plan.parts if isinstance(part, Not)]
+    return []
+
+
+def candidates(plan: Plan, lookup: Callable[[str], Optional[int]]) -> Optional[int]:
+    """Bitmask of a superset of the slots matching plan from lookup's postings, or None for every slot"""
+    if isinstance(plan, Term):
+        # Field-scoped terms still occur in the recipe's searchable text
+        return lookup(plan.text)
+    if isinstance(plan, And):
+        result = None
+        # Most selective terms first, so later intersections are small
+        for part in sorted(plan.parts, key=lambda part: -len(getattr(part, "text", ""))):
+            if isinstance(part, Not):
+                continue
+            slots = candidates(part, lookup)
+            if slots is not None:
+                result = slots if result is None else result & slots
+                if not result:
+                    break
+        return result
+    if isinstance(plan, Or):
+        result = 0
+        for part in plan.parts:
+            slots = candidates(part, lookup)
+            if slots is None:
+                return None
+            result |= slots
+        return result
+    return None
+
+
+class SearchQuery:
+    """A compiled search: its plan, and how results for it are matched and ranked"""
+
+    __slots__ = ("plan", "terms", "ranking_text")
+
+    def __init__(self, plan: Plan):
+        self.plan = plan
+        self.terms: Tuple[str, ...] = tuple(dict.fromkeys(term.text for term in positive_terms(plan)))
+        # BM25 scores the words of the positive terms
+        self.ranking_text = " ".join(self.terms)
+
+    def matches(self, recipe: Recipe) -> bool:
+        return matches(self.plan, recipe)
+
+    def tier(self, recipe: Recipe) -> int:
+        """relevance_tier of the best positive term"""
+        return max((relevance_tier(recipe, term) for term in self.terms), default=0)
+
+    def excludes(self, recipe: Recipe) -> bool:
+        """Whether recipe contains something the query rules out (-term), matching or not"""
+        return any(matches(part, recipe) for part in excluded_parts(self.plan))
+
+    def key(self, recipe: Recipe) -> Tuple[int, float]:
+        """Sort key for search results, like filters.relevance_key"""
+        return self.tier(recipe), recipe.rating
+
+    def candidates(self, lookup: Callable[[str], Optional[int]]) -> Optional[int]:
+        return candidates(self.plan, lookup)
+
+    def required(self) -> List[str]:
+        return [term.text for term in required_terms(self.plan)]
+
+
+@lru_cache(maxsize=1024)
+def _compile(search: str, syntax: str) -> SearchQuery:
+    if syntax == "query":
+        return SearchQuery(parse(search))
+    query = SearchQuery(Term(None, search.lower()))
+    # Literal searches rank with BM25 on the text as typed
+    query.ranking_text = search
+    return query
+
+
+def compile_search(filters: RecipeFilter) -> Optional[SearchQuery]:
+    """The compiled (and cached) search of filters, or None when there is no search term"""
+    if not filters.search:
+        return None
+    return _compile(filters.search, filters.syntax or "literal")
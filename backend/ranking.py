@@ -0,0 +1,172 @@
+import math
+from array import array
+from functools import partial
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from filters import SORT_KEYS, Cursor, follows, top_k
+from models import Recipe, RecipeFilter
+from query import compile_search
+from search_index import tokenize
+from versions import CopyOnWriteList
+
+# BM25F: each field's term frequency is normalized by that field's length and
+# weighted before saturation, so a hit in a short title beats one buried in a
+# long ingredient list
+FIELDS = ("title", "description", "author", "tags", "ingredients")
+FIELD_WEIGHTS = (3.0, 1.0, 1.0, 2.0, 1.0)
+K1 = 1.2
+B = 0.75
+
+
+def field_texts(recipe: Recipe) -> Tuple[str, ...]:
+    """Lowercased text of each ranked field, in FIELDS order"""
+    return (
+        recipe.title.lower(),
+        recipe.description.lower(),
+        recipe.author.lower(),
+        "\n".join(recipe.tags).lower(),
+        "\n".join(recipe.ingredients).lower(),
+    )
+
+
+def field_lengths(recipe: Recipe) -> Tuple[int, ...]:
+    """Word-token count of each ranked field"""
+    return tuple(len(tokenize(text)) for text in field_texts(recipe))
+
+
+class FieldLengths:
+    """Per-slot field lengths and their running totals, for BM25 length normalization"""
+
+    def __init__(self):
+        self._lengths: List[CopyOnWriteList[int]] = [CopyOnWriteList(partial(array, "I")) for _ in FIELDS]
+        self.totals = [0] * len(FIELDS)
+        self.count = 0
+
+    def copy(self) -> "FieldLengths":
+        clone = FieldLengths()
+        clone._lengths = [lengths.copy() for lengths in self._lengths]
+        clone.totals = list(self.totals)
+        clone.count = self.count
+        return clone
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        for i, length in enumerate(field_lengths(recipe)):
+            lengths = self._lengths[i]
+            lengths.grow(slot + 1, 0)
+            lengths[slot] = length
+            self.totals[i] += length
+        self.count += 1
+
+    def load(self, recipes: Sequence[Optional[Recipe]]) -> None:
+        """Lengths of recipes at slots 0, 1, ... of an empty index, a column at a time; None is a hole"""
+        holes = (0,) * len(FIELDS)
+        rows = [holes if recipe is None else field_lengths(recipe) for recipe in recipes]
+        for i, lengths in enumerate(self._lengths):
+            column = array("I", (row[i] for row in rows))
+            lengths.extend(column)
+            self.totals[i] += sum(column)
+        self.count += sum(recipe is not None for recipe in recipes)
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        for i, lengths in enumerate(self._lengths):
+            self.totals[i] -= lengths[slot]
+            lengths[slot] = 0
+        self.count -= 1
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def get(self, slot: int) -> Tuple[int, ...]:
+        return tuple(lengths[slot] for lengths in self._lengths)
+
+    def averages(self) -> List[float]:
+        return [total / self.count if self.count else 0.0 for total in self.totals]
+
+
+class BM25:
+    """Scores documents against one query, given the corpus statistics.
+
+    Terms are the query's word tokens. Search matches substrings, so a term's
+    frequency in a field is the number of times it occurs there ("chick"
+    counts in "chickpeas"), and its document frequency is the number of
+    recipes containing it anywhere.
+    """
+
+    def __init__(self, query: str, document_count: int, document_frequency: Callable[[str], int],
+                 average_lengths: Sequence[float]):
+        self.idf: Dict[str, float] = {}
+        for term in dict.fromkeys(tokenize(query)):
+            df = document_frequency(term)
+            self.idf[term] = math.log(1 + (document_count - df + 0.5) / (df + 0.5))
+        # Empty fields everywhere (average 0) can't contribute, so any divisor works
+        self._norms = [(weight, average or 1.0) for weight, average in zip(FIELD_WEIGHTS, average_lengths)]
+
+    def score(self, recipe: Recipe, lengths: Sequence[int]) -> float:
+        texts = field_texts(recipe)
+        total = 0.0
+        for term, idf in self.idf.items():
+            tf = 0.0
+            for text, length, (weight, average) in zip(texts, lengths, self._norms):
+                count = text.count(term)
+                if count:
+                    tf += weight * count / (1 - B + B * length / average)
+            if tf:
+                total += idf * tf / (K1 + tf)
+        return total
+
+
+def scan_statistics(recipes: Iterable[Recipe], query: str) -> Tuple[int, Dict[str, int], List[float]]:
+    """Recipe count, document frequencies of the query's terms and average field lengths, by scanning"""
+    terms = list(dict.fromkeys(tokenize(query)))
+    frequencies = dict.fromkeys(terms, 0)
+    totals = [0] * len(FIELDS)
+    count = 0
+    for recipe in recipes:
+        count += 1
+        texts = field_texts(recipe)
+        for i, text in enumerate(texts):
+            totals[i] += len(tokenize(text))
+        for term in terms:
+            if any(term in text for text in texts):
+                frequencies[term] += 1
+    averages = [total / count if count else 0.0 for total in totals]
+    return count, frequencies, averages
+
+
+def scan_bm25(recipes: Iterable[Recipe], query: str) -> BM25:
+    """A BM25 scorer with statistics gathered by scanning every recipe"""
+    count, frequencies, averages = scan_statistics(recipes, query)
+    return BM25(query, count, frequencies.__getitem__, averages)
+
+
+def rank_bm25(recipes: List[Recipe], scorer: BM25, limit: Optional[int] = None,
+              cursor: Optional[Cursor] = None) -> List[Tuple[float, Recipe]]:
+    """The best limit recipes paired with their scores, best first; ties keep their order.
+
+    With a cursor, whose position is an index into recipes, only recipes
+    ordering after it are ranked.
+    """
+    scored = [(scorer.score(recipe, field_lengths(recipe)), recipe) for recipe in recipes]
+    if cursor is not None:
+        scored = [pair for index, pair in enumerate(scored) if follows((pair[0],), index, cursor)]
+    return top_k(scored, limit, key=itemgetter(0))
+
+
+def sort_key(recipe: Recipe, filters: RecipeFilter, scorer=None) -> tuple:
+    """Where recipe sorts among the results for filters, compared descending.
+
+    An explicit sort keys on its field (filters.SORT_KEYS). Otherwise
+    browsing has no key (catalog order), BM25 and hybrid rank by score and
+    need the query's scorer (BM25 or vectors.HybridScorer), and search
+    otherwise ranks by relevance (SearchQuery.key).
+    """
+    if filters.sort in SORT_KEYS:
+        return SORT_KEYS[filters.sort](recipe)
+    if not filters.search:
+        return ()
+    if filters.rank == "bm25":
+        return (scorer.score(recipe, field_lengths(recipe)),)
+    if filters.rank == "hybrid":
+        return (scorer.score(recipe),)
+    return compile_search(filters).key(recipe)
@@ -0,0 +1,77 @@
+import sys
+from datetime import datetime
+from typing import Optional, Tuple
+
+from ingredients import Ingredient, parse_ingredients
+from models import Recipe
+
+
+class RecipeRecord:
+    """Compact internal form of a Recipe, used for storage in RecipeStore.
+
+    A pydantic model carries a __dict__, validation bookkeeping and a separate
+    list per list field. Records use __slots__, store the list fields as
+    tuples, and intern the strings that repeat across the catalog
+    (category, difficulty, author and tags). Ingredient lines are parsed
+    once here (parsed_ingredients); equal lines share one parse. Convert back
+    with to_recipe() at the API boundary.
+    """
+
+    FIELDS = ("id", "title", "description", "image", "category", "difficulty",
+              "cookingTime", "servings", "ingredients", "instructions", "tags",
+              "rating", "author", "createdAt", "isFavorite")
+    __slots__ = FIELDS + ("parsed_ingredients",)
+
+    def __init__(self, id: str, title: str, description: str, image: str, category: str,
+                 difficulty: str, cookingTime: int, servings: int, ingredients: Tuple[str, ...],
+                 instructions: Tuple[str, ...], tags: Tuple[str, ...], rating: float, author: str,
+                 createdAt: datetime, isFavorite: Optional[bool]):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.image = image
+        self.category = sys.intern(category)
+        self.difficulty = sys.intern(difficulty)
+        self.cookingTime = cookingTime
+        self.servings = servings
+        self.ingredients = tuple(ingredients)
+        self.parsed_ingredients: Tuple[Ingredient, ...] = parse_ingredients(self.ingredients)
+        self.instructions = tuple(instructions)
+        self.tags = tuple(sys.intern(tag) for tag in tags)
+        self.rating = rating
+        self.author = sys.intern(author)
+        self.createdAt = createdAt
+        self.isFavorite = isFavorite
+
+    def __reduce__(self):
+        # Pickled positionally, so a worker process interns the strings again
+        return RecipeRecord, tuple(getattr(self, field) for field in self.FIELDS)
+
+    @classmethod
+    def from_recipe(cls, recipe: Recipe) -> "RecipeRecord":
+        return cls(*(getattr(recipe, field) for field in cls.FIELDS))
+
+    def to_recipe(self) -> Recipe:
+        # Every field already passed validation on the way in
+        return Recipe.model_construct(
+            id=self.id,
+            title=self.title,
+            description=self.description,
+            image=self.image,
+            category=self.category,
+            difficulty=self.difficulty,
+            cookingTime=self.cookingTime,
+            servings=self.servings,
+            ingredients=list(self.ingredients),
+            instructions=list(self.instructions),
+            tags=list(self.tags),
+            rating=self.rating,
+            author=self.author,
+            createdAt=self.createdAt,
+            isFavorite=self.isFavorite,
+        )
+
+
+def to_recipe(recipe) -> Recipe:
+    """The pydantic Recipe for anything a store hands out"""
+    return recipe if isinstance(recipe, Recipe) else recipe.to_recipe()
@@ -0,0 +1,272 @@
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from filters import SORT_KEYS, matches_facets, timestamp
+from models import Recipe, RecipeFilter
+from query import compile_search
+
+
+def cache_key(filters: RecipeFilter) -> tuple:
+    """Filters that always return the same results share a key"""
+    query = compile_search(filters)
+    sort = filters.sort if filters.sort in SORT_KEYS else "relevance"
+    # Without a search term the results are in catalog order whatever rank says, and an explicit sort overrides it
+    rank = filters.rank if query and sort == "relevance" else "relevance"
+    # BM25 and hybrid rank on the words of the positive terms, so their spelling counts too
+    ranking = query.ranking_text if query and rank in ("bm25", "hybrid") else None
+    created = tuple(None if when is None else timestamp(when) for when in (filters.createdFrom, filters.createdBefore))
+    return (query and query.plan, ranking, filters.category, filters.difficulty, filters.maxTime, filters.minRating,
+            filters.minServings, filters.maxServings, created, sort, rank)
+
+
+def _sort_keys(values: Sequence) -> Union[array, list]:
+    """Sort values packed as doubles or int64s when they all fit one, else a list: doubles round ints past 2**53"""
+    if all(type(value) is float for value in values):
+        return array("d", values)
+    try:
+        return array("q", values)
+    except (OverflowError, TypeError):
+        return list(values)
+
+
+class _Entry:
+    """The first matching ids of one filter in result order, and how many match in all.
+
+    Relevance entries also keep each result's (tier, rating), and entries of
+    an explicit sort each result's sort value, so writes can find the sort
+    position of a recipe by binary search.
+    """
+
+    __slots__ = ("filters", "query", "by", "total", "ids", "tiers", "ratings", "keys")
+
+    def __init__(self, filters: RecipeFilter, total: int, recipes: List):
+        self.filters = filters
+        self.query = compile_search(filters)
+        self.by = SORT_KEYS.get(filters.sort)
+        self.total = total
+        self.ids = [recipe.id for recipe in recipes]
+        self.tiers = self.ratings = self.keys = None
+        if self.by is not None:
+            self.keys = _sort_keys([self.by(recipe)[0] for recipe in recipes])
+        elif self.query and filters.rank not in ("bm25", "hybrid"):
+            keys = [self.query.key(recipe) for recipe in recipes]
+            self.tiers = array("b", (tier for tier, _ in keys))
+            self.ratings = array("d", (rating for _, rating in keys))
+
+    def matches(self, recipe) -> bool:
+        return matches_facets(recipe, self.filters) and (self.query is None or self.query.matches(recipe))
+
+    def sort_key(self, recipe) -> tuple:
+        if self.keys is not None:
+            return self.by(recipe)
+        return () if self.tiers is None else self.query.key(recipe)
+
+    def _range(self, recipe) -> Tuple[int, int]:
+        """Indexes of the results that share recipe's sort key (everything when browsing)"""
+        if self.keys is not None:
+            target = (-self.by(recipe)[0],)
+
+            def key(i: int) -> tuple:
+                return -self.keys[i],
+        elif self.tiers is not None:
+            tier, rating = self.sort_key(recipe)
+            target = (-tier, -rating)
+
+            def key(i: int) -> tuple:
+                return -self.tiers[i], -self.ratings[i]
+        else:
+            return 0, len(self.ids)
+        indexes = range(len(self.ids))
+        return bisect_left(indexes, target, key=key), bisect_right(indexes, target, key=key)
+
+    def covers(self, limit: Optional[int]) -> bool:
+        """Whether the ids hold the first limit results"""
+        return len(self.ids) == self.total or (limit is not None and limit <= len(self.ids))
+
+    def insert(self, recipe, position: Optional[Callable[[str], int]] = None) -> bool:
+        """Splice recipe in after its equals, or among them by catalog position if given.
+
+        False if it lands past the ids held, which then stay the first results.
+        """
+        self.total += 1
+        lo, hi = self._range(recipe)
+        if position is not None:
+            at = position(recipe.id)
+            hi = bisect_right(range(lo, hi), at, key=lambda i: position(self.ids[i])) + lo
+        if hi == len(self.ids) and len(self.ids) < self.total - 1:
+            return False
+        self.ids.insert(hi, recipe.id)
+        if self.keys is not None:
+            value = self.by(recipe)[0]
+            if isinstance(self.keys, array) and getattr(_sort_keys([value]), "typecode", None) != self.keys.typecode:
+                # Doesn't pack like the others: keep them exact in a list from now on
+                self.keys = list(self.keys)
+            self.keys.insert(hi, value)
+        elif self.tiers is not None:
+            tier, rating = self.sort_key(recipe)
+            self.tiers.insert(hi, tier)
+            self.ratings.insert(hi, rating)
+        return True
+
+    def remove(self, recipe) -> bool:
+        """Take recipe out; False if it was past the ids held"""
+        self.total -= 1
+        lo, hi = self._range(recipe)
+        try:
+            i = self.ids.index(recipe.id, lo, hi)
+        except ValueError:
+            return False
+        del self.ids[i]
+        if self.keys is not None:
+            del self.keys[i]
+        elif self.tiers is not None:
+            del self.tiers[i]
+            del self.ratings[i]
+        return True
+
+    def __sizeof__(self) -> int:
+        size = object.__sizeof__(self) + sys.getsizeof(self.ids)
+        if self.keys is not None:
+            size += sys.getsizeof(self.keys)
+        if self.tiers is not None:
+            size += sys.getsizeof(self.tiers) + sys.getsizeof(self.ratings)
+        return size
+
+
+class ResultCache:
+    """LRU cache of /recipes results that writes patch instead of flushing.
+
+    Each entry holds the first matching ids for one normalized filter in
+    result order, FILL times as many as the request that filled it asked
+    for, so that page and the next few are slices of it. A request for
+    more than it holds refills it. Cursor requests bypass the cache: the
+    stores seek straight to the cursor, which a list of ids can't.
+
+    Added, removed and replaced recipes are tested against each entry's
+    filter and spliced in or out at their sort position, or just counted
+    when that is past the ids held. BM25 and hybrid entries are dropped on
+    writes instead: every write moves the corpus statistics all scores
+    depend on.
+
+    The entries describe one store, that of the catalog's head version or
+    of the draft being written. Lookups from any other version miss, and a
+    store that changed without telling the cache (a discarded draft, a
+    recovery) empties it on the next fill. Ids are shared with the
+    recipes, so memory_bytes counts the lists and key arrays only.
+    """
+
+    # Entries hold this many times the results of the request that filled them
+    FILL = 4
+
+    def __init__(self, catalog, max_entries: int = 256, max_ids: int = 2_000_000):
+        self.catalog = catalog
+        self.max_entries = max_entries
+        self.max_ids = max_ids
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._store = None
+        self._ids = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.patches = 0
+
+    def search(self, store, filters: RecipeFilter, limit: Optional[int], after: Optional[str],
+               compute: Callable[[Optional[int]], Tuple[int, List]],
+               count: bool = True) -> Optional[Tuple[int, List[str]]]:
+        """Total and page ids like store.search(), filling the entry with compute() on a miss.
+
+        compute(limit) returns the total and the first limit results in
+        order, all of them for None. None means the cache can't answer (a
+        cursor request, an older version, or a miss with count=False, as an
+        entry needs the total); ask the store instead.
+        """
+        if after is not None:
+            return None
+        key = cache_key(filters)
+        with self._lock:
+            entry = self._entries.get(key) if self._store is store else None
+            if entry is not None and entry.covers(limit):
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.total, entry.ids[:limit]
+            self.misses += 1
+            if not count or store is not self.catalog.head().store:
+                return None
+        entry = _Entry(filters, *compute(None if limit is None else limit * self.FILL))
+        with self._lock:
+            if store is not self.catalog.head().store:
+                return None
+            if self._store is not store:
+                self._clear()
+                self._store = store
+            if len(entry.ids) <= self.max_ids:
+                self._put(key, entry)
+            return entry.total, entry.ids[:limit]
+
+    def _put(self, key: tuple, entry: _Entry) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._ids -= len(old.ids)
+        self._entries[key] = entry
+        self._ids += len(entry.ids)
+        while len(self._entries) > self.max_entries or self._ids > self.max_ids:
+            _, evicted = self._entries.popitem(last=False)
+            self._ids -= len(evicted.ids)
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._ids = 0
+
+    def _patch(self, store) -> List[_Entry]:
+        """Entries to patch for a write to store, which must be the head version's or its draft's"""
+        if self._store is not store:
+            if self._store is not self.catalog.head().store:
+                self._clear()
+            self._store = store
+        self.patches += 1
+        for key in [key for key in self._entries if key[-1] in ("bm25", "hybrid")]:
+            self._ids -= len(self._entries.pop(key).ids)
+        return list(self._entries.values())
+
+    def added(self, store, recipe: Recipe) -> None:
+        """recipe was appended to store: it goes after every equal result"""
+        with self._lock:
+            for entry in self._patch(store):
+                if entry.matches(recipe):
+                    self._ids += entry.insert(recipe)
+
+    def removed(self, store, recipe) -> None:
+        with self._lock:
+            for entry in self._patch(store):
+                if entry.matches(recipe):
+                    self._ids -= entry.remove(recipe)
+
+    def replaced(self, store, old, new: Recipe) -> None:
+        """old was swapped for new in place: new keeps its catalog position"""
+        with self._lock:
+            for entry in self._patch(store):
+                was, now = entry.matches(old), entry.matches(new)
+                if was and now and entry.sort_key(old) == entry.sort_key(new):
+                    continue
+                if was:
+                    self._ids -= entry.remove(old)
+                if now:
+                    self._ids += entry.insert(new, store.position)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ids": self._ids,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "patches": self.patches,
+                "memory_bytes": sys.getsizeof(self._entries) + sum(
+                    sys.getsizeof(entry) for entry in self._entries.values()),
+            }
@@ -0,0 +1,261 @@
+import re
+import sys
+from array import array
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from bitset import mask_of
+from models import Recipe
+from postings import as_array, copy_postings, discard_posting, insert_posting, load_postings, new_postings
+from versions import CopyOnWriteDict, CopyOnWriteList, CopyOnWriteMap
+
+TOKEN_RE = re.compile(r"\w+")
+# TokenIndex looks tokens up by each of their substrings up to this long
+SHORT_SUBSTRING = 3
+
+
+def searchable_text(recipe: Recipe) -> List[str]:
+    """The recipe fields the free-text search matches against"""
+    return [recipe.title, recipe.description, recipe.author, *recipe.tags, *recipe.ingredients]
+
+
+def title_text(recipe: Recipe) -> List[str]:
+    """The field a title-tier search hit matches in (filters.relevance_tier)"""
+    return [recipe.title]
+
+
+def tag_text(recipe: Recipe) -> List[str]:
+    """The fields a tag-tier search hit matches in"""
+    return list(recipe.tags)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class TokenIndex:
+    """Inverted index from lowercased word tokens to store slots.
+
+    The search endpoint matches substrings, so a query token may sit anywhere
+    inside an indexed token ("chick" in "chickpeas"). Candidates are the slots
+    holding any vocabulary token that contains the query token, intersected
+    across query tokens. That is always a superset of the real matches; the
+    caller still runs the substring check on each candidate. Candidates come
+    back as a bitmask of slots: unions and intersections of postings are then
+    C-level operations on ints rather than set building. Postings are
+    sorted uint32 arrays, chunked once long (see postings.Postings), so a catalog
+    version copies at most a chunk of each list it changes.
+
+    The vocabulary tokens containing a query token are found through a
+    second index from every substring of up to three characters of a token
+    to the token's id: a short query token is one lookup, a longer one
+    intersects its trigrams and checks the tokens left. Lookups so cost what
+    they match, not the size of the vocabulary.
+    """
+
+    def __init__(self):
+        self._postings: CopyOnWriteMap[str, array] = CopyOnWriteMap(new_postings, copy_postings)
+        self._ids: CopyOnWriteDict[str, int] = CopyOnWriteDict()
+        # Indexed by id; None once the token is gone. Ids aren't reused, so postings stay appends
+        self._tokens: CopyOnWriteList[Optional[str]] = CopyOnWriteList()
+        self._grams: CopyOnWriteMap[str, array] = CopyOnWriteMap(new_postings, copy_postings)
+
+    def copy(self) -> "TokenIndex":
+        """Copy that shares posting arrays with this index until either side changes one"""
+        clone = TokenIndex()
+        clone._postings = self._postings.copy()
+        clone._ids = self._ids.copy()
+        clone._tokens = self._tokens.copy()
+        clone._grams = self._grams.copy()
+        return clone
+
+    def _tokens_of(self, recipe: Recipe) -> Set[str]:
+        tokens = set()
+        for text in searchable_text(recipe):
+            tokens.update(tokenize(text))
+        return tokens
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        for token in self._tokens_of(recipe):
+            if token not in self._postings:
+                self._learn(token)
+            insert_posting(self._postings, token, slot)
+
+    def load(self, recipes: Sequence[Optional[Recipe]]) -> None:
+        """Index recipes at slots 0, 1, ... of an empty index in bulk; None is a hole"""
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for slot, recipe in enumerate(recipes):
+            if recipe is None:
+                continue
+            for token in self._tokens_of(recipe):
+                postings[token].append(slot)
+        load_postings(self._postings, postings)
+        grams: Dict[str, List[int]] = defaultdict(list)
+        for token_id, token in enumerate(postings):
+            self._ids[token] = token_id
+            for gram in short_substrings(token):
+                grams[gram].append(token_id)
+        self._tokens.extend(list(postings))
+        load_postings(self._grams, grams)
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        for token in self._tokens_of(recipe):
+            discard_posting(self._postings, token, slot)
+            if token not in self._postings and token in self._ids:
+                self._forget(token)
+
+    def _learn(self, token: str) -> None:
+        token_id = len(self._tokens)
+        self._tokens.append(token)
+        self._ids[token] = token_id
+        for gram in short_substrings(token):
+            insert_posting(self._grams, gram, token_id)
+
+    def _forget(self, token: str) -> None:
+        token_id = self._ids.pop(token)
+        self._tokens[token_id] = None
+        for gram in short_substrings(token):
+            discard_posting(self._grams, gram, token_id)
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def _containing(self, text: str) -> List[str]:
+        """Vocabulary tokens that contain text"""
+        if len(text) <= SHORT_SUBSTRING:
+            return [self._tokens[token_id] for token_id in self._grams.get(text, ())]
+        lists = []
+        for gram in trigrams(text):
+            ids = self._grams.get(gram)
+            if ids is None:
+                return []
+            lists.append(ids)
+        lists.sort(key=len)
+        ids = set(lists[0]).intersection(*lists[1:])
+        return [token for token in map(self._tokens.__getitem__, ids) if text in token]
+
+    def _matching(self, query_token: str) -> int:
+        """Bitmask of the slots holding a token that contains query_token"""
+        slots = array("I")
+        for token in self._containing(query_token):
+            slots.extend(as_array(self._postings[token]))
+        return mask_of(slots)
+
+    def count(self, token: str) -> int:
+        """Number of recipes with exactly this token"""
+        return len(self._postings.get(token, ()))
+
+    def contains(self, text: str) -> bool:
+        """Whether some indexed token contains text"""
+        if len(text) <= SHORT_SUBSTRING:
+            return text in self._grams
+        return text in self._postings or bool(self._containing(text))
+
+    def document_frequency(self, query_token: str) -> int:
+        """Number of recipes with query_token somewhere in their searchable text"""
+        return self._matching(query_token).bit_count()
+
+    def candidates(self, query: str) -> Optional[int]:
+        """Bitmask of the slots that may contain query, or None if the query has no word tokens"""
+        query_tokens = set(tokenize(query))
+        if not query_tokens:
+            return None
+
+        result: Optional[int] = None
+        # Longest tokens first: they are the most selective
+        for token in sorted(query_tokens, key=len, reverse=True):
+            slots = self._matching(token)
+            result = slots if result is None else result & slots
+            if not result:
+                break
+        return result
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def short_substrings(text: str) -> Set[str]:
+    """Every substring of text of one to SHORT_SUBSTRING characters"""
+    return {text[i:i + n] for n in range(1, SHORT_SUBSTRING + 1) for i in range(len(text) - n + 1)}
+
+
+class TrigramIndex:
+    """Character-trigram index over the lowercased searchable fields.
+
+    Every substring of three or more characters has all of its trigrams in the
+    field it came from, so intersecting the query's trigram postings gives a
+    candidate set that keeps the endpoint's substring semantics. Postings are
+    sorted uint32 arrays, which is a fraction of the memory of int sets, and
+    are intersected as bitmasks.
+    fields picks the texts indexed: every searchable field by default, or
+    e.g. just the title for finding the slots a search ranks first.
+    """
+
+    # Shorter queries have no trigrams; callers fall back to TokenIndex
+    MIN_QUERY = 3
+
+    def __init__(self, fields: Callable[[Recipe], List[str]] = searchable_text):
+        self.fields = fields
+        self._postings: CopyOnWriteMap[str, array] = CopyOnWriteMap(new_postings, copy_postings)
+
+    def copy(self) -> "TrigramIndex":
+        """Copy that shares posting arrays with this index until either side changes one"""
+        clone = TrigramIndex(self.fields)
+        clone._postings = self._postings.copy()
+        return clone
+
+    def _trigrams(self, recipe: Recipe) -> Set[str]:
+        grams = set()
+        for text in self.fields(recipe):
+            grams |= trigrams(text.lower())
+        return grams
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        for gram in self._trigrams(recipe):
+            insert_posting(self._postings, gram, slot)
+
+    def load(self, recipes: Sequence[Optional[Recipe]]) -> None:
+        """Index recipes at slots 0, 1, ... of an empty index in bulk; None is a hole"""
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for slot, recipe in enumerate(recipes):
+            if recipe is None:
+                continue
+            for gram in self._trigrams(recipe):
+                postings[gram].append(slot)
+        load_postings(self._postings, postings)
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        for gram in self._trigrams(recipe):
+            discard_posting(self._postings, gram, slot)
+
+    def clear(self) -> None:
+        self.__init__(self.fields)
+
+    def candidates(self, query: str) -> Optional[int]:
+        """Bitmask of the slots whose fields hold every trigram of query, or None if query is too short"""
+        query = query.lower()
+        if len(query) < self.MIN_QUERY:
+            return None
+
+        lists = []
+        for gram in trigrams(query):
+            postings = self._postings.get(gram)
+            if postings is None:
+                return 0
+            lists.append(postings)
+        lists.sort(key=len)
+
+        result = mask_of(as_array(lists[0]))
+        for postings in lists[1:]:
+            if not result:
+                break
+            result &= mask_of(as_array(postings))
+        return result
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the index: the dict plus every key and posting array"""
+        total = sys.getsizeof(self._postings)
+        for gram, postings in self._postings.items():
+            total += sys.getsizeof(gram) + sys.getsizeof(postings)
+        return total
@@ -0,0 +1,535 @@
+import bisect
+import heapq
+import itertools
+import threading
+import weakref
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from facet_index import FacetCounts, merge_facets
+from filters import SORT_KEYS, Cursor
+from highlight import Span
+from models import Recipe, RecipeFilter
+from pantry import PantryHit, hit_key
+from query import compile_search
+from ranking import BM25, sort_key
+from records import RecipeRecord
+from search_index import tokenize
+from spelling import Candidate, merge_spelling
+from store import RecipeStore
+from suggestions import merge_suggestions
+from vectors import HybridScorer
+from versions import CopyOnWriteDict
+
+# Worker side: this process's shard of every catalog version still in use,
+# keyed by a version id the coordinator hands out, and the catalog-wide
+# position of each of its recipes
+_stores: Dict[int, RecipeStore] = {}
+_positions: Dict[int, CopyOnWriteDict[str, int]] = {}
+
+
+def _init_shard(columnar: bool, vectors: bool) -> None:
+    _stores[0] = RecipeStore(columnar=columnar, vectors=vectors)
+    _positions[0] = CopyOnWriteDict()
+
+
+def _fork(parent: int, child: int) -> None:
+    _stores[child] = _stores[parent].copy()
+    _positions[child] = _positions[parent].copy()
+
+
+def _drop(version: int) -> None:
+    _stores.pop(version, None)
+    _positions.pop(version, None)
+
+
+def _call(version: int, method: str, *args):
+    return getattr(_stores[version], method)(*args)
+
+
+def _add_many(version: int, records: List[RecipeRecord], positions: List[int]) -> None:
+    store = _stores[version]
+    for record, position in zip(records, positions):
+        store.add(record)
+        _positions[version][record.id] = position
+
+
+def _load_many(version: int, records: List[RecipeRecord], positions: List[int]) -> None:
+    _stores[version].load(records)
+    for record, position in zip(records, positions):
+        _positions[version][record.id] = position
+
+
+def _remove(version: int, recipe_id: str) -> RecipeRecord:
+    del _positions[version][recipe_id]
+    return _stores[version].remove(recipe_id)
+
+
+def _clear(version: int) -> None:
+    _stores[version].clear()
+    _positions[version].clear()
+
+
+def _records(version: int) -> List[RecipeRecord]:
+    return list(_stores[version])
+
+
+def _local_cursor(version: int, cursor: Optional[Cursor]) -> Optional[Cursor]:
+    """cursor with its catalog-wide position turned into a slot of this shard.
+
+    Slots are in catalog order within a shard, so the last slot at or before
+    the position is a binary search; holes count as the live slot before them.
+    """
+    if cursor is None:
+        return None
+    key, position = cursor
+    store = _stores[version]
+    positions = _positions[version]
+
+    def position_of(slot: int) -> int:
+        while slot >= 0 and store.recipe_at(slot) is None:
+            slot -= 1
+        return -1 if slot < 0 else positions[store.recipe_at(slot).id]
+    return key, bisect.bisect_right(range(store.slot_count()), position, key=position_of) - 1
+
+
+def _sort_key(version: int, filters: RecipeFilter, recipe_id: str, corpus: Optional[tuple]) -> tuple:
+    scorer = None if corpus is None else _scorer(filters, corpus)
+    return sort_key(_stores[version].get(recipe_id), filters, scorer)
+
+
+def _search(version: int, filters: RecipeFilter, limit: Optional[int], cursor: Optional[Cursor],
+            count: bool) -> Tuple[Optional[int], List[RecipeRecord]]:
+    return _stores[version].page(filters, limit, _local_cursor(version, cursor), count)
+
+
+def _corpus_stats(version: int, query: str) -> Tuple[int, Dict[str, int], List[int]]:
+    """This shard's recipe count, document frequencies of the query terms and field length totals"""
+    store = _stores[version]
+    frequencies = {term: store.text_index.document_frequency(term) for term in dict.fromkeys(tokenize(query))}
+    return len(store), frequencies, store.field_lengths.totals
+
+
+def _scorer(filters: RecipeFilter, corpus: tuple):
+    count, frequencies, averages = corpus
+    if filters.rank == "hybrid":
+        return HybridScorer(compile_search(filters), count, frequencies.__getitem__)
+    return BM25(compile_search(filters).ranking_text, count, frequencies.__getitem__, averages)
+
+
+def _scored(version: int, filters: RecipeFilter, limit: Optional[int], corpus: tuple,
+            cursor: Optional[Cursor]) -> Tuple[int, List[Tuple[float, RecipeRecord]]]:
+    return _stores[version].scored(filters, _scorer(filters, corpus), limit, _local_cursor(version, cursor))
+
+
+def _hybrid(version: int, filters: RecipeFilter, limit: Optional[int], corpus: tuple,
+            cursor: Optional[Cursor]) -> Tuple[int, List[Tuple[float, RecipeRecord]]]:
+    return _stores[version].hybrid(filters, _scorer(filters, corpus), limit, _local_cursor(version, cursor))
+
+
+def _pantry(version: int, keys: Sequence[str], complete: bool, limit: Optional[int]) -> Tuple[int, List[PantryHit]]:
+    return _stores[version].pantry(keys, complete, limit)
+
+
+def _spelling(version: int, words: Sequence[str]) -> Dict[str, Optional[List[Candidate]]]:
+    return _stores[version].spelling(words)
+
+
+def _suggestions(version: int, term: str, limit: Optional[int]) -> List[str]:
+    return _stores[version].suggestions(term, limit)
+
+
+def _facets(version: int, filters: RecipeFilter, corpus: Optional[tuple]) -> FacetCounts:
+    return _stores[version].facets(filters, None if corpus is None else _scorer(filters, corpus))
+
+
+def _highlights(version: int, recipe_ids: List[str], filters: RecipeFilter) -> List[Dict[str, List[Span]]]:
+    store = _stores[version]
+    return store.highlights([store.get(recipe_id) for recipe_id in recipe_ids], filters)
+
+
+def _similar(version: int, recipe: RecipeRecord, limit: int) -> List[Tuple[float, RecipeRecord]]:
+    return _stores[version].similar(recipe, limit)
+
+
+def _stats(version: int) -> Dict:
+    """store.stats() plus the first recipe id of each category and difficulty"""
+    store = _stores[version]
+    stats = store.stats()
+    wanted = len(stats["categories"]) + len(stats["difficulties"])
+    first: Dict[tuple, str] = {}
+    for recipe in store:
+        if len(first) == wanted:
+            break
+        first.setdefault(("categories", recipe.category), recipe.id)
+        first.setdefault(("difficulties", recipe.difficulty), recipe.id)
+    stats["first"] = first
+    return stats
+
+
+class ShardPool:
+    """One single-process executor per shard, so each shard has an owning worker.
+
+    Workers keep their shard of every catalog version that is still
+    referenced. The pool counts references to each (shard, version id) pair
+    and tells the worker to drop a version once nothing uses it.
+    """
+
+    # Buffered adds are shipped to a worker in batches of this size
+    BATCH = 512
+
+    def __init__(self, shards: int, columnar: bool = False, vectors: bool = False):
+        self.executors = [
+            ProcessPoolExecutor(1, initializer=_init_shard, initargs=(columnar, vectors))
+            for _ in range(shards)
+        ]
+        self._ids = itertools.count(1)
+        self._refs: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self.executors)
+
+    def shard_of(self, recipe_id: str) -> int:
+        # crc32 rather than hash(): str hashes differ between processes
+        return zlib.crc32(recipe_id.encode()) % len(self.executors)
+
+    def submit(self, shard: int, fn, *args) -> Future:
+        return self.executors[shard].submit(fn, *args)
+
+    def call(self, shard: int, fn, *args):
+        return self.submit(shard, fn, *args).result()
+
+    def scatter(self, versions: List[int], fn, *args) -> list:
+        """Run fn(version, *args) on every shard in parallel and gather the results"""
+        futures = [self.submit(shard, fn, version, *args) for shard, version in enumerate(versions)]
+        return [future.result() for future in futures]
+
+    def fork(self, shard: int, parent: int) -> int:
+        """Start a writable copy of a shard version; returns the new version id"""
+        child = next(self._ids)
+        self.call(shard, _fork, parent, child)
+        return child
+
+    def retain(self, shard: int, version: int) -> None:
+        with self._lock:
+            self._refs[shard, version] = self._refs.get((shard, version), 0) + 1
+
+    def release(self, shard: int, version: int) -> None:
+        with self._lock:
+            self._refs[shard, version] -= 1
+            if self._refs[shard, version]:
+                return
+            del self._refs[shard, version]
+        if not self._closed:
+            try:
+                self.submit(shard, _drop, version)
+            except RuntimeError:
+                # The executor already shut down at interpreter exit
+                pass
+
+    def release_all(self, versions: List[int]) -> None:
+        for shard, version in enumerate(versions):
+            self.release(shard, version)
+
+    def shutdown(self) -> None:
+        self._closed = True
+        for executor in self.executors:
+            executor.shutdown()
+
+
+class ShardedRecipeStore:
+    """RecipeStore-compatible catalog partitioned across worker processes.
+
+    Recipes are assigned to shards by a hash of their id, so updates never
+    move a recipe and shards stay evenly sized whatever the category mix.
+    Each shard is a RecipeStore in its own process. A query goes to every
+    shard at once; each returns its top hits already ordered, and the
+    coordinator merges them on the filter_recipes order, (tier, rating)
+    descending and then catalog position, which it tracks as a sequence
+    number per id.
+
+    copy() gives the next catalog version: shards are forked copy-on-write in
+    their workers the first time the new version writes to them. Adds are
+    buffered and shipped in batches; flush() sends what is pending.
+    """
+
+    def __init__(self, pool: ShardPool):
+        self.pool = pool
+        self._versions = [0] * len(pool)
+        self._seq: CopyOnWriteDict[str, int] = CopyOnWriteDict()
+        self._next_seq = 0
+        self._writable = set(range(len(pool)))
+        self._buffer: Dict[int, List[Tuple[RecipeRecord, int]]] = {}
+        self._track()
+
+    def _track(self) -> None:
+        for shard, version in enumerate(self._versions):
+            self.pool.retain(shard, version)
+        # The list is updated in place on fork, so the finalizer releases the current ids
+        weakref.finalize(self, self.pool.release_all, self._versions)
+
+    def copy(self) -> "ShardedRecipeStore":
+        """The next version: shares every shard, and the sequence numbers' buckets, until it writes to them"""
+        self.flush()
+        clone = ShardedRecipeStore.__new__(ShardedRecipeStore)
+        clone.pool = self.pool
+        clone._versions = list(self._versions)
+        clone._seq = self._seq.copy()
+        clone._next_seq = self._next_seq
+        clone._writable = set()
+        clone._buffer = {}
+        clone._track()
+        # Shards are now shared, so this side may not write to them in place either
+        self._writable = set()
+        return clone
+
+    def _shard_version(self, shard: int) -> int:
+        """Version id of shard to write to, forking it on the first write"""
+        if shard not in self._writable:
+            parent = self._versions[shard]
+            child = self.pool.fork(shard, parent)
+            self.pool.retain(shard, child)
+            self._versions[shard] = child
+            self.pool.release(shard, parent)
+            self._writable.add(shard)
+        return self._versions[shard]
+
+    def flush(self) -> None:
+        """Ship buffered adds to their shards and wait until they are applied"""
+        futures = [self._ship(shard, added) for shard, added in self._buffer.items() if added]
+        self._buffer = {}
+        for future in futures:
+            future.result()
+
+    def _ship(self, shard: int, added: List[Tuple[RecipeRecord, int]]) -> Future:
+        """Send buffered (record, sequence number) pairs to a shard"""
+        records, positions = zip(*added)
+        return self.pool.submit(shard, _add_many, self._shard_version(shard), list(records), list(positions))
+
+    def __len__(self) -> int:
+        return len(self._seq)
+
+    def __contains__(self, recipe_id: str) -> bool:
+        return recipe_id in self._seq
+
+    def __iter__(self) -> Iterator[RecipeRecord]:
+        self.flush()
+        shards = self.pool.scatter(self._versions, _records)
+        return heapq.merge(*shards, key=lambda recipe: self._seq[recipe.id])
+
+    def get(self, recipe_id: str) -> Optional[RecipeRecord]:
+        """Return the recipe with this id, or None"""
+        if recipe_id not in self._seq:
+            return None
+        self.flush()
+        shard = self.pool.shard_of(recipe_id)
+        return self.pool.call(shard, _call, self._versions[shard], "get", recipe_id)
+
+    def get_many(self, recipe_ids: Sequence[str]) -> List[Optional[RecipeRecord]]:
+        """get() for each id, in order, asking each shard holding some of them once and all in parallel"""
+        self.flush()
+        by_shard: Dict[int, List[str]] = {}
+        for recipe_id in recipe_ids:
+            if recipe_id in self._seq:
+                by_shard.setdefault(self.pool.shard_of(recipe_id), []).append(recipe_id)
+        futures = {shard: self.pool.submit(shard, _call, self._versions[shard], "get_many", ids)
+                   for shard, ids in by_shard.items()}
+        found = {}
+        for shard, future in futures.items():
+            found.update(zip(by_shard[shard], future.result()))
+        return [found.get(recipe_id) for recipe_id in recipe_ids]
+
+    def position(self, recipe_id: str) -> int:
+        """Where the recipe sits in catalog order (its sequence number); raises KeyError if missing"""
+        return self._seq[recipe_id]
+
+    def add(self, recipe: Recipe) -> None:
+        """Append a new recipe; raises KeyError if the id is taken"""
+        if recipe.id in self._seq:
+            raise KeyError(recipe.id)
+        self._seq[recipe.id] = self._next_seq
+        shard = self.pool.shard_of(recipe.id)
+        added = self._buffer.setdefault(shard, [])
+        added.append((RecipeStore._record(recipe), self._next_seq))
+        self._next_seq += 1
+        if len(added) >= self.pool.BATCH:
+            self._ship(shard, self._buffer.pop(shard)).result()
+
+    def load(self, recipes: Iterable[Recipe]) -> None:
+        """Append recipes to an empty store, every shard building its indexes in bulk (RecipeStore.load)"""
+        if self._seq:
+            raise ValueError("load() fills an empty store")
+        added: Dict[int, List[Tuple[RecipeRecord, int]]] = {}
+        for recipe in recipes:
+            if recipe.id in self._seq:
+                raise KeyError(recipe.id)
+            self._seq[recipe.id] = self._next_seq
+            added.setdefault(self.pool.shard_of(recipe.id), []).append((RecipeStore._record(recipe), self._next_seq))
+            self._next_seq += 1
+        futures = []
+        for shard, pairs in added.items():
+            records, positions = zip(*pairs)
+            futures.append(self.pool.submit(shard, _load_many, self._shard_version(shard), list(records),
+                                            list(positions)))
+        for future in futures:
+            future.result()
+
+    def replace(self, recipe_id: str, recipe: Recipe) -> None:
+        """Swap the recipe stored under recipe_id, keeping its position"""
+        if recipe_id not in self._seq:
+            raise KeyError(recipe_id)
+        self.flush()
+        shard = self.pool.shard_of(recipe_id)
+        self.pool.call(shard, _call, self._shard_version(shard), "replace", recipe_id, RecipeStore._record(recipe))
+
+    def remove(self, recipe_id: str) -> RecipeRecord:
+        """Delete and return the recipe with this id; raises KeyError if missing"""
+        if recipe_id not in self._seq:
+            raise KeyError(recipe_id)
+        self.flush()
+        shard = self.pool.shard_of(recipe_id)
+        recipe = self.pool.call(shard, _remove, self._shard_version(shard), recipe_id)
+        del self._seq[recipe_id]
+        return recipe
+
+    def clear(self) -> None:
+        self._buffer = {}
+        for shard in range(len(self.pool)):
+            self.pool.call(shard, _clear, self._shard_version(shard))
+        self._seq.clear()
+
+    def search(self, filters: RecipeFilter, limit: Optional[int] = None, after: Optional[str] = None,
+               count: bool = True) -> Tuple[Optional[int], List[RecipeRecord]]:
+        """Total matches and the first limit of them, in main.filter_recipes order, gathered from every shard.
+
+        after is the id of the last recipe already returned. Its sort key comes
+        from its own shard; every shard then pages from that key and its
+        sequence number. With count=False the total is None unless every
+        shard counted anyway (see RecipeStore.search).
+        """
+        self.flush()
+        seq = self._seq
+        query = compile_search(filters)
+        by = SORT_KEYS.get(filters.sort)
+        ranked = query and by is None and filters.rank in ("bm25", "hybrid")
+        corpus = self._corpus(query.ranking_text) if ranked else None
+        cursor = None
+        if after is not None:
+            position = seq[after]
+            shard = self.pool.shard_of(after)
+            cursor = self.pool.call(shard, _sort_key, self._versions[shard], filters, after, corpus), position
+        if corpus is not None:
+            rank = _scored if filters.rank == "bm25" else _hybrid
+            results = self.pool.scatter(self._versions, rank, filters, limit, corpus, cursor)
+            shards = [scored for _, scored in results]
+            merged = heapq.merge(*shards, key=lambda pair: (-pair[0], seq[pair[1].id]))
+            return sum(total for total, _ in results), [recipe for _, recipe in itertools.islice(merged, limit)]
+
+        results = self.pool.scatter(self._versions, _search, filters, limit, cursor, count)
+        shards = [hits for _, hits in results]
+        if by is not None:
+            def key(recipe):
+                return -by(recipe)[0], seq[recipe.id]
+        elif query is not None:
+            def key(recipe):
+                tier, rating = query.key(recipe)
+                return -tier, -rating, seq[recipe.id]
+        else:
+            def key(recipe):
+                return seq[recipe.id]
+        merged = heapq.merge(*shards, key=key)
+        totals = [total for total, _ in results]
+        return None if None in totals else sum(totals), list(itertools.islice(merged, limit))
+
+    def filter(self, filters: RecipeFilter) -> List[RecipeRecord]:
+        """Same results as scanning with main.filter_recipes"""
+        return self.search(filters)[1]
+
+    def _corpus(self, query: str) -> tuple:
+        """Catalog-wide term statistics for BM25 and hybrid, so every shard scores on the same scale"""
+        count = 0
+        frequencies: Dict[str, int] = {}
+        totals = None
+        for shard_count, shard_frequencies, shard_totals in self.pool.scatter(self._versions, _corpus_stats, query):
+            count += shard_count
+            for term, df in shard_frequencies.items():
+                frequencies[term] = frequencies.get(term, 0) + df
+            totals = shard_totals if totals is None else [a + b for a, b in zip(totals, shard_totals)]
+        return count, frequencies, [total / count if count else 0.0 for total in totals]
+
+    def pantry(self, keys: Sequence[str], complete: bool = False,
+               limit: Optional[int] = None) -> Tuple[int, List[PantryHit]]:
+        """Recipes the pantry keys cover lines of, gathered from every shard"""
+        self.flush()
+        seq = self._seq
+        results = self.pool.scatter(self._versions, _pantry, keys, complete, limit)
+
+        def key(hit: PantryHit) -> tuple:
+            coverage, matched, rating = hit_key(hit)
+            return -coverage, -matched, -rating, seq[hit.recipe.id]
+        merged = heapq.merge(*(hits for _, hits in results), key=key)
+        return sum(total for total, _ in results), list(itertools.islice(merged, limit))
+
+    def similar(self, recipe, limit: int) -> List[Tuple[float, RecipeRecord]]:
+        """The limit recipes most like recipe, gathered from every shard's LSH buckets"""
+        self.flush()
+        seq = self._seq
+        shards = self.pool.scatter(self._versions, _similar, recipe, limit)
+        merged = heapq.merge(*shards, key=lambda pair: (-pair[0], seq[pair[1].id]))
+        return list(itertools.islice(merged, limit))
+
+    def spelling(self, words: Sequence[str]) -> Dict[str, Optional[List[Candidate]]]:
+        """Spelling candidates for search words, with recipe counts added up across shards"""
+        self.flush()
+        return merge_spelling(self.pool.scatter(self._versions, _spelling, words))
+
+    def suggestions(self, term: str, limit: Optional[int] = None) -> List[str]:
+        """Titles, tags and main ingredient names matching term, the first limit across shards"""
+        self.flush()
+        return merge_suggestions(self.pool.scatter(self._versions, _suggestions, term, limit), term, limit)
+
+    def facets(self, filters: RecipeFilter) -> FacetCounts:
+        """Matches per category, difficulty and cookingTime bucket, added up across shards"""
+        self.flush()
+        query = compile_search(filters)
+        corpus = self._corpus(query.ranking_text) if query and filters.rank == "hybrid" else None
+        return merge_facets(self.pool.scatter(self._versions, _facets, filters, corpus))
+
+    def highlights(self, recipes: Sequence, filters: RecipeFilter) -> List[Dict[str, List[Span]]]:
+        """Spans of each recipe matching the search, per field, from the owning shards' token positions"""
+        self.flush()
+        owned: Dict[int, List[int]] = {}
+        for i, recipe in enumerate(recipes):
+            owned.setdefault(self.pool.shard_of(recipe.id), []).append(i)
+        futures = {
+            shard: self.pool.submit(shard, _highlights, self._versions[shard], [recipes[i].id for i in found], filters)
+            for shard, found in owned.items()
+        }
+        result: List[Dict[str, List[Span]]] = [{} for _ in recipes]
+        for shard, found in owned.items():
+            for i, spans in zip(found, futures[shard].result()):
+                result[i] = spans
+        return result
+
+    def categories(self) -> List[str]:
+        return list(self.stats()["categories"])
+
+    def stats(self) -> Dict:
+        """Per-category and per-difficulty counts plus the sum of ratings"""
+        self.flush()
+        shards = self.pool.scatter(self._versions, _stats)
+        merged: Dict = {"rating_sum": sum(stats["rating_sum"] for stats in shards)}
+        for field in ("categories", "difficulties"):
+            counts: Dict[str, int] = {}
+            first: Dict[str, int] = {}
+            for stats in shards:
+                for value, count in stats[field].items():
+                    counts[value] = counts.get(value, 0) + count
+                    position = self._seq[stats["first"][field, value]]
+                    first[value] = min(first.get(value, position), position)
+            # Keyed in order of first appearance in the catalog, like the other stores
+            merged[field] = {value: counts[value] for value in sorted(counts, key=first.get)}
+        return merged
@@ -0,0 +1,184 @@
+import random
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # signatures fall back to Python ints
+    np = None
+
+from ingredients import name_words, parsed_ingredients
+from models import Recipe
+from postings import copy_postings, discard_posting, insert_posting, load_postings, new_postings
+from versions import CopyOnWriteList, CopyOnWriteMap
+
+# MinHash signatures of each recipe's feature set (normalized ingredient names
+# and tags), split into BANDS bands of ROWS rows for locality-sensitive
+# hashing. Recipes sharing a band are candidates; a candidate's similarity is
+# the share of signature entries it has in common with the recipe, which
+# estimates their Jaccard similarity. With 16 bands of 4 rows a pair at
+# Jaccard 0.5 becomes a candidate 64% of the time, at 0.7 99%. When there are
+# more than MAX_CANDIDATES, only those sharing the most bands are scored, so
+# a lookup's cost stays flat as the catalog grows.
+BANDS = 16
+ROWS = 4
+HASHES = BANDS * ROWS
+# Most candidates a lookup scores
+MAX_CANDIDATES = 256
+_PRIME = (1 << 31) - 1
+_rng = random.Random(0x5EED)
+_A = [_rng.randrange(1, _PRIME) for _ in range(HASHES)]
+_B = [_rng.randrange(0, _PRIME) for _ in range(HASHES)]
+if np is not None:
+    _A_COLUMN = np.array(_A, dtype=np.uint64)[:, None]
+    _B_COLUMN = np.array(_B, dtype=np.uint64)[:, None]
+
+
+def features(recipe: Recipe) -> Set[str]:
+    """Normalized ingredient names and tags of a recipe"""
+    names = {"i:" + " ".join(name_words(ingredient.name)) for ingredient in parsed_ingredients(recipe)}
+    names.discard("i:")
+    return names | {"t:" + tag.strip().lower() for tag in recipe.tags if tag.strip()}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def signature(recipe: Recipe) -> Optional[bytes]:
+    """MinHash signature (HASHES uint32s) of the recipe's features, or None if it has none"""
+    # crc32 rather than hash(): signatures must agree across processes
+    hashed = [zlib.crc32(feature.encode()) % _PRIME for feature in features(recipe)]
+    if not hashed:
+        return None
+    if np is not None:
+        values = (_A_COLUMN * np.array(hashed, dtype=np.uint64) + _B_COLUMN) % _PRIME
+        return values.min(axis=1).astype(np.uint32).tobytes()
+    return array("I", (min((a * x + b) % _PRIME for x in hashed) for a, b in zip(_A, _B))).tobytes()
+
+
+def bands(sig: bytes) -> List[bytes]:
+    """The LSH bucket keys of a signature: each band's rows, prefixed by the band number"""
+    width = ROWS * 4
+    return [bytes((band,)) + sig[band * width:(band + 1) * width] for band in range(BANDS)]
+
+
+def agreement(sig: bytes, others: List[bytes]) -> List[float]:
+    """Share of signature entries each of others has in common with sig"""
+    if np is not None:
+        matrix = np.frombuffer(b"".join(others), dtype=np.uint32).reshape(len(others), HASHES)
+        return ((matrix == np.frombuffer(sig, dtype=np.uint32)).sum(axis=1) / HASHES).tolist()
+    mine = array("I", sig)
+    return [sum(x == y for x, y in zip(mine, array("I", other))) / HASHES for other in others]
+
+
+def shared_bands(sig: bytes, other: bytes) -> int:
+    width = ROWS * 4
+    return sum(sig[i:i + width] == other[i:i + width] for i in range(0, len(sig), width))
+
+
+def shortlist(hits: List[int]) -> List[int]:
+    """Indexes of the MAX_CANDIDATES entries sharing the most bands, in their original order"""
+    if len(hits) <= MAX_CANDIDATES:
+        return list(range(len(hits)))
+    return sorted(sorted(range(len(hits)), key=lambda i: -hits[i])[:MAX_CANDIDATES])
+
+
+def scan_similar(recipes: Iterable[Recipe], recipe: Recipe, limit: int) -> List[Tuple[float, Recipe]]:
+    """similar() by signing every recipe; candidates follow the same banding rule as the index"""
+    sig = signature(recipe)
+    if sig is None:
+        return []
+    candidates, hits = [], []
+    for other in recipes:
+        other_sig = signature(other) if other.id != recipe.id else None
+        shared = 0 if other_sig is None else shared_bands(sig, other_sig)
+        if shared:
+            candidates.append((other_sig, other))
+            hits.append(shared)
+    if not candidates:
+        return []
+    candidates = [candidates[i] for i in shortlist(hits)]
+    scores = agreement(sig, [other_sig for other_sig, _ in candidates])
+    ranked = sorted(zip(scores, range(len(candidates))), key=lambda pair: -pair[0])[:limit]
+    return [(score, candidates[i][1]) for score, i in ranked]
+
+
+class SimilarityIndex:
+    """MinHash signatures per slot and LSH buckets of slots.
+
+    Signatures are immutable bytes in a slot list, so a catalog version copy
+    shares them; buckets are sorted uint32 postings in a CopyOnWriteMap like
+    the text indexes. A lookup touches BANDS buckets and compares only the
+    slots in them, however large the catalog.
+    """
+
+    def __init__(self):
+        self._signatures: CopyOnWriteList[Optional[bytes]] = CopyOnWriteList()
+        self._buckets: CopyOnWriteMap[bytes, array] = CopyOnWriteMap(new_postings, copy_postings)
+
+    def copy(self) -> "SimilarityIndex":
+        clone = SimilarityIndex()
+        clone._signatures = self._signatures.copy()
+        clone._buckets = self._buckets.copy()
+        return clone
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        sig = signature(recipe)
+        self._signatures.grow(slot + 1, None)
+        self._signatures[slot] = sig
+        if sig is not None:
+            for key in bands(sig):
+                insert_posting(self._buckets, key, slot)
+
+    def load(self, recipes: Sequence[Recipe]) -> None:
+        """Sign and bucket recipes at slots 0, 1, ... of an empty index in bulk; None is a hole"""
+        signatures = [None if recipe is None else signature(recipe) for recipe in recipes]
+        buckets: Dict[bytes, List[int]] = defaultdict(list)
+        for slot, sig in enumerate(signatures):
+            if sig is not None:
+                for key in bands(sig):
+                    buckets[key].append(slot)
+        self._signatures.extend(signatures)
+        load_postings(self._buckets, buckets)
+
+    def signature(self, slot: int) -> Optional[bytes]:
+        """The stored signature of the recipe at slot (None if it has no features)"""
+        return self._signatures[slot]
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        sig = self._signatures[slot]
+        if sig is not None:
+            for key in bands(sig):
+                discard_posting(self._buckets, key, slot)
+        self._signatures[slot] = None
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def similar(self, sig: Optional[bytes], limit: int, exclude: Optional[int] = None) -> List[Tuple[float, int]]:
+        """The limit slots most similar to sig as (estimated Jaccard, slot), best first, ties in slot order"""
+        if sig is None:
+            return []
+        buckets = [bucket for bucket in map(self._buckets.get, bands(sig)) if bucket]
+        if np is not None and buckets:
+            slots = np.concatenate([np.frombuffer(bucket.tobytes(), dtype=np.uint32) for bucket in buckets])
+            slots, hits = np.unique(slots, return_counts=True)
+            if exclude is not None:
+                keep = slots != exclude
+                slots, hits = slots[keep], hits[keep]
+            if len(slots) > MAX_CANDIDATES:
+                # Slots sharing more bands are more similar; score only the best of them
+                slots = slots[np.sort(np.lexsort((slots, -hits))[:MAX_CANDIDATES])]
+            slots = slots.tolist()
+        else:
+            counts = Counter(slot for bucket in buckets for slot in bucket)
+            counts.pop(exclude, None)
+            slots = sorted(counts)
+            slots = [slots[i] for i in shortlist([counts[slot] for slot in slots])]
+        if not slots:
+            return []
+        scores = agreement(sig, [self._signatures[slot] for slot in slots])
+        return sorted(zip(scores, slots), key=lambda pair: -pair[0])[:limit]
@@ -0,0 +1,209 @@
+"""Presorted slot permutations for ?sort= and the range filters.
+
+Each sortable field keeps every slot ordered by (key, slot), the key chosen
+so ascending order is the field's sort order (ratings and creation times
+are negated), and equal keys keep catalog order. A permutation is a list
+of blocks of at most 2 * BLOCK entries, kept in step with writes by bisect
+insert and delete in the one block the entry falls in. Blocks are shared
+copy-on-write between catalog versions like posting lists, so a write
+copies a block, not the permutation.
+
+A range filter is a slice of its field's permutation, turned into a
+bitmask to AND with the facet filters. A sorted page walks the sort
+field's permutation from the cursor and keeps the slots in the mask.
+"""
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from bitset import mask_of
+from filters import Cursor, has_ranges, timestamp
+from models import Recipe, RecipeFilter
+from versions import CopyOnWriteMap
+
+# Entries per block; blocks split in two past twice this
+BLOCK = 1024
+
+KEYS: Dict[str, Callable[[Recipe], float]] = {
+    "rating": lambda recipe: -recipe.rating,
+    "cookingTime": lambda recipe: recipe.cookingTime,
+    "servings": lambda recipe: recipe.servings,
+    "createdAt": lambda recipe: -timestamp(recipe.createdAt),
+}
+# The permutation of each explicit sort; its key is minus filters.SORT_KEYS'
+SORT_FIELDS = {"rating": "rating", "time": "cookingTime", "newest": "createdAt"}
+
+
+class _Block:
+    __slots__ = ("keys", "slots")
+
+    def __init__(self):
+        self.keys = array("d")
+        self.slots = array("I")
+
+    def copy(self) -> "_Block":
+        clone = _Block()
+        clone.keys = self.keys[:]
+        clone.slots = self.slots[:]
+        return clone
+
+    def find(self, key: float, slot: int) -> int:
+        """Index of the first entry at or after (key, slot)"""
+        lo = bisect_left(self.keys, key)
+        return bisect_left(self.slots, slot, lo, bisect_right(self.keys, key, lo))
+
+
+class Permutation:
+    """Slots ordered by (key, slot) in copy-on-write blocks"""
+
+    def __init__(self):
+        self._blocks: CopyOnWriteMap[int, _Block] = CopyOnWriteMap(_Block, _Block.copy)
+        # Block ids in order, and the last (key, slot) of each
+        self._order: List[int] = []
+        self._last: List[Tuple[float, int]] = []
+        self._next_id = 0
+        self.size = 0
+
+    def copy(self) -> "Permutation":
+        clone = Permutation.__new__(Permutation)
+        clone._blocks = self._blocks.copy()
+        clone._order = list(self._order)
+        clone._last = list(self._last)
+        clone._next_id = self._next_id
+        clone.size = self.size
+        return clone
+
+    def _block_of(self, key: float, slot: int) -> int:
+        """Index in _order of the block (key, slot) belongs in"""
+        return min(bisect_left(self._last, (key, slot)), len(self._order) - 1)
+
+    def insert(self, key: float, slot: int) -> None:
+        if not self._order:
+            self._order.append(self._next_id)
+            self._last.append((key, slot))
+            self._next_id += 1
+        i = self._block_of(key, slot)
+        block = self._blocks.writable(self._order[i])
+        at = block.find(key, slot)
+        block.keys.insert(at, key)
+        block.slots.insert(at, slot)
+        self.size += 1
+        if len(block.keys) > 2 * BLOCK:
+            half = self._blocks.writable(self._next_id)
+            half.keys, half.slots = block.keys[BLOCK:], block.slots[BLOCK:]
+            del block.keys[BLOCK:], block.slots[BLOCK:]
+            self._order.insert(i + 1, self._next_id)
+            self._last.insert(i + 1, (half.keys[-1], half.slots[-1]))
+            self._next_id += 1
+        self._last[i] = block.keys[-1], block.slots[-1]
+
+    def load(self, entries: List[Tuple[float, int]]) -> None:
+        """Fill an empty permutation with (key, slot) entries: one sort, then BLOCK entries per block"""
+        entries.sort()
+        for start in range(0, len(entries), BLOCK):
+            part = entries[start:start + BLOCK]
+            block = self._blocks.writable(self._next_id)
+            block.keys = array("d", [key for key, _ in part])
+            block.slots = array("I", [slot for _, slot in part])
+            self._order.append(self._next_id)
+            self._last.append(part[-1])
+            self._next_id += 1
+        self.size += len(entries)
+
+    def remove(self, key: float, slot: int) -> None:
+        i = self._block_of(key, slot)
+        block = self._blocks.writable(self._order[i])
+        at = block.find(key, slot)
+        del block.keys[at], block.slots[at]
+        self.size -= 1
+        if block.keys:
+            self._last[i] = block.keys[-1], block.slots[-1]
+        else:
+            self._blocks.pop(self._order.pop(i))
+            del self._last[i]
+
+    def between(self, low: float, high: float) -> array:
+        """Slots whose key is in [low, high], in permutation order"""
+        result = array("I")
+        for i in range(bisect_left(self._last, (low, -1)), len(self._order)):
+            block = self._blocks[self._order[i]]
+            if block.keys[0] > high:
+                break
+            result.extend(block.slots[bisect_left(block.keys, low):bisect_right(block.keys, high)])
+        return result
+
+    def after(self, key: float, slot: int) -> Iterator[int]:
+        """Slots ordered after (key, slot)"""
+        for i in range(bisect_right(self._last, (key, slot)), len(self._order)):
+            block = self._blocks[self._order[i]]
+            yield from block.slots[block.find(key, slot + 1):]
+
+    def __iter__(self) -> Iterator[int]:
+        for block_id in self._order:
+            yield from self._blocks[block_id].slots
+
+
+class SortIndex:
+    """One Permutation per field in KEYS"""
+
+    def __init__(self):
+        self.permutations = {field: Permutation() for field in KEYS}
+
+    def copy(self) -> "SortIndex":
+        clone = SortIndex.__new__(SortIndex)
+        clone.permutations = {field: permutation.copy() for field, permutation in self.permutations.items()}
+        return clone
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        for field, key in KEYS.items():
+            self.permutations[field].insert(key(recipe), slot)
+
+    def load(self, recipes: Sequence[Recipe]) -> None:
+        """Index recipes at slots 0, 1, ... of an empty index in bulk"""
+        for field, key in KEYS.items():
+            self.permutations[field].load([(key(recipe), slot) for slot, recipe in enumerate(recipes)])
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        for field, key in KEYS.items():
+            self.permutations[field].remove(key(recipe), slot)
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def range_mask(self, filters: RecipeFilter) -> Optional[int]:
+        """Bitmask of slots passing the range filters, or None when there are none"""
+        if not has_ranges(filters):
+            return None
+        slices = []
+        if filters.minRating is not None:
+            slices.append(("rating", -math.inf, -filters.minRating))
+        if filters.minServings is not None or filters.maxServings is not None:
+            low = -math.inf if filters.minServings is None else filters.minServings
+            high = math.inf if filters.maxServings is None else filters.maxServings
+            slices.append(("servings", low, high))
+        if filters.createdFrom is not None or filters.createdBefore is not None:
+            # Negated times: createdBefore is exclusive, so its end of the slice is open
+            low = -math.inf if filters.createdBefore is None else math.nextafter(-timestamp(filters.createdBefore),
+                                                                                  math.inf)
+            high = math.inf if filters.createdFrom is None else -timestamp(filters.createdFrom)
+            slices.append(("createdAt", low, high))
+        mask = -1
+        for field, low, high in slices:
+            mask &= mask_of(self.permutations[field].between(low, high))
+        return mask
+
+    def walk(self, sort: str, mask: int, cursor: Optional[Cursor] = None) -> Iterator[int]:
+        """The slots of mask in the order of an explicit sort, after cursor if given, lazily"""
+        permutation = self.permutations[SORT_FIELDS[sort]]
+        slots = iter(permutation) if cursor is None else permutation.after(-cursor[0][0], cursor[1])
+        bits = mask.to_bytes((mask.bit_length() + 7) >> 3, "little")
+        size = len(bits) << 3
+        for slot in slots:
+            if slot < size and bits[slot >> 3] >> (slot & 7) & 1:
+                yield slot
+
+    def ordered(self, sort: str, mask: int, limit: Optional[int], cursor: Optional[Cursor] = None) -> List[int]:
+        """The first limit slots of mask in the order of an explicit sort, after cursor if given"""
+        return list(islice(self.walk(sort, mask, cursor), limit))
@@ -0,0 +1,204 @@
+"""Typo tolerance for /recipes?fuzzy=1, SymSpell style.
+
+Every catalog word is indexed under each string its first PREFIX_LENGTH
+characters become with up to MAX_DISTANCE characters deleted. Two words
+within edit distance d share such a deletion with at most d characters
+deleted from each, so a misspelling's candidates are found by probing the
+index with its own deletions, and only those few are checked with a real
+edit distance. Search words that occur nowhere in the catalog are replaced
+by their closest candidate: fewest edits, then most recipes, then
+alphabetical. Words that do occur, even inside longer words, are left alone.
+"""
+from typing import Callable, Dict, Iterable, List, Match, Optional, Sequence, Set, Tuple
+
+from models import Recipe
+from query import And, Not, Or, SearchQuery, Term
+from search_index import TOKEN_RE, searchable_text, tokenize
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+# Shorter words only get one edit, and words under MIN_LENGTH none
+SHORT_WORD = 4
+MIN_LENGTH = 3
+
+# (candidate word, edit distance, recipes containing it)
+Candidate = Tuple[str, int, int]
+
+
+def max_distance(word: str) -> int:
+    if len(word) < MIN_LENGTH:
+        return 0
+    return 1 if len(word) <= SHORT_WORD else MAX_DISTANCE
+
+
+def deletions(word: str, distance: int) -> Set[str]:
+    """word and every string it becomes with up to distance characters deleted"""
+    result = frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result = result | frontier
+    return result
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (a swap counts once), or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return min(row[-1], limit + 1)
+
+
+def spelling_words(recipe: Recipe) -> Set[str]:
+    """The recipe's words that misspellings can be corrected to: alphabetic ones"""
+    return {token for text in searchable_text(recipe) for token in tokenize(text) if token.isalpha()}
+
+
+def search_words(query: SearchQuery) -> List[str]:
+    """The distinct words of every term of a search, negated ones included"""
+    words: Dict[str, None] = {}
+
+    def visit(plan) -> None:
+        if isinstance(plan, Term):
+            words.update(dict.fromkeys(tokenize(plan.text)))
+        elif isinstance(plan, Not):
+            visit(plan.part)
+        elif isinstance(plan, (And, Or)):
+            for part in plan.parts:
+                visit(part)
+    visit(query.plan)
+    return list(words)
+
+
+class SpellIndex:
+    """Deletion index from the (prefix) deletions of catalog words to the words.
+
+    Entries are only ever added: a word that leaves the catalog keeps its
+    deletions, and lookups skip candidates the caller's vocabulary no longer
+    has. So every catalog version shares one index, writes touch only the
+    deletions of words never seen before, and the index is rebuilt from the
+    live recipes whenever the store clears or compacts.
+    """
+
+    def __init__(self):
+        self._deletions: Dict[str, Tuple[str, ...]] = {}
+        self._words: Set[str] = set()
+
+    def copy(self) -> "SpellIndex":
+        """A copy sharing the entries; they only grow, and any version may read them"""
+        clone = SpellIndex.__new__(SpellIndex)
+        clone._deletions = self._deletions
+        clone._words = self._words
+        return clone
+
+    def add_word(self, word: str) -> None:
+        if word in self._words:
+            return
+        for key in deletions(word[:PREFIX_LENGTH], MAX_DISTANCE):
+            # Replaced rather than appended to, so readers never see a tuple change
+            self._deletions[key] = self._deletions.get(key, ()) + (word,)
+        self._words.add(word)
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        for word in spelling_words(recipe):
+            self.add_word(word)
+
+    def load(self, recipes: Sequence[Recipe]) -> None:
+        """Index the words of recipes in an empty index, each word once; None is a hole"""
+        words = (word for recipe in recipes if recipe is not None for word in spelling_words(recipe))
+        for word in dict.fromkeys(words):
+            self.add_word(word)
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        pass
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def candidates(self, word: str, frequency: Callable[[str], int]) -> List[Candidate]:
+        """Words within max_distance(word) edits that frequency says some recipe still contains"""
+        limit = max_distance(word)
+        if not limit:
+            return []
+        seen: Set[str] = set()
+        found = []
+        for key in deletions(word[:PREFIX_LENGTH], limit):
+            for candidate in self._deletions.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(word, candidate, limit)
+                if distance <= limit:
+                    recipes = frequency(candidate)
+                    if recipes:
+                        found.append((candidate, distance, recipes))
+        return found
+
+
+def scan_spelling(recipes: Iterable[Recipe], words: Sequence[str]) -> Dict[str, Optional[List[Candidate]]]:
+    """Store.spelling() with the vocabulary and deletion index built by scanning every recipe"""
+    counts: Dict[str, int] = {}
+    tokens: Set[str] = set()
+    for recipe in recipes:
+        for text in searchable_text(recipe):
+            tokens.update(tokenize(text))
+        for word in spelling_words(recipe):
+            counts[word] = counts.get(word, 0) + 1
+    index = SpellIndex()
+    for word in counts:
+        index.add_word(word)
+    return {
+        word: None if any(word in token for token in tokens) else index.candidates(word, lambda w: counts.get(w, 0))
+        for word in words
+    }
+
+
+def merge_spelling(results: Iterable[Dict[str, Optional[List[Candidate]]]]) -> Dict[str, Optional[List[Candidate]]]:
+    """Combine spelling() results of disjoint parts of a catalog, adding up recipe counts"""
+    merged: Dict[str, Optional[Dict[str, Tuple[int, int]]]] = {}
+    for result in results:
+        for word, candidates in result.items():
+            if candidates is None or merged.get(word, {}) is None:
+                merged[word] = None
+                continue
+            found = merged.setdefault(word, {})
+            for candidate, distance, recipes in candidates:
+                found[candidate] = distance, found.get(candidate, (distance, 0))[1] + recipes
+    return {
+        word: None if found is None else [(candidate, d, n) for candidate, (d, n) in found.items()]
+        for word, found in merged.items()
+    }
+
+
+def best_correction(candidates: List[Candidate]) -> Optional[str]:
+    """Fewest edits, then most recipes, then alphabetical"""
+    if not candidates:
+        return None
+    return min(candidates, key=lambda c: (c[1], -c[2], c[0]))[0]
+
+
+def corrections(spelling: Dict[str, Optional[List[Candidate]]]) -> Dict[str, str]:
+    """Misspelled word -> correction, for the words of a spelling() result that have one"""
+    fixes = {}
+    for word, candidates in spelling.items():
+        correction = None if candidates is None else best_correction(candidates)
+        if correction is not None:
+            fixes[word] = correction
+    return fixes
+
+
+def apply_corrections(search: str, fixes: Dict[str, str]) -> str:
+    """The search text with each misspelled word replaced; the OR operator is never a word"""
+    def replace(match: Match) -> str:
+        token = match.group(0)
+        return token if token == "OR" else fixes.get(token.lower(), token)
+    return TOKEN_RE.sub(replace, search)
@@ -0,0 +1,572 @@
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for ?rank=hybrid
+    np = None
+
+from filters import SORT_KEYS, after_cursor, index_cursor, timestamp, top_k
+from facet_index import FacetCounts, count_facets, unfaceted
+from highlight import Span, scan_highlights
+from models import Recipe, RecipeFilter
+from pantry import PantryHit, recipe_keys
+from query import compile_search
+from ranking import BM25, field_lengths, rank_bm25, sort_key
+from search_index import searchable_text
+from similarity import agreement, bands, shortlist, signature
+from spelling import MAX_DISTANCE, PREFIX_LENGTH, Candidate, deletions, edit_distance, max_distance, spelling_words
+from suggestions import normalize, suggestion_phrases, word_starts
+from vectors import HybridScorer, embed, rank_hybrid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    image TEXT NOT NULL,
+    category TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    cooking_time INTEGER NOT NULL,
+    servings INTEGER NOT NULL,
+    ingredients TEXT NOT NULL,
+    instructions TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    rating REAL NOT NULL,
+    author TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    is_favorite INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_recipes_category ON recipes (category);
+CREATE INDEX IF NOT EXISTS idx_recipes_difficulty ON recipes (difficulty);
+CREATE INDEX IF NOT EXISTS idx_recipes_cooking_time ON recipes (cooking_time);
+CREATE INDEX IF NOT EXISTS idx_recipes_rating ON recipes (rating);
+CREATE INDEX IF NOT EXISTS idx_recipes_servings ON recipes (servings);
+CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5 (
+    search_text,
+    tokenize = 'trigram case_sensitive 1'
+);
+-- Pantry search: each ingredient line filed under every suffix of its name
+-- (see pantry.py), and the number of named lines per recipe
+CREATE TABLE IF NOT EXISTS recipe_ingredients (
+    name TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_name ON recipe_ingredients (name, seq);
+CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_seq ON recipe_ingredients (seq);
+CREATE TABLE IF NOT EXISTS recipe_ingredient_lines (
+    seq INTEGER PRIMARY KEY,
+    lines INTEGER NOT NULL
+);
+-- BM25: word tokens per ranked field (ranking.FIELDS), for length normalization
+CREATE TABLE IF NOT EXISTS recipe_lengths (
+    seq INTEGER PRIMARY KEY,
+    title INTEGER NOT NULL,
+    description INTEGER NOT NULL,
+    author INTEGER NOT NULL,
+    tags INTEGER NOT NULL,
+    ingredients INTEGER NOT NULL
+);
+-- Hybrid ranking: each recipe's vectors.embed() row as float32 bytes, when numpy is installed
+CREATE TABLE IF NOT EXISTS recipe_vectors (
+    seq INTEGER PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+-- Similar recipes: MinHash signatures and the LSH band keys they are bucketed under (see similarity.py)
+CREATE TABLE IF NOT EXISTS recipe_signatures (
+    seq INTEGER PRIMARY KEY,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipe_bands (
+    band BLOB NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipe_bands_band ON recipe_bands (band, seq);
+CREATE INDEX IF NOT EXISTS idx_recipe_bands_seq ON recipe_bands (seq);
+-- Spelling: each recipe's words, and the deletions of every word ever seen
+-- (see spelling.py); like SpellIndex, deletions are only dropped by clear()
+CREATE TABLE IF NOT EXISTS recipe_words (
+    word TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipe_words_word ON recipe_words (word, seq);
+CREATE INDEX IF NOT EXISTS idx_recipe_words_seq ON recipe_words (seq);
+CREATE TABLE IF NOT EXISTS spelling_deletions (
+    deletion TEXT NOT NULL,
+    word TEXT NOT NULL,
+    PRIMARY KEY (deletion, word)
+) WITHOUT ROWID;
+-- Suggestions: each recipe's phrases, and every phrase in use filed by its
+-- lowercased text whole (later = 0) and from each later word (see suggestions.py)
+CREATE TABLE IF NOT EXISTS recipe_phrases (
+    phrase TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipe_phrases_phrase ON recipe_phrases (phrase, seq);
+CREATE INDEX IF NOT EXISTS idx_recipe_phrases_seq ON recipe_phrases (seq);
+CREATE TABLE IF NOT EXISTS suggestion_entries (
+    later INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    phrase TEXT NOT NULL,
+    PRIMARY KEY (later, text, phrase)
+) WITHOUT ROWID;
+"""
+# Tables holding something for each recipe, by seq, next to recipes and recipes_fts
+RECIPE_TABLES = ("recipe_ingredients", "recipe_ingredient_lines", "recipe_lengths", "recipe_vectors",
+                 "recipe_signatures", "recipe_bands", "recipe_words", "recipe_phrases")
+
+COLUMNS = ("id, title, description, image, category, difficulty, cooking_time, servings, "
+           "ingredients, instructions, tags, rating, author, created_at, is_favorite")
+# created_at as a UTC timestamp, for the createdFrom/createdBefore ranges and sort=newest
+CREATED_TS = "created_ts"
+
+# The ORDER BY of each explicit sort, ahead of seq
+SORT_COLUMNS = {"rating": ("rating", "DESC"), "time": ("cooking_time", "ASC"), "newest": (CREATED_TS, "DESC")}
+
+
+def sqlite_path(database_url: str) -> str:
+    """Turn a sqlite:///path DATABASE_URL into a sqlite3 filename"""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix):
+        raise ValueError(f"Not a SQLite DATABASE_URL: {database_url}")
+    return database_url[len(prefix):] or ":memory:"
+
+
+def _row(recipe: Recipe) -> tuple:
+    return (
+        recipe.id, recipe.title, recipe.description, recipe.image, recipe.category,
+        recipe.difficulty, recipe.cookingTime, recipe.servings,
+        json.dumps(recipe.ingredients), json.dumps(recipe.instructions), json.dumps(recipe.tags),
+        recipe.rating, recipe.author, recipe.createdAt.isoformat(), recipe.isFavorite,
+    )
+
+
+def _recipe(row: tuple) -> Recipe:
+    return Recipe.model_construct(
+        id=row[0], title=row[1], description=row[2], image=row[3], category=row[4],
+        difficulty=row[5], cookingTime=row[6], servings=row[7],
+        ingredients=json.loads(row[8]), instructions=json.loads(row[9]), tags=json.loads(row[10]),
+        rating=row[11], author=row[12], createdAt=datetime.fromisoformat(row[13]),
+        isFavorite=None if row[14] is None else bool(row[14]),
+    )
+
+
+def _search_text(recipe: Recipe) -> str:
+    # Lowercased here rather than by SQLite so matching agrees with str.lower()
+    return "\n".join(text.lower() for text in searchable_text(recipe))
+
+
+def _containing(text: str) -> Tuple[str, str]:
+    """A recipes_fts condition for search texts holding text, and its parameter"""
+    # Trigram MATCH needs three characters; shorter texts fall back to instr()
+    if len(text) >= 3:
+        return "recipes_fts MATCH ?", '"' + text.replace('"', '""') + '"'
+    return "instr(search_text, ?) > 0", text
+
+
+def _entries(phrase: str) -> List[Tuple[int, str, str]]:
+    """The suggestion_entries rows of a phrase"""
+    return [(offset > 0, phrase[offset:].lower(), phrase) for offset in word_starts(phrase)]
+
+
+class SQLiteRecipeStore:
+    """RecipeStore-compatible catalog persisted to SQLite.
+
+    Catalog order is the AUTOINCREMENT seq column, so updates keep a recipe's
+    position like the in-memory store does. Free-text search goes through an
+    FTS5 trigram table holding the lowercased searchable fields, which keeps
+    the endpoint's substring semantics; the facet filters use plain indexes.
+    BM25 statistics, hybrid vectors, similar recipes, spelling and
+    suggestions have tables of their own, kept in step by every write, so
+    none of them reads the whole catalog.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        if CREATED_TS not in [row[1] for row in self._conn.execute("PRAGMA table_info(recipes)")]:
+            # A database from before the created range filters: fill the column in
+            with self._conn:
+                self._conn.execute(f"ALTER TABLE recipes ADD COLUMN {CREATED_TS} REAL")
+                self._conn.executemany(
+                    f"UPDATE recipes SET {CREATED_TS} = ? WHERE seq = ?",
+                    [(timestamp(datetime.fromisoformat(created)), seq)
+                     for seq, created in self._conn.execute("SELECT seq, created_at FROM recipes").fetchall()])
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_recipes_created_ts ON recipes ({CREATED_TS})")
+        if self._conn.execute("SELECT NOT EXISTS (SELECT 1 FROM recipe_lengths) "
+                              "AND EXISTS (SELECT 1 FROM recipes)").fetchone()[0]:
+            # A database from before some of the per-recipe tables: index what it holds
+            with self._conn:
+                for table in (*RECIPE_TABLES, "spelling_deletions", "suggestion_entries"):
+                    self._conn.execute(f"DELETE FROM {table}")
+                for row in self._conn.execute(f"SELECT seq, {COLUMNS} FROM recipes").fetchall():
+                    self._index(row[0], _recipe(row[1:]))
+
+    def copy(self) -> "SQLiteRecipeStore":
+        """Versions all share the database; catalog.write() makes each one a transaction"""
+        return self
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Run a catalog.write() block as one transaction, committed when it exits and rolled back on an exception.
+
+        The writes inside use savepoints, so one that fails (a taken id in a
+        bulk import) undoes only itself. Everything sharing the connection
+        sees the transaction before it commits: this isolates versions from
+        failed writes, not readers from a write in progress.
+        """
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.rollback()
+            raise
+        self._conn.commit()
+
+    @contextmanager
+    def _atomic(self) -> Iterator[None]:
+        """One write: a transaction of its own, or a savepoint inside transaction()'s"""
+        if not self._conn.in_transaction:
+            with self._conn:
+                yield
+            return
+        self._conn.execute("SAVEPOINT write")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK TO write")
+            raise
+        finally:
+            self._conn.execute("RELEASE write")
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+
+    def __contains__(self, recipe_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM recipes WHERE id = ?", (recipe_id,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[Recipe]:
+        for row in self._conn.execute(f"SELECT {COLUMNS} FROM recipes ORDER BY seq"):
+            yield _recipe(row)
+
+    def get(self, recipe_id: str) -> Optional[Recipe]:
+        """Return the recipe with this id, or None"""
+        row = self._conn.execute(f"SELECT {COLUMNS} FROM recipes WHERE id = ?", (recipe_id,)).fetchone()
+        return None if row is None else _recipe(row)
+
+    def get_many(self, recipe_ids: Sequence[str]) -> List[Optional[Recipe]]:
+        """get() for each id, in order, in one query"""
+        found = {}
+        if recipe_ids:
+            rows = self._conn.execute(f"SELECT {COLUMNS} FROM recipes WHERE id IN (SELECT value FROM json_each(?))",
+                                      (json.dumps(list(recipe_ids)),))
+            found = {recipe.id: recipe for recipe in map(_recipe, rows)}
+        return [found.get(recipe_id) for recipe_id in recipe_ids]
+
+    def add(self, recipe: Recipe) -> None:
+        """Append a new recipe; raises KeyError if the id is taken"""
+        with self._atomic():
+            try:
+                cursor = self._conn.execute(
+                    f"INSERT INTO recipes ({COLUMNS}, {CREATED_TS}) VALUES ({', '.join('?' * 16)})",
+                    (*_row(recipe), timestamp(recipe.createdAt)))
+            except sqlite3.IntegrityError:
+                raise KeyError(recipe.id)
+            self._conn.execute("INSERT INTO recipes_fts (rowid, search_text) VALUES (?, ?)",
+                               (cursor.lastrowid, _search_text(recipe)))
+            self._index(cursor.lastrowid, recipe)
+
+    def replace(self, recipe_id: str, recipe: Recipe) -> None:
+        """Swap the recipe stored under recipe_id, keeping its position"""
+        with self._atomic():
+            seq = self._seq(recipe_id)
+            assignments = ", ".join(f"{column} = ?" for column in (*COLUMNS.split(", "), CREATED_TS))
+            self._conn.execute(f"UPDATE recipes SET {assignments} WHERE seq = ?",
+                               (*_row(recipe), timestamp(recipe.createdAt), seq))
+            self._conn.execute("UPDATE recipes_fts SET search_text = ? WHERE rowid = ?",
+                               (_search_text(recipe), seq))
+            self._unindex(seq)
+            self._index(seq, recipe)
+
+    def remove(self, recipe_id: str) -> Recipe:
+        """Delete and return the recipe with this id; raises KeyError if missing"""
+        with self._atomic():
+            recipe = self.get(recipe_id)
+            if recipe is None:
+                raise KeyError(recipe_id)
+            seq = self._seq(recipe_id)
+            self._conn.execute("DELETE FROM recipes WHERE seq = ?", (seq,))
+            self._conn.execute("DELETE FROM recipes_fts WHERE rowid = ?", (seq,))
+            self._unindex(seq)
+        return recipe
+
+    def clear(self) -> None:
+        with self._atomic():
+            self._conn.execute("DELETE FROM recipes")
+            self._conn.execute("DELETE FROM recipes_fts")
+            for table in (*RECIPE_TABLES, "spelling_deletions", "suggestion_entries"):
+                self._conn.execute(f"DELETE FROM {table}")
+
+    def _index(self, seq: int, recipe: Recipe) -> None:
+        """Fill the per-recipe tables for the recipe at seq"""
+        lines = recipe_keys(recipe)
+        self._conn.executemany("INSERT INTO recipe_ingredients (name, seq) VALUES (?, ?)",
+                               [(key, seq) for keys in lines for key in keys])
+        self._conn.execute("INSERT INTO recipe_ingredient_lines (seq, lines) VALUES (?, ?)", (seq, len(lines)))
+        self._conn.execute("INSERT INTO recipe_lengths VALUES (?, ?, ?, ?, ?, ?)", (seq, *field_lengths(recipe)))
+        if np is not None:
+            self._conn.execute("INSERT INTO recipe_vectors (seq, vector) VALUES (?, ?)",
+                               (seq, embed(recipe).tobytes()))
+        sig = signature(recipe)
+        if sig is not None:
+            self._conn.execute("INSERT INTO recipe_signatures (seq, signature) VALUES (?, ?)", (seq, sig))
+            self._conn.executemany("INSERT INTO recipe_bands (band, seq) VALUES (?, ?)",
+                                   [(band, seq) for band in bands(sig)])
+
+        words = list(spelling_words(recipe))
+        new = self._conn.execute("SELECT value FROM json_each(?) WHERE value NOT IN (SELECT word FROM recipe_words)",
+                                 (json.dumps(words),)).fetchall()
+        self._conn.executemany("INSERT OR IGNORE INTO spelling_deletions (deletion, word) VALUES (?, ?)",
+                               [(key, word) for word, in new for key in deletions(word[:PREFIX_LENGTH], MAX_DISTANCE)])
+        self._conn.executemany("INSERT INTO recipe_words (word, seq) VALUES (?, ?)", [(word, seq) for word in words])
+
+        phrases = list(suggestion_phrases(recipe))
+        new = self._conn.execute(
+            "SELECT value FROM json_each(?) WHERE value NOT IN (SELECT phrase FROM recipe_phrases)",
+            (json.dumps(phrases),)).fetchall()
+        self._conn.executemany("INSERT OR IGNORE INTO suggestion_entries (later, text, phrase) VALUES (?, ?, ?)",
+                               [entry for phrase, in new for entry in _entries(phrase)])
+        self._conn.executemany("INSERT INTO recipe_phrases (phrase, seq) VALUES (?, ?)",
+                               [(phrase, seq) for phrase in phrases])
+
+    def _unindex(self, seq: int) -> None:
+        """Empty the per-recipe tables of seq, dropping the suggestion entries of phrases no recipe has left"""
+        phrases = [row[0] for row in self._conn.execute("SELECT phrase FROM recipe_phrases WHERE seq = ?", (seq,))]
+        for table in RECIPE_TABLES:
+            self._conn.execute(f"DELETE FROM {table} WHERE seq = ?", (seq,))
+        self._conn.execute("DELETE FROM suggestion_entries WHERE phrase IN (SELECT value FROM json_each(?)) "
+                           "AND phrase NOT IN (SELECT phrase FROM recipe_phrases)", (json.dumps(phrases),))
+
+    def _document_frequency(self, term: str) -> int:
+        """Number of recipes with term somewhere in their searchable text"""
+        fts, param = _containing(term)
+        return self._conn.execute(f"SELECT COUNT(*) FROM recipes_fts WHERE {fts}", (param,)).fetchone()[0]
+
+    def _bm25(self, query: str) -> BM25:
+        """A BM25 scorer with the statistics counted by SQLite"""
+        count, *totals = self._conn.execute(
+            "SELECT COUNT(*), TOTAL(title), TOTAL(description), TOTAL(author), TOTAL(tags), TOTAL(ingredients) "
+            "FROM recipe_lengths").fetchone()
+        return BM25(query, count, self._document_frequency, [total / count if count else 0.0 for total in totals])
+
+    def position(self, recipe_id: str) -> int:
+        """Where the recipe sits in catalog order (its seq); raises KeyError if missing"""
+        return self._seq(recipe_id)
+
+    def _seq(self, recipe_id: str) -> int:
+        row = self._conn.execute("SELECT seq FROM recipes WHERE id = ?", (recipe_id,)).fetchone()
+        if row is None:
+            raise KeyError(recipe_id)
+        return row[0]
+
+    def search(self, filters: RecipeFilter, limit: Optional[int] = None, after: Optional[str] = None,
+               count: bool = True) -> Tuple[int, List[Recipe]]:
+        """Total matches and the first limit of them in main.filter_recipes order, served by SQLite.
+
+        after is the id of the last recipe already returned; the page starts
+        right behind it. Catalog position is seq.
+        The total is counted whatever count says.
+        """
+        clauses = ["cooking_time <= ?"]
+        params: list = [filters.maxTime]
+        if filters.category != "All Categories":
+            clauses.append("category = ?")
+            params.append(filters.category)
+        if filters.difficulty != "All":
+            clauses.append("difficulty = ?")
+            params.append(filters.difficulty)
+        for clause, value in (("rating >= ?", filters.minRating), ("servings >= ?", filters.minServings),
+                              ("servings <= ?", filters.maxServings),
+                              (f"{CREATED_TS} >= ?", filters.createdFrom and timestamp(filters.createdFrom)),
+                              (f"{CREATED_TS} < ?", filters.createdBefore and timestamp(filters.createdBefore))):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+
+        query = compile_search(filters)
+        by = SORT_KEYS.get(filters.sort)
+        hybrid = query is not None and filters.rank == "hybrid" and by is None
+        # Every match contains its required terms, so the longest one narrows
+        # the rows; the query itself is checked in Python below. Hybrid hits
+        # needn't contain them
+        required = max(query.required(), key=len, default="") if query and not hybrid else ""
+        if required:
+            fts, param = _containing(required)
+            params.append(param)
+            clauses.append(f"seq IN (SELECT rowid FROM recipes_fts WHERE {fts})")
+
+        where = " AND ".join(clauses)
+        after_seq = None if after is None else self._seq(after)
+        if query is None and by is not None:
+            # Sorted on an indexed column, seeking past the cursor's (value, seq)
+            total = self._conn.execute(f"SELECT COUNT(*) FROM recipes WHERE {where}", params).fetchone()[0]
+            column, direction = SORT_COLUMNS[filters.sort]
+            seek: tuple = ()
+            if after_seq is not None:
+                value = self._conn.execute(f"SELECT {column} FROM recipes WHERE seq = ?", (after_seq,)).fetchone()[0]
+                where += f" AND ({column} {'<' if direction == 'DESC' else '>'} ? OR {column} = ? AND seq > ?)"
+                seek = (value, value, after_seq)
+            rows = self._conn.execute(
+                f"SELECT {COLUMNS} FROM recipes WHERE {where} ORDER BY {column} {direction}, seq LIMIT ?",
+                (*params, *seek, -1 if limit is None else limit))
+            return total, [_recipe(row) for row in rows]
+        if query is None:
+            # Catalog order needs no ranking, so SQLite can count and page by itself,
+            # seeking past the cursor on the primary key
+            total = self._conn.execute(f"SELECT COUNT(*) FROM recipes WHERE {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {COLUMNS} FROM recipes WHERE {where} AND seq > ? ORDER BY seq LIMIT ?",
+                (*params, -1 if after_seq is None else after_seq, -1 if limit is None else limit))
+            return total, [_recipe(row) for row in rows]
+
+        if hybrid:
+            # Every recipe passing the facets is scored, against its stored vector
+            rows = self._conn.execute(f"SELECT seq, {COLUMNS}, vector FROM recipes LEFT JOIN recipe_vectors "
+                                      f"USING (seq) WHERE {where} ORDER BY seq", params)
+            positions, recipes, vectors = [], [], []
+            for row in rows:
+                recipe = _recipe(row[1:-1])
+                positions.append(row[0])
+                recipes.append(recipe)
+                # Rows written without numpy have none
+                vectors.append(embed(recipe) if row[-1] is None else np.frombuffer(row[-1], dtype=np.float32))
+            scorer = HybridScorer(query, len(self), self._document_frequency)
+            cursor = None if after is None else (sort_key(self.get(after), filters, scorer), after_seq)
+            total, scored = rank_hybrid(recipes, positions, scorer, limit, cursor, vectors)
+            return total, [recipe for _, recipe in scored]
+        rows = self._conn.execute(f"SELECT seq, {COLUMNS} FROM recipes WHERE {where} ORDER BY seq", params)
+        # The FTS text joins all fields, so drop hits that straddle two of them
+        positions, recipes = [], []
+        for row in rows:
+            recipe = _recipe(row[1:])
+            if query.matches(recipe):
+                positions.append(row[0])
+                recipes.append(recipe)
+        # FTS5's own bm25() ranks trigrams, not words: the statistics come from recipe_lengths and recipes_fts
+        scorer = self._bm25(query.ranking_text) if filters.rank == "bm25" and by is None else None
+        cursor = None
+        if after is not None:
+            cursor = index_cursor((sort_key(self.get(after), filters, scorer), after_seq), positions)
+        if scorer is not None:
+            scored = rank_bm25(recipes, scorer, limit, cursor)
+            return len(recipes), [recipe for _, recipe in scored]
+        key = by or query.key
+        return len(recipes), top_k(after_cursor(recipes, key, cursor), limit, key=key)
+
+    def filter(self, filters: RecipeFilter) -> List[Recipe]:
+        """Same results as scanning with main.filter_recipes, served by SQLite"""
+        return self.search(filters)[1]
+
+    def pantry(self, keys: Sequence[str], complete: bool = False,
+               limit: Optional[int] = None) -> Tuple[int, List[PantryHit]]:
+        """Recipes the pantry keys cover lines of, counted and ranked by SQLite"""
+        if not keys:
+            return 0, []
+        rows = self._conn.execute(
+            f"SELECT {COLUMNS}, matched, lines, COUNT(*) OVER () FROM "
+            f"(SELECT seq, COUNT(*) AS matched FROM recipe_ingredients "
+            f"WHERE name IN ({', '.join('?' * len(keys))}) GROUP BY seq) "
+            f"JOIN recipe_ingredient_lines USING (seq) JOIN recipes USING (seq) "
+            f"WHERE lines > 0{' AND matched = lines' if complete else ''} "
+            f"ORDER BY matched * 1.0 / lines DESC, matched DESC, rating DESC, seq LIMIT ?",
+            (*keys, -1 if limit is None else limit)).fetchall()
+        if not rows:
+            return 0, []
+        return rows[0][-1], [PantryHit(_recipe(row[:-3]), row[-3], row[-2]) for row in rows]
+
+    def similar(self, recipe, limit: int) -> List[Tuple[float, Recipe]]:
+        """The limit recipes most like recipe, from the recipes sharing an LSH band with it"""
+        sig = signature(recipe)
+        if sig is None:
+            return []
+        keys = bands(sig)
+        hits = self._conn.execute(
+            f"SELECT seq, COUNT(*) FROM recipe_bands JOIN recipes USING (seq) WHERE band IN "
+            f"({', '.join('?' * len(keys))}) AND id != ? GROUP BY seq ORDER BY seq", (*keys, recipe.id)).fetchall()
+        seqs = [hits[i][0] for i in shortlist([shared for _, shared in hits])]
+        if not seqs:
+            return []
+        rows = {row[0]: row[1:] for row in self._conn.execute(
+            f"SELECT seq, signature, {COLUMNS} FROM recipe_signatures JOIN recipes USING (seq) "
+            f"WHERE seq IN (SELECT value FROM json_each(?))", (json.dumps(seqs),))}
+        scores = agreement(sig, [rows[seq][0] for seq in seqs])
+        ranked = sorted(zip(scores, seqs), key=lambda pair: -pair[0])[:limit]
+        return [(score, _recipe(rows[seq][1:])) for score, seq in ranked]
+
+    def spelling(self, words: Sequence[str]) -> Dict[str, Optional[List[Candidate]]]:
+        """Spelling candidates for search words (None for words the catalog has), from spelling_deletions"""
+        result: Dict[str, Optional[List[Candidate]]] = {}
+        for word in words:
+            if self._document_frequency(word):
+                result[word] = None
+                continue
+            limit = max_distance(word)
+            keys = list(deletions(word[:PREFIX_LENGTH], limit)) if limit else []
+            close = {}
+            for candidate, in self._conn.execute(
+                    "SELECT DISTINCT word FROM spelling_deletions WHERE deletion IN (SELECT value FROM json_each(?))",
+                    (json.dumps(keys),)):
+                distance = edit_distance(word, candidate, limit)
+                if distance <= limit:
+                    close[candidate] = distance
+            # Words no recipe has any more keep their deletions but count nowhere
+            counts = self._conn.execute(
+                "SELECT word, COUNT(*) FROM recipe_words WHERE word IN (SELECT value FROM json_each(?)) GROUP BY word",
+                (json.dumps(list(close)),))
+            result[word] = [(candidate, close[candidate], recipes) for candidate, recipes in counts]
+        return result
+
+    def suggestions(self, term: str, limit: Optional[int] = None) -> List[str]:
+        """Titles, tags and main ingredient names matching term: whole-phrase matches, then word matches"""
+        prefix = normalize(term)
+        found: Dict[str, None] = {}
+        for later in (0, 1):
+            # Walks suggestion_entries' primary key from the prefix, like SuggestionIndex walks its blocks
+            rows = self._conn.execute("SELECT text, phrase FROM suggestion_entries WHERE later = ? AND text >= ? "
+                                      "ORDER BY text, phrase", (later, prefix))
+            for text, phrase in rows:
+                if len(found) == limit or not text.startswith(prefix):
+                    break
+                found[phrase] = None
+        return list(found)
+
+    def facets(self, filters: RecipeFilter) -> FacetCounts:
+        """Matches per category, difficulty and cookingTime bucket, counting the unfaceted search's hits"""
+        return count_facets(self.search(unfaceted(filters))[1], filters)
+
+    def highlights(self, recipes: Sequence, filters: RecipeFilter) -> List[Dict[str, List[Span]]]:
+        """Spans of each recipe matching the search, per field, tokenizing just these recipes: rows keep no positions"""
+        return scan_highlights(recipes, compile_search(filters))
+
+    def categories(self) -> List[str]:
+        return [row[0] for row in self._conn.execute("SELECT DISTINCT category FROM recipes")]
+
+    def stats(self) -> Dict:
+        """Per-category and per-difficulty counts plus the sum of ratings"""
+        def counts(column: str) -> Dict[str, int]:
+            rows = self._conn.execute(
+                f"SELECT {column}, COUNT(*) FROM recipes GROUP BY {column} ORDER BY MIN(seq)")
+            return dict(rows.fetchall())
+
+        rating_sum = self._conn.execute("SELECT TOTAL(rating) FROM recipes").fetchone()[0]
+        return {
+            "categories": counts("category"),
+            "difficulties": counts("difficulty"),
+            "rating_sum": rating_sum,
+        }
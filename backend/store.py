@@ -0,0 +1,577 @@
+import threading
+from itertools import islice
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from bitset import iter_bits, mask_of
+from columnar import ColumnarIndex
+from facet_index import FacetCounts, FacetIndex, count_facets, unfaceted
+from filters import SORT_KEYS, Cursor, follows, matches_facets, top_k
+from highlight import PositionIndex, Span, highlight, occurrences
+from models import Recipe, RecipeFilter
+from pantry import PantryHit, PantryIndex
+from query import Term, compile_search
+from ranking import BM25, FieldLengths, sort_key
+from records import RecipeRecord
+from search_index import TokenIndex, TrigramIndex, tag_text, title_text, tokenize
+from similarity import SimilarityIndex, signature
+from sort_index import SortIndex
+from spelling import Candidate, SpellIndex
+from suggestions import SuggestionIndex
+from vectors import MIN_SIMILARITY, HybridScorer, VectorIndex, rank_hybrid
+from versions import CopyOnWriteDict, CopyOnWriteList
+
+
+# Held while an optional index is built (see RecipeStore._optional)
+_BUILDING = threading.Lock()
+
+
+class RecipeStore:
+    """Insertion-ordered recipe catalog with O(1) access by recipe id.
+
+    Recipes are kept as compact RecipeRecords in a list of slots so iteration
+    keeps insertion order, and a dict maps each id to its slot; both are
+    copy-on-write (versions.py) so catalog versions share them. Deletes leave a hole that is skipped while
+    iterating; once holes outnumber live recipes the slots are compacted.
+
+    Secondary indexes are keyed by slot and kept in step with every write
+    through their add/remove/clear methods. With columnar=True the store also
+    keeps NumPy columns and filters, ranks and aggregates with them; with
+    vectors=True it keeps the vector matrix ?rank=hybrid scores queries with.
+
+    The indexes only one endpoint needs (similar recipes, spelling, highlight
+    positions and the vector matrix) are built from the slots the first time
+    a version is asked for them, and from then on kept in step and carried
+    over to later versions like the rest. A catalog that never serves those
+    endpoints never pays their memory.
+    """
+
+    # Don't bother compacting tiny catalogs
+    COMPACT_MIN_HOLES = 1024
+    # Sorted pages walk the permutation unless that visits this many slots per match
+    SORTED_WALK = 4
+
+    def __init__(self, columnar: bool = False, vectors: bool = False):
+        self._slots: CopyOnWriteList[Optional[RecipeRecord]] = CopyOnWriteList()
+        self._by_id: CopyOnWriteDict[str, int] = CopyOnWriteDict()
+        self.text_index = TokenIndex()
+        self.trigram_index = TrigramIndex()
+        # Where title- and tag-tier hits can be, for relevance pages
+        self.title_index = TrigramIndex(title_text)
+        self.tag_index = TrigramIndex(tag_text)
+        self.facet_index = FacetIndex()
+        self.field_lengths = FieldLengths()
+        self.pantry_index = PantryIndex()
+        self.sort_index = SortIndex()
+        self.suggestion_index = SuggestionIndex()
+        self._indexes = [self.text_index, self.trigram_index, self.title_index, self.tag_index,
+                         self.facet_index, self.field_lengths, self.pantry_index, self.sort_index,
+                         self.suggestion_index]
+        self.columns = ColumnarIndex() if columnar else None
+        if self.columns is not None:
+            self._indexes.append(self.columns)
+        self.vectors = vectors
+        # The optional indexes built so far, by name; see _optional
+        self._built: Dict[str, object] = {}
+
+    def copy(self) -> "RecipeStore":
+        """A copy to write the next catalog version into.
+
+        Records are immutable and shared. The slot list, the id map and the
+        indexes share their chunks, buckets, postings and bitsets
+        copy-on-write, so a write pays for the pieces it actually touches
+        rather than for the size of the catalog.
+        """
+        clone = RecipeStore.__new__(RecipeStore)
+        clone._slots = self._slots.copy()
+        clone._by_id = self._by_id.copy()
+        clone.text_index = self.text_index.copy()
+        clone.trigram_index = self.trigram_index.copy()
+        clone.title_index = self.title_index.copy()
+        clone.tag_index = self.tag_index.copy()
+        clone.facet_index = self.facet_index.copy()
+        clone.field_lengths = self.field_lengths.copy()
+        clone.pantry_index = self.pantry_index.copy()
+        clone.sort_index = self.sort_index.copy()
+        clone.suggestion_index = self.suggestion_index.copy()
+        clone._indexes = [clone.text_index, clone.trigram_index, clone.title_index, clone.tag_index,
+                          clone.facet_index, clone.field_lengths, clone.pantry_index, clone.sort_index,
+                          clone.suggestion_index]
+        clone.columns = None if self.columns is None else self.columns.copy()
+        if clone.columns is not None:
+            clone._indexes.append(clone.columns)
+        clone.vectors = self.vectors
+        clone._built = {name: index.copy() for name, index in self._built.items()}
+        clone._indexes.extend(clone._built.values())
+        return clone
+
+    def _optional(self, name: str, factory: Callable[[], object]):
+        """The optional index called name, built from the slots on first use"""
+        index = self._built.get(name)
+        if index is None:
+            # Readers of one version may race to build it; they take turns and the first one wins
+            with _BUILDING:
+                index = self._built.get(name)
+                if index is None:
+                    index = factory()
+                    index.load(list(self._slots))
+                    self._indexes = self._indexes + [index]
+                    # Swapped in whole, so a concurrent copy() sees the index complete or not at all
+                    self._built = {**self._built, name: index}
+        return index
+
+    @property
+    def similarity_index(self) -> SimilarityIndex:
+        return self._optional("similarity", SimilarityIndex)
+
+    @property
+    def spell_index(self) -> SpellIndex:
+        return self._optional("spelling", SpellIndex)
+
+    @property
+    def position_index(self) -> PositionIndex:
+        return self._optional("positions", PositionIndex)
+
+    @property
+    def vector_index(self) -> Optional[VectorIndex]:
+        """The vector matrix, or None unless the store was made with vectors=True"""
+        return self._optional("vectors", VectorIndex) if self.vectors else None
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, recipe_id: str) -> bool:
+        return recipe_id in self._by_id
+
+    def __iter__(self) -> Iterator[RecipeRecord]:
+        for recipe in self._slots:
+            if recipe is not None:
+                yield recipe
+
+    def get(self, recipe_id: str) -> Optional[RecipeRecord]:
+        """Return the recipe with this id, or None"""
+        slot = self._by_id.get(recipe_id)
+        return None if slot is None else self._slots[slot]
+
+    def get_many(self, recipe_ids: Sequence[str]) -> List[Optional[RecipeRecord]]:
+        """get() for each id, in order"""
+        return [self.get(recipe_id) for recipe_id in recipe_ids]
+
+    def position(self, recipe_id: str) -> int:
+        """Where the recipe sits in catalog order (its slot); raises KeyError if missing"""
+        return self._by_id[recipe_id]
+
+    def slot_count(self) -> int:
+        """Number of slots, holes included; every slot the indexes name is below it"""
+        return len(self._slots)
+
+    def recipe_at(self, slot: int) -> Optional[RecipeRecord]:
+        """The recipe in slot, or None for a hole"""
+        return self._slots[slot]
+
+    def add(self, recipe: Recipe) -> None:
+        """Append a new recipe; raises KeyError if the id is taken"""
+        if recipe.id in self._by_id:
+            raise KeyError(recipe.id)
+        recipe = self._record(recipe)
+        slot = len(self._slots)
+        self._by_id[recipe.id] = slot
+        self._slots.append(recipe)
+        for index in self._indexes:
+            index.add(slot, recipe)
+
+    def load(self, recipes: Iterable[Recipe]) -> None:
+        """Append recipes to an empty store in bulk; raises KeyError on a repeated id.
+
+        Each index collects its entries for all of the recipes and freezes
+        them into postings, bitsets and blocks once, instead of taking a
+        copy-on-write add() per recipe: snapshot recovery and compaction use it.
+        """
+        if self._slots:
+            raise ValueError("load() fills an empty store")
+        records = []
+        for recipe in map(self._record, recipes):
+            if recipe.id in self._by_id:
+                self._by_id.clear()
+                raise KeyError(recipe.id)
+            self._by_id[recipe.id] = len(records)
+            records.append(recipe)
+        self._slots.extend(records)
+        for index in self._indexes:
+            index.load(records)
+
+    def replace(self, recipe_id: str, recipe: Recipe) -> None:
+        """Swap the recipe stored under recipe_id, keeping its position"""
+        recipe = self._record(recipe)
+        slot = self._by_id.pop(recipe_id)
+        old = self._slots[slot]
+        self._by_id[recipe.id] = slot
+        self._slots[slot] = recipe
+        for index in self._indexes:
+            index.remove(slot, old)
+            index.add(slot, recipe)
+
+    def remove(self, recipe_id: str) -> RecipeRecord:
+        """Delete and return the recipe with this id; raises KeyError if missing"""
+        slot = self._by_id.pop(recipe_id)
+        recipe = self._slots[slot]
+        self._slots[slot] = None
+        for index in self._indexes:
+            index.remove(slot, recipe)
+
+        holes = len(self._slots) - len(self._by_id)
+        if holes >= self.COMPACT_MIN_HOLES and holes > len(self._by_id):
+            self._compact()
+        return recipe
+
+    @staticmethod
+    def _record(recipe) -> RecipeRecord:
+        return recipe if isinstance(recipe, RecipeRecord) else RecipeRecord.from_recipe(recipe)
+
+    def clear(self) -> None:
+        self._slots.clear()
+        self._by_id.clear()
+        for index in self._indexes:
+            index.clear()
+
+    def _candidates(self, text: str) -> Optional[int]:
+        """Bitmask of the slots that may contain text, or None when the indexes can't narrow it down"""
+        slots = self.trigram_index.candidates(text)
+        if slots is None:
+            slots = self.text_index.candidates(text)
+        return slots
+
+    def _candidate_mask(self, filters: RecipeFilter) -> int:
+        """Bitmask of slots that may match the free-text search"""
+        mask = compile_search(filters).candidates(self._candidates)
+        if mask is None:
+            # Nothing to narrow on (e.g. a lone space): every slot is a candidate
+            return int(self.facet_index.live)
+        return mask
+
+    def _filter_mask(self, filters: RecipeFilter) -> int:
+        """Bitmask of slots passing the facet and range filters"""
+        mask = self.facet_index.mask(filters)
+        ranges = self.sort_index.range_mask(filters)
+        return mask if ranges is None else mask & ranges
+
+    def browse(self, filters: RecipeFilter, limit: Optional[int] = None,
+               after: int = -1) -> Tuple[int, List[RecipeRecord]]:
+        """How many recipes pass the facet and range filters, and the first limit of them past slot after"""
+        if self.columns is not None:
+            slots = self.columns.mask(filters).nonzero()[0]
+            total = len(slots)
+            start = int(slots.searchsorted(after, side="right"))
+            slots = slots[start:start + limit if limit is not None else None].tolist()
+        else:
+            mask = self._filter_mask(filters)
+            total = mask.bit_count()
+            # Clearing the bits up to after skips there without walking them
+            slots = islice(iter_bits(mask >> (after + 1) << (after + 1)), limit)
+        return total, [self._slots[slot] for slot in slots]
+
+    @staticmethod
+    def _exact(query) -> bool:
+        """Whether the candidates of query are its matches: a literal term of one trigram, or of one short word"""
+        plan = query.plan
+        if not isinstance(plan, Term) or plan.field is not None or len(plan.text) > TrigramIndex.MIN_QUERY:
+            return False
+        # A word inside some field is inside one of its tokens
+        return len(plan.text) == TrigramIndex.MIN_QUERY or tokenize(plan.text) == [plan.text]
+
+    def _hits(self, filters: RecipeFilter, mask: int = -1) -> int:
+        """Bitmask of the slots in mask matching the free-text search; only its candidates are checked"""
+        return self._verified(compile_search(filters), self._candidate_mask(filters) & mask)
+
+    def _verified(self, query, candidates: int) -> int:
+        """The candidates that match query, all of them when its candidates are exact"""
+        if self._exact(query):
+            return candidates
+        slots = self._slots
+        return mask_of([slot for slot in iter_bits(candidates) if query.matches(slots[slot])])
+
+    def _lazy(self, count: bool, limit: Optional[int], candidates: int) -> bool:
+        """Whether to page through unverified candidates, matching each only until the page is full.
+
+        That leaves the total uncounted, so only when the caller didn't ask
+        for it and there are too many candidates to just check them all.
+        """
+        return not count and limit is not None and candidates.bit_count() > limit * self.SORTED_WALK
+
+    def _search_slots(self, filters: RecipeFilter) -> List[int]:
+        """Slots matching a free-text search and the facet filters, in catalog order"""
+        return list(iter_bits(self._hits(filters, self._filter_mask(filters))))
+
+    def bm25(self, query: str) -> BM25:
+        """A BM25 scorer for query using the index's live corpus statistics"""
+        return BM25(query, len(self), self.text_index.document_frequency, self.field_lengths.averages())
+
+    def scored(self, filters: RecipeFilter, scorer: Optional[BM25] = None, limit: Optional[int] = None,
+               cursor: Optional[Cursor] = None) -> Tuple[int, List[Tuple[float, RecipeRecord]]]:
+        """Number of search hits and the best limit of them with their BM25 scores; ties keep catalog order"""
+        slots = self._search_slots(filters)
+        scorer = scorer or self.bm25(compile_search(filters).ranking_text)
+        scored = [(scorer.score(self._slots[slot], self.field_lengths.get(slot)), slot) for slot in slots]
+        if cursor is not None:
+            scored = [(score, slot) for score, slot in scored if follows((score,), slot, cursor)]
+        return len(slots), [(score, self._slots[slot]) for score, slot in top_k(scored, limit, key=itemgetter(0))]
+
+    def hybrid_scorer(self, filters: RecipeFilter) -> HybridScorer:
+        """A hybrid scorer for the search of filters using the index's live corpus statistics"""
+        return HybridScorer(compile_search(filters), len(self), self.text_index.document_frequency)
+
+    def hybrid(self, filters: RecipeFilter, scorer: Optional[HybridScorer] = None, limit: Optional[int] = None,
+               cursor: Optional[Cursor] = None) -> Tuple[int, List[Tuple[float, RecipeRecord]]]:
+        """Number of hybrid hits and the best limit of them with their blended scores; ties keep catalog order.
+
+        Hits are the search matches plus recipes whose vectors are similar
+        enough, all within the facet filters (see vectors.py).
+        """
+        scorer = scorer or self.hybrid_scorer(filters)
+        if self.vector_index is None:
+            slots = [slot for slot, recipe in enumerate(self._slots)
+                     if recipe is not None and matches_facets(recipe, filters)]
+            return rank_hybrid([self._slots[slot] for slot in slots], slots, scorer, limit, cursor)
+
+        query = scorer.query
+        similarity = self.vector_index.similarities(scorer.vector)
+        lexical = set(self._search_slots(filters))
+        similar = [
+            slot for slot in (similarity >= MIN_SIMILARITY).nonzero()[0].tolist()
+            if slot not in lexical and matches_facets(self._slots[slot], filters)
+            and not query.excludes(self._slots[slot])
+        ]
+        slots = sorted(lexical.union(similar))
+        scored = [
+            (scorer.blend(query.tier(self._slots[slot]) if slot in lexical else None, value), slot)
+            for slot, value in zip(slots, similarity[slots].tolist())
+        ]
+        if cursor is not None:
+            scored = [(score, slot) for score, slot in scored if follows((score,), slot, cursor)]
+        return len(slots), [(score, self._slots[slot]) for score, slot in top_k(scored, limit, key=itemgetter(0))]
+
+    def sorted(self, filters: RecipeFilter, limit: Optional[int] = None, cursor: Optional[Cursor] = None,
+               count: bool = True) -> Tuple[Optional[int], List[RecipeRecord]]:
+        """page() for an explicit sort: the matches in their field's presorted order.
+
+        The walk down the permutation costs about limit / (share of slots
+        matching); when that is more than the matches themselves, they are
+        sorted instead.
+        """
+        mask = self._filter_mask(filters)
+        query = compile_search(filters)
+        lazy = False
+        if query is not None:
+            mask &= self._candidate_mask(filters)
+            lazy = self._lazy(count, limit, mask) and not self._exact(query)
+            if not lazy:
+                mask = self._verified(query, mask)
+        total = mask.bit_count()
+        walk = len(self._slots) if limit is None or not total else limit * len(self._slots) // total
+        if walk <= total * self.SORTED_WALK:
+            slots = self.sort_index.walk(filters.sort, mask, cursor)
+            if lazy:
+                slots = (slot for slot in slots if query.matches(self._slots[slot]))
+            return None if lazy else total, [self._slots[slot] for slot in islice(slots, limit)]
+        key = SORT_KEYS[filters.sort]
+        hits = [(key(self._slots[slot]), slot) for slot in iter_bits(mask)
+                if not lazy or query.matches(self._slots[slot])]
+        total = len(hits)
+        if cursor is not None:
+            hits = [hit for hit in hits if follows(hit[0], hit[1], cursor)]
+        return total, [self._slots[slot] for _, slot in top_k(hits, limit, key=itemgetter(0))]
+
+    def seek(self, filters: RecipeFilter, recipe_id: str, scorer=None) -> Cursor:
+        """The cursor (sort key, slot) of a recipe among the results for filters; KeyError if it is gone"""
+        slot = self.position(recipe_id)
+        if filters.search and filters.sort not in SORT_KEYS:
+            if filters.rank == "bm25":
+                scorer = scorer or self.bm25(compile_search(filters).ranking_text)
+            elif filters.rank == "hybrid":
+                scorer = scorer or self.hybrid_scorer(filters)
+        return sort_key(self._slots[slot], filters, scorer), slot
+
+    def search(self, filters: RecipeFilter, limit: Optional[int] = None, after: Optional[str] = None,
+               count: bool = True) -> Tuple[Optional[int], List[RecipeRecord]]:
+        """Total number of matches and the first limit of them, in main.filter_recipes order.
+
+        Only the requested page is ordered: a heap selects it from the matches.
+        after is the id of the last recipe of the previous page; the page then
+        starts right behind it (keyset pagination), whatever was written since.
+        With count=False a search may leave the total uncounted (None) and
+        check its candidates only up to the end of the page.
+        """
+        return self.page(filters, limit, None if after is None else self.seek(filters, after), count)
+
+    def page(self, filters: RecipeFilter, limit: Optional[int] = None, cursor: Optional[Cursor] = None,
+             count: bool = True) -> Tuple[Optional[int], List[RecipeRecord]]:
+        """search() from a cursor rather than a recipe id"""
+        if filters.sort in SORT_KEYS:
+            return self.sorted(filters, limit, cursor, count)
+        if not filters.search:
+            return self.browse(filters, limit, -1 if cursor is None else cursor[1])
+        if filters.rank in ("bm25", "hybrid"):
+            rank = self.scored if filters.rank == "bm25" else self.hybrid
+            total, scored = rank(filters, limit=limit, cursor=cursor)
+            return total, [recipe for _, recipe in scored]
+
+        query = compile_search(filters)
+        candidates = self._candidate_mask(filters) & self._filter_mask(filters)
+        if self._lazy(count, limit, candidates):
+            exact = self._exact(query)
+            page = self._relevance_page(query, candidates, limit, cursor, verify=not exact)
+            return candidates.bit_count() if exact else None, page
+        hits = self._verified(query, candidates)
+        total = hits.bit_count()
+        if limit is not None and total > limit * self.SORTED_WALK:
+            return total, self._relevance_page(query, hits, limit, cursor)
+        slots = list(iter_bits(hits))
+        if cursor is not None:
+            slots = [slot for slot in slots if follows(query.key(self._slots[slot]), slot, cursor)]
+        if self.columns is None:
+            filtered = [self._slots[slot] for slot in slots]
+            return total, top_k(filtered, limit, key=query.key)
+
+        tiers = [query.tier(self._slots[slot]) for slot in slots]
+        return total, [self._slots[slots[i]] for i in self.columns.rank(slots, tiers, limit)]
+
+    def _tier_masks(self, query) -> List[Tuple[int, int]]:
+        """(tier, bitmask of the slots a hit of that tier can be in) for each relevance tier, best first"""
+        masks = []
+        for tier, index in ((2, self.title_index), (1, self.tag_index)):
+            mask = 0
+            for term in query.terms:
+                slots = index.candidates(term)
+                if slots is None:
+                    # Too short for trigrams: any hit may be in this tier
+                    mask = -1
+                    break
+                mask |= slots
+            masks.append((tier, mask))
+        return masks + [(0, -1)]
+
+    def _by_rating(self, mask: int, limit: int, cursor: Optional[Cursor]) -> Iterator[int]:
+        """The slots of mask by rating, best first and ties in catalog order, after a (rating,) cursor.
+
+        Walks the rating permutation while that visits at most SORTED_WALK
+        slots per slot of mask; a sparser mask is sorted instead.
+        """
+        count = mask.bit_count()
+        if limit * len(self._slots) <= count * count * self.SORTED_WALK:
+            return self.sort_index.walk("rating", mask, cursor)
+        hits = [((self._slots[slot].rating,), slot) for slot in iter_bits(mask)]
+        if cursor is not None:
+            hits = [hit for hit in hits if follows(hit[0], hit[1], cursor)]
+        return (slot for _, slot in sorted(hits, key=lambda hit: (-hit[0][0], hit[1])))
+
+    def _relevance_page(self, query, hits: int, limit: int, cursor: Optional[Cursor],
+                        verify: bool = False) -> List[RecipeRecord]:
+        """The first limit of the hits in relevance order (tier, rating, catalog order), tier by tier.
+
+        A title-tier hit has every trigram of a term in its title and a
+        tag-tier hit in a tag, so each tier walks only the hits the title or
+        tag index allows, by rating, and stops once the page is full. With
+        verify, hits are candidates, each matched against query as it is
+        walked.
+        """
+        page = []
+        for tier, mask in self._tier_masks(query):
+            if cursor is not None and tier > cursor[0][0]:
+                continue
+            after = ((cursor[0][1],), cursor[1]) if cursor is not None and tier == cursor[0][0] else None
+            for slot in self._by_rating(hits & mask, limit - len(page), after):
+                recipe = self._slots[slot]
+                if query.tier(recipe) == tier and (not verify or query.matches(recipe)):
+                    page.append(recipe)
+                    if len(page) == limit:
+                        return page
+        return page
+
+    def facets(self, filters: RecipeFilter, scorer: Optional[HybridScorer] = None) -> FacetCounts:
+        """Matches per category, difficulty and cookingTime bucket (see facet_index.count_facets).
+
+        The search's matches whatever the facet filters, within the range
+        filters, become one bitmask counted against every facet value's bitset.
+        """
+        query = compile_search(filters)
+        ranges = self.sort_index.range_mask(filters)
+        ranges = -1 if ranges is None else ranges
+        if query is None:
+            return self.facet_index.counts(int(self.facet_index.live) & ranges, filters)
+        if filters.rank != "hybrid":
+            return self.facet_index.counts(self._hits(filters) & ranges, filters)
+        if self.vector_index is None:
+            return count_facets((recipe for _, recipe in self.hybrid(unfaceted(filters), scorer)[1]), filters)
+        scorer = scorer or self.hybrid_scorer(filters)
+        similarity = self.vector_index.similarities(scorer.vector)
+        similar = [
+            slot for slot in (similarity >= MIN_SIMILARITY).nonzero()[0].tolist()
+            if not query.excludes(self._slots[slot])
+        ]
+        return self.facet_index.counts((self._hits(filters) | mask_of(similar)) & ranges, filters)
+
+    def filter(self, filters: RecipeFilter) -> List[RecipeRecord]:
+        """Same results as scanning with main.filter_recipes, served from the indexes"""
+        return self.search(filters)[1]
+
+    def pantry(self, keys: Sequence[str], complete: bool = False,
+               limit: Optional[int] = None) -> Tuple[int, List[PantryHit]]:
+        """Recipes the pantry keys (pantry.pantry_keys) cover lines of, or all lines of if complete; the best limit"""
+        total, hits = self.pantry_index.search(keys, complete, limit)
+        return total, [PantryHit(self._slots[slot], matched, lines) for slot, matched, lines in hits]
+
+    def similar(self, recipe, limit: int) -> List[Tuple[float, RecipeRecord]]:
+        """The limit recipes most like recipe (MinHash over ingredients and tags), with their similarity"""
+        slot = self._by_id.get(recipe.id)
+        sig = signature(recipe) if slot is None else self.similarity_index.signature(slot)
+        return [(score, self._slots[other]) for score, other in self.similarity_index.similar(sig, limit, slot)]
+
+    def spelling(self, words: Sequence[str]) -> Dict[str, Optional[List[Candidate]]]:
+        """For each search word, None if some recipe contains it, else its spelling candidates.
+
+        Search words are word tokens, so a recipe contains one exactly when
+        one of its tokens does.
+        """
+        return {
+            word: None if self.text_index.contains(word) else self.spell_index.candidates(word, self.text_index.count)
+            for word in words
+        }
+
+    def suggestions(self, term: str, limit: Optional[int] = None) -> List[str]:
+        """Titles, tags and main ingredient names starting with term or with a word that does (see suggestions.py)"""
+        return self.suggestion_index.lookup(term, limit)
+
+    def highlights(self, recipes: Sequence, filters: RecipeFilter) -> List[Dict[str, List[Span]]]:
+        """Spans of each recipe matching the search, per field, from the stored token positions"""
+        query = compile_search(filters)
+        result = []
+        for recipe in recipes:
+            slot = self._by_id.get(recipe.id)
+            tokens = list(occurrences(recipe)) if slot is None else self.position_index.occurrences(slot)
+            result.append(highlight(tokens, query))
+        return result
+
+    def categories(self) -> List[str]:
+        return list(self.facet_index.categories)
+
+    def stats(self) -> Dict:
+        """Per-category and per-difficulty counts plus the sum of ratings"""
+        if self.columns is not None:
+            return self.columns.stats()
+
+        categories: Dict[str, int] = {}
+        difficulties: Dict[str, int] = {}
+        for recipe in self:
+            categories[recipe.category] = categories.get(recipe.category, 0) + 1
+            difficulties[recipe.difficulty] = difficulties.get(recipe.difficulty, 0) + 1
+        return {
+            "categories": categories,
+            "difficulties": difficulties,
+            "rating_sum": sum(recipe.rating for recipe in self),
+        }
+
+    def _compact(self) -> None:
+        """Drop the holes left by deletes and renumber the slots"""
+        recipes = [recipe for recipe in self._slots if recipe is not None]
+        self.clear()
+        self.load(recipes)
@@ -0,0 +1,248 @@
+"""Prefix index for /search/suggestions.
+
+Suggestions are phrases: recipe titles, tags and the parsed names of each
+recipe's first MAIN_INGREDIENTS ingredient lines, plus main's list of dishes.
+A phrase matches what was typed when it starts with it or has a later word
+that does, case-insensitively ("chick" finds "Butter Chicken"). Each phrase
+is filed in sorted order whole and again from each later word start, so a
+lookup is a bisect to the typed prefix and a walk over the entries sharing
+it: O(log n + k) however big the catalog. Whole-phrase matches come first,
+then word matches, each in order of the matched text.
+
+The sorted entries are kept in blocks of at most 2 * BLOCK, shared
+copy-on-write between catalog versions like the sort permutations. Per
+phrase, postings record the slots that hold it; its entries go when the
+last of them does.
+"""
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from ingredients import parsed_ingredients
+from models import Recipe
+from postings import copy_postings, discard_posting, insert_posting, load_postings, new_postings
+from search_index import TOKEN_RE
+from versions import CopyOnWriteMap
+
+# Ingredient lines of a recipe whose names are suggested
+MAIN_INGREDIENTS = 5
+# Entries per block; blocks split in two past twice this
+BLOCK = 1024
+# Words starting this far into a phrase are not filed
+MAX_OFFSET = 1 << 16
+
+# (matched past the phrase's first word, matched text, phrase): lower comes first
+MatchKey = Tuple[bool, str, str]
+
+
+def suggestion_phrases(recipe: Recipe) -> Set[str]:
+    """The recipe's title, tags and main ingredient names"""
+    phrases = {recipe.title, *recipe.tags}
+    for ingredient in parsed_ingredients(recipe)[:MAIN_INGREDIENTS]:
+        # Capitalized like the dish names, so "chicken" and "Chicken" are one suggestion
+        phrases.add(ingredient.name[:1].upper() + ingredient.name[1:])
+    phrases.discard("")
+    return phrases
+
+
+def normalize(term: str) -> str:
+    return term.lower().lstrip()
+
+
+def word_starts(phrase: str) -> List[int]:
+    """Offsets a match may start at: the phrase's start and every later word's"""
+    return [0] + [match.start() for match in TOKEN_RE.finditer(phrase) if 0 < match.start() < MAX_OFFSET]
+
+
+def match_key(phrase: str, prefix: str) -> Optional[MatchKey]:
+    """Where phrase sorts among the suggestions for a normalize()d prefix; None if it doesn't match"""
+    keys = [(offset > 0, phrase[offset:].lower(), phrase) for offset in word_starts(phrase)]
+    return min((key for key in keys if key[1].startswith(prefix)), default=None)
+
+
+class _Block:
+    __slots__ = ("phrases", "offsets")
+
+    def __init__(self):
+        self.phrases: List[str] = []
+        self.offsets = array("H")
+
+    def copy(self) -> "_Block":
+        clone = _Block()
+        clone.phrases = list(self.phrases)
+        clone.offsets = self.offsets[:]
+        return clone
+
+    def key(self, i: int) -> Tuple[str, str]:
+        phrase = self.phrases[i]
+        return phrase[self.offsets[i]:].lower(), phrase
+
+    def find(self, key: tuple) -> int:
+        """Index of the first entry at or after key"""
+        return bisect_left(range(len(self.phrases)), key, key=self.key)
+
+
+class _Entries:
+    """(phrase, offset) entries ordered by (matched text, phrase) in copy-on-write blocks"""
+
+    def __init__(self):
+        self._blocks: CopyOnWriteMap[int, _Block] = CopyOnWriteMap(_Block, _Block.copy)
+        # Block ids in order, and the key of the last entry of each
+        self._order: List[int] = []
+        self._last: List[Tuple[str, str]] = []
+        self._next_id = 0
+
+    def copy(self) -> "_Entries":
+        clone = _Entries.__new__(_Entries)
+        clone._blocks = self._blocks.copy()
+        clone._order = list(self._order)
+        clone._last = list(self._last)
+        clone._next_id = self._next_id
+        return clone
+
+    def _block_of(self, key: Tuple[str, str]) -> int:
+        """Index in _order of the block key belongs in"""
+        return min(bisect_left(self._last, key), len(self._order) - 1)
+
+    def insert(self, phrase: str, offset: int) -> None:
+        key = phrase[offset:].lower(), phrase
+        if not self._order:
+            self._order.append(self._next_id)
+            self._last.append(key)
+            self._next_id += 1
+        i = self._block_of(key)
+        block = self._blocks.writable(self._order[i])
+        at = block.find(key)
+        block.phrases.insert(at, phrase)
+        block.offsets.insert(at, offset)
+        if len(block.phrases) > 2 * BLOCK:
+            half = self._blocks.writable(self._next_id)
+            half.phrases, half.offsets = block.phrases[BLOCK:], block.offsets[BLOCK:]
+            del block.phrases[BLOCK:], block.offsets[BLOCK:]
+            self._order.insert(i + 1, self._next_id)
+            self._last.insert(i + 1, half.key(len(half.phrases) - 1))
+            self._next_id += 1
+        self._last[i] = block.key(len(block.phrases) - 1)
+
+    def load(self, entries: Iterable[Tuple[str, int]]) -> None:
+        """Fill an empty list with (phrase, offset) entries: one sort, then BLOCK entries per block"""
+        keyed = sorted(((phrase[offset:].lower(), phrase), offset) for phrase, offset in entries)
+        for start in range(0, len(keyed), BLOCK):
+            part = keyed[start:start + BLOCK]
+            block = self._blocks.writable(self._next_id)
+            block.phrases = [phrase for (_, phrase), _ in part]
+            block.offsets = array("H", [offset for _, offset in part])
+            self._order.append(self._next_id)
+            self._last.append(part[-1][0])
+            self._next_id += 1
+
+    def remove(self, phrase: str, offset: int) -> None:
+        key = phrase[offset:].lower(), phrase
+        i = self._block_of(key)
+        block = self._blocks.writable(self._order[i])
+        at = block.find(key)
+        del block.phrases[at], block.offsets[at]
+        if block.phrases:
+            self._last[i] = block.key(len(block.phrases) - 1)
+        else:
+            self._blocks.pop(self._order.pop(i))
+            del self._last[i]
+
+    def starting(self, prefix: str) -> Iterator[str]:
+        """Phrases of the entries whose matched text starts with prefix, in order"""
+        for i in range(bisect_left(self._last, (prefix,)), len(self._order)):
+            block = self._blocks[self._order[i]]
+            for at in range(block.find((prefix,)), len(block.phrases)):
+                text, phrase = block.key(at)
+                if not text.startswith(prefix):
+                    return
+                yield phrase
+
+
+class SuggestionIndex:
+    """Every suggestion phrase of the slots, sorted whole and from each later word"""
+
+    def __init__(self):
+        self._postings: CopyOnWriteMap[str, array] = CopyOnWriteMap(new_postings, copy_postings)
+        self._phrases = _Entries()
+        self._words = _Entries()
+
+    def copy(self) -> "SuggestionIndex":
+        clone = SuggestionIndex.__new__(SuggestionIndex)
+        clone._postings = self._postings.copy()
+        clone._phrases = self._phrases.copy()
+        clone._words = self._words.copy()
+        return clone
+
+    def add_phrase(self, slot: int, phrase: str) -> None:
+        if phrase not in self._postings:
+            self._phrases.insert(phrase, 0)
+            for offset in word_starts(phrase)[1:]:
+                self._words.insert(phrase, offset)
+        insert_posting(self._postings, phrase, slot)
+
+    def remove_phrase(self, slot: int, phrase: str) -> None:
+        if phrase not in self._postings:
+            return
+        discard_posting(self._postings, phrase, slot)
+        if phrase not in self._postings:
+            self._phrases.remove(phrase, 0)
+            for offset in word_starts(phrase)[1:]:
+                self._words.remove(phrase, offset)
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        for phrase in suggestion_phrases(recipe):
+            self.add_phrase(slot, phrase)
+
+    def load(self, recipes: Sequence[Optional[Recipe]]) -> None:
+        """Index recipes at slots 0, 1, ... of an empty index in bulk; None is a hole"""
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for slot, recipe in enumerate(recipes):
+            if recipe is None:
+                continue
+            for phrase in suggestion_phrases(recipe):
+                postings[phrase].append(slot)
+        load_postings(self._postings, postings)
+        self._phrases.load((phrase, 0) for phrase in postings)
+        self._words.load((phrase, offset) for phrase in postings for offset in word_starts(phrase)[1:])
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        for phrase in suggestion_phrases(recipe):
+            self.remove_phrase(slot, phrase)
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def lookup(self, term: str, limit: Optional[int] = None) -> List[str]:
+        """The first limit phrases matching term: whole-phrase matches, then word matches, by matched text"""
+        found: Dict[str, None] = {}
+        for phrase in chain(self._phrases.starting(normalize(term)), self._words.starting(normalize(term))):
+            if len(found) == limit:
+                break
+            found[phrase] = None
+        return list(found)
+
+
+def _first(keys: Iterable[MatchKey], limit: Optional[int]) -> List[str]:
+    keys = heapq.nsmallest(limit, keys) if limit is not None else sorted(keys)
+    return [phrase for _, _, phrase in keys]
+
+
+def scan_suggestions(recipes: Iterable[Recipe], term: str, limit: Optional[int] = None) -> List[str]:
+    """Store.suggestions() by looking at the phrases of every recipe"""
+    prefix = normalize(term)
+    keys: Dict[str, Optional[MatchKey]] = {}
+    for recipe in recipes:
+        for phrase in suggestion_phrases(recipe):
+            if phrase not in keys:
+                keys[phrase] = match_key(phrase, prefix)
+    return _first((key for key in keys.values() if key is not None), limit)
+
+
+def merge_suggestions(results: Iterable[List[str]], term: str, limit: Optional[int] = None) -> List[str]:
+    """Combine suggestions() results of disjoint parts of a catalog"""
+    prefix = normalize(term)
+    return _first((match_key(phrase, prefix) for phrase in set(chain.from_iterable(results))), limit)
@@ -0,0 +1,100 @@
+import os
+import sys
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+import pytest
+
+# The backend modules import each other by their top-level names
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import search_recipes  # noqa: E402
+from models import Recipe, RecipeFilter  # noqa: E402
+from store import RecipeStore  # noqa: E402
+
+DISHES = ["Chicken Curry", "Chickpea Salad", "Paneer Tikka", "Dal Makhani", "Fenugreek Chicken"]
+TAGS = [["Indian"], ["Spicy", "Chicken"], ["Vegetarian"], ["Quick", "Kids"]]
+INGREDIENTS = [["1 cup rice", "2 tbsp butter"], ["1 lb chicken", "1 tsp fenugreek"], ["200 g paneer"],
+               ["1 lb chicken", "1 cup rice", "2 tbsp butter", "1 tsp red chili powder"]]
+
+
+def make_recipe(number: int, **fields) -> Recipe:
+    values = dict(
+        id=str(number), title=f"Recipe {number}", description="A test recipe", image="",
+        category=["Main Course", "Dessert", "Snacks"][number % 3], difficulty=["Easy", "Medium", "Hard"][number % 3],
+        cookingTime=10 + number % 50, servings=1 + number % 6, ingredients=["1 cup rice", "2 tbsp butter"],
+        instructions=["Cook"], tags=["Indian"], rating=round(3 + number % 20 / 10, 1), author="Chef Test",
+        createdAt=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    )
+    values.update(fields)
+    return Recipe(**values)
+
+
+def baseline_filter(recipes: List[Recipe], filters: RecipeFilter) -> List[Recipe]:
+    """main.filter_recipes as it was before any of the indexes, frozen so the rewritten paths have a fixed reference.
+
+    It knows the literal search, category, difficulty and maxTime, ranked by relevance; see baseline_covers.
+    """
+    filtered = []
+    for recipe in recipes:
+        matches_search = True
+        if filters.search:
+            search_term = filters.search.lower()
+            matches_search = (
+                search_term in recipe.title.lower() or
+                search_term in recipe.description.lower() or
+                search_term in recipe.author.lower() or
+                any(search_term in tag.lower() for tag in recipe.tags) or
+                any(search_term in ingredient.lower() for ingredient in recipe.ingredients)
+            )
+        matches_category = filters.category == "All Categories" or recipe.category == filters.category
+        matches_difficulty = filters.difficulty == "All" or recipe.difficulty == filters.difficulty
+        matches_time = recipe.cookingTime <= filters.maxTime
+        if matches_search and matches_category and matches_difficulty and matches_time:
+            filtered.append(recipe)
+
+    if filters.search:
+        search_term_lower = filters.search.lower()
+        filtered.sort(key=lambda r: (
+            2 if search_term_lower in r.title.lower() else
+            1 if any(search_term_lower in tag.lower() for tag in r.tags) else 0,
+            r.rating
+        ), reverse=True)
+    return filtered
+
+
+def baseline_covers(filters: RecipeFilter) -> bool:
+    """Whether baseline_filter knows every filter set in filters"""
+    ranges = (filters.minRating, filters.minServings, filters.maxServings, filters.createdFrom, filters.createdBefore)
+    return (filters.syntax == "literal" and filters.rank == "relevance" and filters.sort == "relevance"
+            and not filters.fuzzy and all(value is None for value in ranges))
+
+
+def reference(recipes: List[Recipe], filters: RecipeFilter) -> Tuple[int, List[Recipe]]:
+    """The total and results a store must return: the baseline filter's where it applies, else the scan's"""
+    if baseline_covers(filters):
+        found = baseline_filter(recipes, filters)
+        return len(found), found
+    return search_recipes(recipes, filters)
+
+
+@pytest.fixture
+def recipes() -> List[Recipe]:
+    return [make_recipe(number) for number in range(300)]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    """600 varied recipes with every ninth removed, as the list a scan sees and as an indexed store"""
+    recipes = [
+        make_recipe(number, title=f"{DISHES[number % 5]} {number}", tags=TAGS[number % 4],
+                    ingredients=INGREDIENTS[number % 7 % 4], rating=round(3 + number * 7 % 20 / 10, 1),
+                    createdAt=datetime(2024, 1, 1 + number % 28, number % 24, tzinfo=timezone.utc))
+        for number in range(600)
+    ]
+    store = RecipeStore()
+    for recipe in recipes:
+        store.add(recipe)
+    for recipe_id in map(str, range(0, 600, 9)):
+        store.remove(recipe_id)
+    return [recipe for recipe in recipes if int(recipe.id) % 9], store
@@ -0,0 +1,112 @@
+import pytest
+
+from conftest import make_recipe, reference
+from main import correct_search, get_search_suggestions, highlight_recipes, search_recipes
+from models import RecipeFilter
+from pantry import pantry_keys, scan_pantry
+from similarity import scan_similar
+from spelling import scan_spelling
+from sqlite_store import SQLiteRecipeStore
+from store import RecipeStore
+from suggestions import scan_suggestions
+from vectors import HYBRID_AVAILABLE
+
+
+@pytest.mark.parametrize("pantry", [["rice", "butter"], ["chicken", "chili powder"], ["paneer"], ["saffron"]])
+@pytest.mark.parametrize("complete", [False, True])
+def test_pantry_matches_the_scan(catalog, pantry, complete):
+    recipes, store = catalog
+    keys = pantry_keys(pantry)
+    total, expected = scan_pantry(recipes, keys, complete, 10)
+    found, hits = store.pantry(keys, complete, 10)
+    assert found == total
+    assert [(hit.recipe.id, hit.matched, hit.total) for hit in hits] == \
+        [(hit.recipe.id, hit.matched, hit.total) for hit in expected]
+
+
+@pytest.mark.parametrize("recipe_id", ["1", "2", "3", "4", "10"])
+def test_similar_matches_the_scan(catalog, recipe_id):
+    recipes, store = catalog
+    recipe = store.get(recipe_id)
+    assert [(score, other.id) for score, other in store.similar(recipe, 5)] == \
+        [(score, other.id) for score, other in scan_similar(recipes, recipe, 5)]
+
+
+@pytest.mark.parametrize("search", ["chiken curry", "paner", "fenugrek OR dall", "spicy -chikpea", "chicken"])
+def test_spelling_matches_the_scan(catalog, search):
+    recipes, store = catalog
+    filters = RecipeFilter(search=search, syntax="query")
+    assert correct_search(store, filters) == correct_search(recipes, filters)
+    words = search.replace("-", " ").split()
+    indexed, scanned = store.spelling(words), scan_spelling(recipes, words)
+    assert {word: candidates and sorted(candidates) for word, candidates in indexed.items()} == \
+        {word: candidates and sorted(candidates) for word, candidates in scanned.items()}
+
+
+@pytest.mark.parametrize("search", ["chick", "spicy chicken", "\"paneer tikka\"", "title:dal OR rice", "kids -curry"])
+def test_highlights_match_the_scan(catalog, search):
+    recipes, store = catalog
+    filters = RecipeFilter(search=search, syntax="query")
+    page = search_recipes(store, filters, 20)[1]
+    assert highlight_recipes(store, page, filters) == highlight_recipes(recipes, page, filters)
+
+
+@pytest.mark.parametrize("term", ["ch", "Chi", "sal", "pa", "red chili", "x"])
+def test_suggestions_match_the_scan(catalog, term):
+    recipes, store = catalog
+    assert store.suggestions(term, 10) == scan_suggestions(recipes, term, 10)
+    assert get_search_suggestions(term, store) == get_search_suggestions(term, recipes)
+
+
+def test_optional_indexes_are_built_on_first_use_and_kept_in_step(catalog):
+    recipes, _ = catalog
+    store = RecipeStore()
+    store.load(recipes)
+    version = store.copy()
+    version.add(make_recipe(5000, title="Chicken Paneer", tags=["Spicy"], ingredients=["200 g paneer"]))
+    version.remove("1")
+    assert not version._built
+    recipe = version.get("5000")
+    version.similar(recipe, 5)
+    assert list(version._built) == ["similarity"]
+    # Carried over to later versions and updated by their writes
+    later = version.copy()
+    later.replace("5000", make_recipe(5000, title="Fenugreek Rice", ingredients=["1 cup rice", "1 tsp fenugreek"]))
+    later.remove("2")
+    live = [recipe for recipe in later]
+    for recipe_id in ("3", "5000"):
+        recipe = later.get(recipe_id)
+        assert [(score, other.id) for score, other in later.similar(recipe, 5)] == \
+            [(score, other.id) for score, other in scan_similar(live, recipe, 5)]
+    filters = RecipeFilter(search="fenugreek rice")
+    page = search_recipes(later, filters, 20)[1]
+    assert highlight_recipes(later, page, filters) == highlight_recipes(live, page, filters)
+    assert sorted(later._built) == ["positions", "similarity"]
+
+
+def test_sqlite_tables_match_the_scans(tmp_path, catalog):
+    recipes, _ = catalog
+    store = SQLiteRecipeStore(str(tmp_path / "catalog.db"))
+    with store.transaction():
+        for recipe in recipes:
+            store.add(recipe)
+        store.replace("1", make_recipe(1, title="Chickpea Tikka", tags=["Spicy"], ingredients=["1 cup chickpeas"]))
+        store.remove("2")
+        store.remove("3")
+    live = list(store)
+    for recipe_id in ("1", "4", "10", "11"):
+        recipe = store.get(recipe_id)
+        assert [(score, other.id) for score, other in store.similar(recipe, 5)] == \
+            [(score, other.id) for score, other in scan_similar(live, recipe, 5)]
+    words = ["chiken", "paner", "tikka", "dall", "chickpeaz", "zz"]
+    indexed, scanned = store.spelling(words), scan_spelling(live, words)
+    assert {word: candidates and sorted(candidates) for word, candidates in indexed.items()} == \
+        {word: candidates and sorted(candidates) for word, candidates in scanned.items()}
+    for term in ("ch", "Chi", "sal", "red chili", "", "x"):
+        assert store.suggestions(term, 10) == scan_suggestions(live, term, 10)
+    for rank in ("bm25", "hybrid") if HYBRID_AVAILABLE else ("bm25",):
+        filters = RecipeFilter(search="spicy chicken", rank=rank, syntax="query")
+        total, expected = reference(live, filters)
+        found, page = store.search(filters, 10)
+        assert found == total
+        assert [recipe.id for recipe in page] == [recipe.id for recipe in expected[:10]]
@@ -0,0 +1,137 @@
+import pytest
+
+from conftest import make_recipe, reference
+from main import search_recipes
+from mmap_catalog import ITEM_END, MmapRecipeStore, write_catalog
+from models import RecipeFilter
+from pantry import pantry_keys, scan_pantry
+from persistence import CatalogPersistence
+from records import to_recipe
+from similarity import scan_similar
+from spelling import scan_spelling
+from suggestions import scan_suggestions
+from vectors import HYBRID_AVAILABLE
+from versions import VersionedCatalog
+
+
+def test_list_fields_round_trip(tmp_path):
+    path = str(tmp_path / "catalog.bin")
+    lists = [[], [""], ["a", "b]"], ["x" + ITEM_END + "y", "z"], ["[1]"]]
+    recipes = [make_recipe(number, tags=tags, ingredients=["1 cup rice"] + tags) for number, tags in enumerate(lists)]
+    write_catalog(path, recipes)
+    store = MmapRecipeStore(path)
+    assert [to_recipe(view) for view in store] == recipes
+
+
+def test_writes_replay_over_the_catalog_file(tmp_path, recipes):
+    path = str(tmp_path / "catalog.bin")
+    write_catalog(path, recipes[:100])
+
+    def open_catalog():
+        catalog = VersionedCatalog(MmapRecipeStore(path))
+        persistence = CatalogPersistence(str(tmp_path / "data"), catalog, snapshot_interval=None)
+        persistence.recover()
+        return catalog, persistence
+
+    catalog, persistence = open_catalog()
+    with catalog.write() as version:
+        store = version.store
+        for recipe in recipes[100:110]:
+            store.add(recipe)
+            persistence.wal.put(recipe)
+        updated = recipes[5].model_copy(update={"title": "Renamed"})
+        store.replace(updated.id, updated)
+        persistence.wal.put(updated)
+        for recipe_id in ("7", "105"):
+            store.remove(recipe_id)
+            persistence.wal.delete(recipe_id)
+    persistence.wal.close()
+    expected = [to_recipe(recipe) for recipe in catalog.current().store]
+
+    for _ in range(2):
+        catalog, persistence = open_catalog()
+        assert [to_recipe(recipe) for recipe in catalog.current().store] == expected
+        persistence.wal.close()
+
+
+def test_browse_pages_match_the_scan(tmp_path, recipes):
+    path = str(tmp_path / "catalog.bin")
+    write_catalog(path, recipes[:200])
+    store = MmapRecipeStore(path)
+    for recipe in recipes[200:230]:
+        store.add(recipe)
+    for recipe_id in ("3", "40", "205", "229"):
+        store.remove(recipe_id)
+    for recipe in (recipes[8], recipes[150], recipes[210]):
+        store.replace(recipe.id, recipe.model_copy(update={"category": "Dessert", "cookingTime": 5}))
+    version = store.copy()
+    version.add(make_recipe(900))
+    version.remove("9")
+    scanned = [to_recipe(recipe) for recipe in store]
+
+    for filters in (RecipeFilter(), RecipeFilter(category="Dessert"), RecipeFilter(maxTime=20)):
+        total, expected = reference(scanned, filters)
+        assert search_recipes(store, filters, 7)[0] == total
+        ids, after = [], None
+        while True:
+            _, page = search_recipes(store, filters, 7, after)
+            if not page:
+                break
+            ids += [recipe.id for recipe in page]
+            after = page[-1].id
+        assert ids == [recipe.id for recipe in expected]
+    assert len(store) == 226 and len(version) == 226 and "9" in store
+    assert version.position("900") == 230
+
+
+@pytest.mark.parametrize("warm", [False, True])
+def test_indexes_match_the_scan(tmp_path, catalog, warm):
+    recipes, _ = catalog
+    path = str(tmp_path / "catalog.bin")
+    write_catalog(path, recipes[:400])
+    store = MmapRecipeStore(path)
+    if warm:
+        # Built before the writes, so these have to keep them in step
+        search_recipes(store, RecipeFilter(search="chick", rank="bm25"))
+        store.suggestions("ch"), store.spelling(["paner"]), store.pantry(["rice"]), store.similar(recipes[0], 5)
+    for recipe in recipes[400:]:
+        store.add(recipe)
+    store.replace(recipes[10].id, make_recipe(5000, id=recipes[10].id, title="Saffron Chickpea Rice",
+                                              category="Dessert", tags=["Sweet"],
+                                              ingredients=["1 pinch saffron", "1 cup rice"]))
+    store.replace(recipes[450].id, make_recipe(5001, id=recipes[450].id, title="Paneer Pie"))
+    for recipe_id in (recipes[3].id, recipes[420].id):
+        store.remove(recipe_id)
+    version = store.copy()
+    version.add(make_recipe(5002, title="Chickpea Saffron Stew", tags=["Spicy"]))
+    version.remove(recipes[5].id)
+    live = [to_recipe(recipe) for recipe in version]
+
+    for filters in (RecipeFilter(search="chick"), RecipeFilter(search="saffron", category="Dessert"),
+                    RecipeFilter(search="spicy chicken", rank="bm25"), RecipeFilter(search="pie", sort="rating"),
+                    RecipeFilter(search="paneer OR -dal", syntax="query", minRating=4),
+                    *([RecipeFilter(search="saffron chickpea", rank="hybrid")] if HYBRID_AVAILABLE else [])):
+        total, expected = reference(live, filters)
+        found, page = search_recipes(version, filters, 10)
+        assert (found, [recipe.id for recipe in page]) == (total, [recipe.id for recipe in expected[:10]])
+    for pantry in (["rice", "butter"], ["saffron"]):
+        keys = pantry_keys(pantry)
+        total, expected = scan_pantry(live, keys, False, 10)
+        found, hits = version.pantry(keys, False, 10)
+        assert (found, [hit.recipe.id for hit in hits]) == (total, [hit.recipe.id for hit in expected])
+    for recipe in (version.get(recipes[10].id), version.get(recipes[1].id), make_recipe(6000, tags=["Spicy"])):
+        assert [(score, other.id) for score, other in version.similar(recipe, 5)] == \
+            [(score, other.id) for score, other in scan_similar(live, recipe, 5)]
+    words = ["chiken", "saffrn", "paneer", "zz"]
+    assert {word: found and sorted(found) for word, found in version.spelling(words).items()} == \
+        {word: found and sorted(found) for word, found in scan_spelling(live, words).items()}
+    for term in ("ch", "saf", "Pie", "x"):
+        assert version.suggestions(term, 10) == scan_suggestions(live, term, 10)
+    assert version.categories() == list(dict.fromkeys(recipe.category for recipe in live))
+    stats = version.stats()
+    assert stats["categories"] == {category: sum(recipe.category == category for recipe in live)
+                                   for category in version.categories()}
+    assert sum(stats["difficulties"].values()) == len(live)
+    assert stats["rating_sum"] == pytest.approx(sum(recipe.rating for recipe in live))
+    # The version's writes stay out of the store it was copied from
+    assert len(store.suggestions("Chickpea Saffron", 10)) == 0
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from conftest import make_recipe
+from persistence import CatalogPersistence, _log_name
+from records import to_recipe
+from store import RecipeStore
+from versions import VersionedCatalog
+
+
+def contents(catalog: VersionedCatalog):
+    return [(recipe.id, recipe.title) for recipe in catalog.current().store]
+
+
+def recovered(directory: str) -> VersionedCatalog:
+    catalog = VersionedCatalog(RecipeStore())
+    assert CatalogPersistence(directory, catalog).recover()
+    return catalog
+
+
+def test_nothing_to_recover(tmp_path):
+    assert not CatalogPersistence(str(tmp_path), VersionedCatalog(RecipeStore())).recover()
+
+
+def test_recovers_snapshot_and_log_after_crash(tmp_path, recipes):
+    catalog = VersionedCatalog(RecipeStore())
+    persistence = CatalogPersistence(str(tmp_path), catalog)
+    persistence.recover()
+    with catalog.write() as version:
+        for recipe in recipes[:150]:
+            version.store.add(recipe)
+            persistence.wal.put(recipe)
+    asyncio.run(persistence.snapshot())
+
+    with catalog.write() as version:
+        store = version.store
+        for recipe in recipes[150:]:
+            store.add(recipe)
+            persistence.wal.put(recipe)
+        for recipe_id in map(str, range(0, 300, 7)):
+            persistence.wal.delete(store.remove(recipe_id).id)
+        for recipe in list(store):
+            if recipe.category == "Dessert":
+                updated = to_recipe(recipe).model_copy(update={"title": recipe.title + " (updated)"})
+                store.replace(recipe.id, updated)
+                persistence.wal.put(updated)
+    persistence.wal.close()
+
+    assert contents(recovered(str(tmp_path))) == contents(catalog)
+
+
+def test_torn_tail_is_dropped(tmp_path, recipes):
+    catalog = VersionedCatalog(RecipeStore())
+    persistence = CatalogPersistence(str(tmp_path), catalog)
+    persistence.recover()
+    with catalog.write() as version:
+        for recipe in recipes[:20]:
+            version.store.add(recipe)
+            persistence.wal.put(recipe)
+    persistence.wal.flush()
+    # Crash halfway through writing one more record
+    persistence.wal._file.write('["put",{"id":"torn","tit')
+    persistence.wal._file.close()
+
+    assert contents(recovered(str(tmp_path))) == contents(catalog)
+
+
+def test_writes_after_a_torn_tail_survive(tmp_path, recipes):
+    catalog = VersionedCatalog(RecipeStore())
+    persistence = CatalogPersistence(str(tmp_path), catalog)
+    persistence.recover()
+    for recipe in recipes[:10]:
+        persistence.wal.put(recipe)
+    persistence.wal.flush()
+    torn = os.path.join(str(tmp_path), _log_name(persistence.wal.generation))
+    persistence.wal._file.close()
+    with open(torn, "rb+") as log:
+        # Cut the last record in half
+        log.truncate(os.path.getsize(torn) - 40)
+
+    catalog = VersionedCatalog(RecipeStore())
+    persistence = CatalogPersistence(str(tmp_path), catalog)
+    assert persistence.recover()
+    assert [recipe.id for recipe in catalog.current().store] == [recipe.id for recipe in recipes[:9]]
+    # Recovery appends to a fresh log, so later records don't follow the torn line
+    assert persistence.wal.generation == 1
+    with catalog.write() as version:
+        version.store.add(recipes[10])
+        persistence.wal.put(recipes[10])
+    persistence.wal.close()
+
+    assert [recipe_id for recipe_id, _ in contents(recovered(str(tmp_path)))] == [
+        recipe.id for recipe in recipes[:9] + [recipes[10]]]
+
+
+def test_unpublished_until_durable(tmp_path):
+    catalog = VersionedCatalog(RecipeStore())
+    persistence = CatalogPersistence(str(tmp_path), catalog, max_delay=0.01)
+    persistence.recover()
+
+    async def write(recipe):
+        with catalog.write(publish=False) as version:
+            version.store.add(recipe)
+            persistence.wal.put(recipe)
+        assert recipe.id not in catalog.current().store
+        await persistence.wal.commit()
+        assert persistence.wal._synced == persistence.wal._written
+        catalog.publish(version)
+
+    async def main():
+        persistence.wal.start()
+        await asyncio.gather(*(write(make_recipe(number)) for number in range(5)))
+        await persistence.wal.stop()
+
+    asyncio.run(main())
+    assert catalog.current() is catalog.head()
+    assert [recipe.id for recipe in catalog.current().store] == list(map(str, range(5)))
+    persistence.wal.close()
+
+
+def test_records_appended_during_fsync_stay_pending(tmp_path, monkeypatch):
+    catalog = VersionedCatalog(RecipeStore())
+    persistence = CatalogPersistence(str(tmp_path), catalog)
+    persistence.recover()
+    wal = persistence.wal
+    wal.put(make_recipe(1))
+    writers = []
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        # Another thread appends while the first record is being synced
+        writer = threading.Thread(target=wal.put, args=(make_recipe(2),))
+        writer.start()
+        writers.append(writer)
+        writer.join(0.05)
+        fsync(fd)
+    monkeypatch.setattr(os, "fsync", slow_fsync)
+    wal.flush()
+    monkeypatch.setattr(os, "fsync", fsync)
+    writers[0].join()
+    assert (wal._synced, wal._written) == (1, 2)
+    wal.close()
+    assert wal._synced == 2
+
+
+def test_failed_fsync_wakes_committers_and_discards_their_versions(tmp_path, monkeypatch):
+    catalog = VersionedCatalog(RecipeStore())
+    persistence = CatalogPersistence(str(tmp_path), catalog, max_delay=0.01)
+    persistence.recover()
+    fsync = os.fsync
+    failures = []
+
+    def failing_fsync(fd):
+        if not failures:
+            failures.append(fd)
+            raise OSError("disk full")
+        fsync(fd)
+
+    async def write(recipe):
+        with catalog.write(publish=False) as version:
+            version.store.add(recipe)
+            persistence.wal.put(recipe)
+        try:
+            await persistence.wal.commit()
+        except OSError:
+            catalog.discard(version)
+            return False
+        catalog.publish(version)
+        return True
+
+    async def main():
+        persistence.wal.start()
+        monkeypatch.setattr(os, "fsync", failing_fsync)
+        first = await asyncio.wait_for(asyncio.gather(*(write(make_recipe(number)) for number in range(3))), 5)
+        # The flusher survives the failure and serves later committers
+        second = await asyncio.wait_for(write(make_recipe(3)), 5)
+        await persistence.wal.stop()
+        return first, second
+
+    assert asyncio.run(main()) == ([False] * 3, True)
+    assert catalog.current() is catalog.head()
+    assert [recipe.id for recipe in catalog.current().store] == ["3"]
+    persistence.wal.close()
+
+
+def test_discard_rolls_back_later_unpublished_versions():
+    catalog = VersionedCatalog(RecipeStore())
+    with catalog.write() as version:
+        version.store.add(make_recipe(1))
+    with catalog.write(publish=False) as failed:
+        failed.store.add(make_recipe(2))
+    with catalog.write(publish=False) as later:
+        later.store.add(make_recipe(3))
+    catalog.discard(failed)
+    assert catalog.head().store is catalog.current().store
+    with pytest.raises(ValueError):
+        catalog.publish(later)
+    with catalog.write() as version:
+        version.store.add(make_recipe(4))
+    assert version.number > later.number
+    assert [recipe.id for recipe in catalog.current().store] == ["1", "4"]
@@ -0,0 +1,46 @@
+import pytest
+
+from conftest import make_recipe
+from models import RecipeFilter
+from query import NOTHING, And, Not, Or, Term, compile_search, parse
+from store import RecipeStore
+
+
+def test_terms_and_phrases():
+    assert parse('butter "garam masala" chicken') == And((
+        Term(None, "butter"), Term(None, "garam masala"), Term(None, "chicken")))
+    assert parse("Paneer") == Term(None, "paneer")
+
+
+def test_or_binds_tighter_than_and():
+    assert parse("curry paneer OR tofu") == And((Term(None, "curry"), Or((Term(None, "paneer"), Term(None, "tofu")))))
+    # A leading or trailing OR has nothing to join
+    assert parse("OR rice OR") == Term(None, "rice")
+
+
+def test_fields_and_negation():
+    assert parse("tag:vegan -title:spicy") == And((Term("tags", "vegan"), Not(Term("title", "spicy"))))
+    # Unknown fields are part of the term
+    assert parse("ratio:2") == Term(None, "ratio:2")
+
+
+@pytest.mark.parametrize("text", ["   ", "OR", "OR OR", '""', '-""', "-spicy", "-spicy -hot", "-a OR -b"])
+def test_no_positive_term_matches_nothing(text):
+    assert parse(text) == NOTHING
+    store = RecipeStore()
+    for number in range(10):
+        store.add(make_recipe(number))
+    assert store.search(RecipeFilter(search=text, syntax="query")) == (0, [])
+
+
+def test_negation_still_excludes():
+    store = RecipeStore()
+    store.add(make_recipe(1, title="Spicy Dal"))
+    store.add(make_recipe(2, title="Mild Dal"))
+    total, found = store.search(RecipeFilter(search="dal -spicy", syntax="query"))
+    assert (total, [recipe.id for recipe in found]) == (1, ["2"])
+
+
+def test_literal_search_is_one_term():
+    assert compile_search(RecipeFilter(search="-spicy OR")).terms == ("-spicy or",)
+    assert compile_search(RecipeFilter(search="")) is None
@@ -0,0 +1,236 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import baseline_filter, make_recipe, reference
+from facet_index import NO_TIME_LIMIT
+from main import app, facet_counts, search_recipes
+from mmap_catalog import MmapRecipeStore, write_catalog
+from models import RecipeFilter
+from query import compile_search
+from records import RecipeRecord
+from result_cache import ResultCache
+from shards import ShardedRecipeStore, ShardPool
+from sqlite_store import SQLiteRecipeStore
+from store import RecipeStore
+from vectors import scan_hybrid
+from versions import VersionedCatalog
+
+UTC = timezone.utc
+FILTERS = [
+    RecipeFilter(),
+    RecipeFilter(category="Dessert", maxTime=30),
+    RecipeFilter(search="chicken"),
+    RecipeFilter(search="chick", rank="bm25"),
+    RecipeFilter(search="spicy rice", rank="bm25", difficulty="Easy"),
+    RecipeFilter(search="paneer", sort="rating"),
+    RecipeFilter(sort="time", minRating=3.5),
+    RecipeFilter(sort="newest", minServings=2, maxServings=4),
+    RecipeFilter(search="dal OR paneer", syntax="query", createdFrom=datetime(2024, 1, 10, tzinfo=UTC),
+                 createdBefore=datetime(2024, 1, 20, tzinfo=UTC)),
+]
+
+
+def ids(recipes):
+    return [recipe.id for recipe in recipes]
+
+def as_model(recipe):
+    return recipe.to_recipe() if isinstance(recipe, RecipeRecord) else recipe
+
+
+def pages(store, filters, limit, count=True):
+    """Every result, fetched limit at a time by cursor"""
+    found, after = [], None
+    while True:
+        _, page = search_recipes(store, filters, limit, after, count)
+        if not page:
+            return found
+        found += ids(page)
+        after = page[-1].id
+
+
+@pytest.mark.parametrize("search", ["chick", "ch", "c", "fenugr", "kids", "spicy chicken", "paneer OR dal"])
+@pytest.mark.parametrize("category", ["All Categories", "Dessert"])
+def test_relevance_pages_match_the_scan(catalog, search, category):
+    recipes, store = catalog
+    filters = RecipeFilter(search=search, category=category, syntax="query" if " OR " in search else "literal")
+    total, expected = reference(recipes, filters)
+    assert search_recipes(store, filters, 5)[0] == total
+    assert pages(store, filters, 5) == ids(expected)
+
+
+@pytest.mark.parametrize("filters", [RecipeFilter(), RecipeFilter(search="chick"), RecipeFilter(search="Ch"),
+                                     RecipeFilter(search="chicken curry", category="Main Course"),
+                                     RecipeFilter(search=" ", difficulty="Easy", maxTime=30),
+                                     RecipeFilter(search="test recipe", maxTime=20)])
+def test_the_scan_matches_the_baseline(catalog, filters):
+    recipes, _ = catalog
+    total, found = search_recipes(recipes, filters)
+    assert (total, ids(found)) == (len(baseline_filter(recipes, filters)), ids(baseline_filter(recipes, filters)))
+
+
+@pytest.mark.parametrize("search", ["chick", "ch", "chicken curry", "fenugr", "zzz", "paneer OR -dal"])
+@pytest.mark.parametrize("sort", ["relevance", "rating"])
+def test_uncounted_pages_match_the_scan(catalog, search, sort):
+    recipes, store = catalog
+    filters = RecipeFilter(search=search, sort=sort, syntax="query" if " OR " in search else "literal")
+    total, expected = reference(recipes, filters)
+    counted, page = search_recipes(store, filters, 5, count=False)
+    assert counted in (None, total)
+    assert ids(page) == ids(expected[:5])
+    assert pages(store, filters, 5, count=False) == ids(expected)
+
+
+def test_integers_past_int32_are_kept(tmp_path, recipes):
+    recipes = recipes[:20] + [make_recipe(20, cookingTime=2 ** 40), make_recipe(21, servings=2 ** 70),
+                              make_recipe(22, cookingTime=-2 ** 33, servings=0)]
+    store = RecipeStore(columnar=True)
+    for recipe in recipes:
+        store.add(recipe)
+    path = str(tmp_path / "catalog.bin")
+    write_catalog(path, recipes[:21])
+    snapshot = MmapRecipeStore(path)
+    for filters in (RecipeFilter(), RecipeFilter(maxTime=2 ** 41), RecipeFilter(minServings=2 ** 40),
+                    RecipeFilter(maxServings=3, maxTime=NO_TIME_LIMIT)):
+        assert [recipe.id for recipe in search_recipes(store, filters)[1]] == \
+            [recipe.id for recipe in search_recipes(recipes, filters)[1]]
+        assert [recipe.id for recipe in search_recipes(snapshot, filters)[1]] == \
+            [recipe.id for recipe in search_recipes(recipes[:21], filters)[1]]
+    assert snapshot.get("20").cookingTime == 2 ** 40
+
+
+def test_bulk_load_indexes_like_adds(catalog):
+    recipes, store = catalog
+    loaded = RecipeStore()
+    loaded.load(recipes)
+    for filters in (RecipeFilter(search="chick"), RecipeFilter(search="ch", sort="rating"),
+                    RecipeFilter(search="spicy chicken", rank="bm25"), RecipeFilter(category="Dessert", maxTime=30)):
+        assert [recipe.id for recipe in search_recipes(loaded, filters)[1]] == \
+            [recipe.id for recipe in search_recipes(store, filters)[1]]
+        assert loaded.facets(filters) == store.facets(filters)
+    assert loaded.suggestions("ch") == store.suggestions("ch")
+    assert loaded.spelling(["chiken", "paner"]) == store.spelling(["chiken", "paner"])
+    assert [hit.recipe.id for hit in loaded.pantry(["rice", "butter"])[1]] == \
+        [hit.recipe.id for hit in store.pantry(["rice", "butter"])[1]]
+    # Writes after the load go through the copy-on-write paths as usual
+    version = loaded.copy()
+    version.remove(recipes[0].id)
+    version.add(make_recipe(1000, title="Chicken Pie"))
+    assert [recipe.id for recipe in search_recipes(version, RecipeFilter(search="chicken pie"))[1]] == ["1000"]
+    assert recipes[0].id in loaded
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("columnar", [False, True])
+def test_indexed_paths_match_the_scan(catalog, filters, columnar):
+    recipes, store = catalog
+    if columnar:
+        store = RecipeStore(columnar=True)
+        store.load(recipes)
+    total, expected = reference(recipes, filters)
+    assert search_recipes(store, filters)[0] == total
+    assert ids(search_recipes(store, filters, 7)[1]) == ids(expected[:7])
+    assert pages(store, filters, 7) == ids(expected)
+    assert facet_counts(store, filters) == facet_counts(recipes, filters)
+
+
+def test_result_cache_patches_match_the_scan(catalog):
+    recipes, store = catalog
+    versions = VersionedCatalog(store.copy())
+    cache = ResultCache(versions)
+
+    def cached(filters):
+        head = versions.current().store
+        return cache.search(head, filters, 5, None, lambda bound: search_recipes(head, filters, bound))
+
+    for filters in FILTERS:
+        cached(filters)
+    with versions.write() as version:
+        draft = version.store
+        added = make_recipe(1000, title="Chicken Soup", tags=["Spicy"], category="Dessert", rating=4.9)
+        draft.add(added)
+        cache.added(draft, added)
+        old, new = draft.get("1"), make_recipe(1, title="Plain Toast", rating=3.0, cookingTime=5)
+        draft.replace("1", new)
+        cache.replaced(draft, old, new)
+        cache.removed(draft, draft.remove("2"))
+    scanned = list(versions.current().store)
+    hits = cache.hits
+    for filters in FILTERS:
+        total, expected = reference(scanned, filters)
+        assert cached(filters) == (total, ids(expected[:5]))
+    # BM25 entries are dropped on writes; the others answer from their patched ids
+    assert cache.hits - hits == sum(filters.rank != "bm25" for filters in FILTERS)
+
+
+@pytest.mark.parametrize("search", ["chicken", "spicy rice", "paneer -tikka", "kids"])
+def test_hybrid_scores_match_the_scan(catalog, search):
+    recipes, _ = catalog
+    store = RecipeStore(vectors=True)
+    store.load(recipes)
+    filters = RecipeFilter(search=search, rank="hybrid", syntax="query")
+    total, expected = reference(recipes, filters)
+    assert search_recipes(store, filters, 10)[0] == total
+    assert pages(store, filters, 10) == ids(expected)
+    indexed, scanned = store.hybrid_scorer(filters), scan_hybrid(recipes, compile_search(filters))
+    assert [indexed.score(recipe) for recipe in expected] == [scanned.score(recipe) for recipe in expected]
+
+
+def test_created_at_compares_in_utc():
+    ist = timezone(timedelta(hours=5, minutes=30))
+    recipes = [
+        make_recipe(0, createdAt=datetime(2024, 1, 1, 3, 0, tzinfo=ist)),  # 2023-12-31 21:30 UTC
+        make_recipe(1, createdAt=datetime(2024, 1, 1, 0, 0)),  # naive: UTC
+        make_recipe(2, createdAt=datetime(2023, 12, 31, 22, 0, tzinfo=UTC)),
+        make_recipe(3, createdAt=datetime(2024, 1, 1, 5, 0, tzinfo=ist)),  # 2023-12-31 23:30 UTC
+    ]
+    store = RecipeStore()
+    for recipe in recipes:
+        store.add(recipe)
+    newest = RecipeFilter(sort="newest")
+    assert ids(search_recipes(store, newest)[1]) == ids(search_recipes(recipes, newest)[1]) == ["1", "3", "2", "0"]
+    since = RecipeFilter(createdFrom=datetime(2023, 12, 31, 22, 0), createdBefore=datetime(2024, 1, 1, 5, 0, tzinfo=ist))
+    assert ids(search_recipes(store, since)[1]) == ids(search_recipes(recipes, since)[1]) == ["2"]
+
+    response = TestClient(app).post("/recipes", json=make_recipe(5000).model_dump(mode="json"))
+    assert datetime.fromisoformat(response.json()["createdAt"]).utcoffset() == timedelta(0)
+
+
+def test_get_many_matches_get(tmp_path, catalog):
+    recipes, store = catalog
+    wanted = ["5", "9", "missing", "1", "5", "599"]
+    expected = [as_model(recipe) for recipe in map(store.get, wanted)]
+    sqlite = SQLiteRecipeStore(str(tmp_path / "catalog.db"))
+    with sqlite.transaction():
+        for recipe in recipes:
+            sqlite.add(recipe)
+    pool = ShardPool(2)
+    try:
+        sharded = ShardedRecipeStore(pool)
+        sharded.load(recipes)
+        for other in (store, sqlite, sharded):
+            assert [as_model(recipe) for recipe in other.get_many(wanted)] == expected
+    finally:
+        pool.shutdown()
+
+
+def test_result_cache_keeps_integer_sort_keys_exact(recipes):
+    store = RecipeStore()
+    store.load(recipes[:20] + [make_recipe(20, cookingTime=2 ** 60), make_recipe(21, cookingTime=2 ** 60 + 2)])
+    versions = VersionedCatalog(store)
+    cache = ResultCache(versions)
+    filters = RecipeFilter(sort="time", maxTime=NO_TIME_LIMIT)
+
+    def cached():
+        head = versions.current().store
+        return cache.search(head, filters, 30, None, lambda bound: search_recipes(head, filters, bound))
+
+    cached()
+    with versions.write() as version:
+        for recipe in (make_recipe(22, cookingTime=2 ** 60 + 1), make_recipe(23, cookingTime=2 ** 62)):
+            version.store.add(recipe)
+            cache.added(version.store, recipe)
+    scanned = list(versions.current().store)
+    total, expected = reference(scanned, filters)
+    assert cached() == (total, ids(expected)) and ids(expected)[-4:] == ["20", "22", "21", "23"]
@@ -0,0 +1,199 @@
+import math
+import zlib
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for ?rank=hybrid
+    np = None
+
+from filters import Cursor, follows, top_k
+from models import Recipe
+from query import SearchQuery
+from ranking import FIELD_WEIGHTS, field_texts, scan_statistics
+from search_index import tokenize
+from versions import CopyOnWriteMap
+
+# Hybrid ranking blends the lexical relevance tier with the cosine similarity
+# of hashed TF-IDF vectors, so "creamy curry" also finds recipes tagged
+# "creamy" whose description calls them a curry, though neither contains the
+# phrase. A recipe's vector holds the log-scaled, field-weighted (as in BM25F)
+# counts of its word tokens, each hashed with a sign into one of DIMENSIONS
+# buckets. IDF weights the query side only, from the same document
+# frequencies BM25 uses, so stored vectors never go stale as the catalog
+# changes; query words no recipe contains are left out rather than matching
+# whatever else hashed to their bucket. Both sides are normalized and rounded to integers
+# (rows to ROW_SCALE, queries to QUERY_SCALE): every dot product is then an
+# exact float32 sum whatever order BLAS adds in, and the matrix product, a
+# single recipe's score and a scan all agree to the last bit.
+DIMENSIONS = 256
+ROW_SCALE = 4096
+QUERY_SCALE = 1024
+# The lexical tier's share of the blended score
+LEXICAL_WEIGHT = 0.5
+# Recipes that don't match the search text need at least this similarity
+MIN_SIMILARITY = 0.15
+# Matrix rows per block: the unit a catalog version copies on write
+BLOCK_ROWS = 256
+HYBRID_AVAILABLE = np is not None
+
+
+@lru_cache(maxsize=65536)
+def _bucket(token: str) -> Tuple[int, int]:
+    # crc32 rather than hash(): vectors must agree across processes
+    hashed = zlib.crc32(token.encode())
+    return hashed % DIMENSIONS, 1 if hashed >> 31 else -1
+
+
+def _quantize(weights: Sequence[float], scale: int):
+    vector = np.array(weights)
+    norm = np.sqrt(vector @ vector)
+    if norm:
+        vector = np.rint(vector * (scale / norm))
+    return vector.astype(np.float32)
+
+
+def embed(recipe: Recipe):
+    """The recipe's matrix row: float32 integers, L2 norm about ROW_SCALE (zero without words)"""
+    weights = [0.0] * DIMENSIONS
+    for text, weight in zip(field_texts(recipe), FIELD_WEIGHTS):
+        for token, count in Counter(tokenize(text)).items():
+            dimension, sign = _bucket(token)
+            weights[dimension] += sign * weight * (1 + math.log(count))
+    return _quantize(weights, ROW_SCALE)
+
+
+def cosines(products):
+    """Cosine similarities from the dot products of rows with a query vector, as float64"""
+    return products.astype(np.float64) / (ROW_SCALE * QUERY_SCALE)
+
+
+class HybridScorer:
+    """Scores recipes against one search: its relevance tier blended with vector similarity.
+
+    The query vector is the search's positive words, hashed like recipe
+    tokens and weighted by their IDF.
+    """
+
+    def __init__(self, query: SearchQuery, document_count: int, document_frequency: Callable[[str], int]):
+        self.query = query
+        weights = [0.0] * DIMENSIONS
+        for token in dict.fromkeys(tokenize(query.ranking_text)):
+            df = document_frequency(token)
+            if df:
+                dimension, sign = _bucket(token)
+                weights[dimension] += sign * math.log(1 + (document_count - df + 0.5) / (df + 0.5))
+        self.vector = _quantize(weights, QUERY_SCALE)
+
+    @staticmethod
+    def blend(tier: Optional[int], similarity: float) -> float:
+        """Score of a recipe with this relevance tier (None when the search text doesn't match) and similarity"""
+        lexical = 0.0 if tier is None else (1 + tier) / 3
+        return LEXICAL_WEIGHT * lexical + (1 - LEXICAL_WEIGHT) * similarity
+
+    def hit(self, recipe: Recipe, similarity: float) -> Optional[float]:
+        """Blended score of a recipe that passed the facet filters, or None if it isn't a hit.
+
+        Lexical matches always are; other recipes need MIN_SIMILARITY and
+        none of the search's excluded terms.
+        """
+        if self.query.matches(recipe):
+            return self.blend(self.query.tier(recipe), similarity)
+        if similarity < MIN_SIMILARITY or self.query.excludes(recipe):
+            return None
+        return self.blend(None, similarity)
+
+    def score(self, recipe: Recipe) -> float:
+        """Blended score of any recipe, for cursors"""
+        similarity = float(cosines(embed(recipe) @ self.vector))
+        tier = self.query.tier(recipe) if self.query.matches(recipe) else None
+        return self.blend(tier, similarity)
+
+
+def scan_hybrid(recipes: Iterable[Recipe], query: SearchQuery) -> HybridScorer:
+    """A hybrid scorer with document frequencies gathered by scanning every recipe"""
+    count, frequencies, _ = scan_statistics(recipes, query.ranking_text)
+    return HybridScorer(query, count, frequencies.__getitem__)
+
+
+def rank_hybrid(recipes: List[Recipe], positions: Sequence[int], scorer: HybridScorer, limit: Optional[int] = None,
+                cursor: Optional[Cursor] = None,
+                vectors: Optional[Sequence] = None) -> Tuple[int, List[Tuple[float, Recipe]]]:
+    """Number of hybrid hits among recipes and the best limit of them with their scores; ties keep their order.
+
+    recipes pass the facet filters and sit at the catalog positions given,
+    in order; a cursor's position is a catalog position too. vectors are
+    their embed() rows if already at hand.
+    """
+    if not recipes:
+        return 0, []
+    rows = np.stack(vectors if vectors is not None else [embed(recipe) for recipe in recipes])
+    hits = []
+    for recipe, position, similarity in zip(recipes, positions, cosines(rows @ scorer.vector).tolist()):
+        score = scorer.hit(recipe, similarity)
+        if score is not None:
+            hits.append((score, position, recipe))
+    total = len(hits)
+    if cursor is not None:
+        hits = [hit for hit in hits if follows((hit[0],), hit[1], cursor)]
+    return total, [(score, recipe) for score, _, recipe in top_k(hits, limit, key=itemgetter(0))]
+
+
+class VectorIndex:
+    """Recipe vectors as rows of a dense float32 matrix indexed by slot.
+
+    The matrix is stored in blocks of BLOCK_ROWS rows, shared copy-on-write
+    between catalog versions like posting lists, so a write copies the one
+    block it touches rather than the matrix. Scoring a query is a
+    matrix-vector product per block.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("The vector index needs numpy (pip install numpy)")
+        self._blocks: CopyOnWriteMap[int, "np.ndarray"] = CopyOnWriteMap(
+            lambda: np.zeros((BLOCK_ROWS, DIMENSIONS), dtype=np.float32), np.copy)
+        self.size = 0
+
+    def copy(self) -> "VectorIndex":
+        clone = VectorIndex.__new__(VectorIndex)
+        clone._blocks = self._blocks.copy()
+        clone.size = self.size
+        return clone
+
+    def add(self, slot: int, recipe: Recipe) -> None:
+        self._blocks.writable(slot // BLOCK_ROWS)[slot % BLOCK_ROWS] = embed(recipe)
+        self.size = max(self.size, slot + 1)
+
+    def load(self, recipes: Sequence[Recipe]) -> None:
+        """Embed recipes at slots 0, 1, ... of an empty index, a block at a time; None is a hole"""
+        for block in range(-(-len(recipes) // BLOCK_ROWS)):
+            rows = recipes[block * BLOCK_ROWS:(block + 1) * BLOCK_ROWS]
+            matrix = self._blocks.writable(block)
+            for row, recipe in enumerate(rows):
+                if recipe is not None:
+                    matrix[row] = embed(recipe)
+        self.size = len(recipes)
+
+    def remove(self, slot: int, recipe: Recipe) -> None:
+        self._blocks.writable(slot // BLOCK_ROWS)[slot % BLOCK_ROWS] = 0
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def rows(self, slots: Sequence[int]) -> list:
+        """The stored rows of slots, in order"""
+        return [self._blocks[slot // BLOCK_ROWS][slot % BLOCK_ROWS] for slot in slots]
+
+    def similarities(self, vector):
+        """Similarity of every slot with a query vector (0 for empty slots), as float64"""
+        blocks = [self._blocks[block] for block in range(-(-self.size // BLOCK_ROWS))]
+        if not blocks:
+            return np.zeros(0)
+        return cosines(np.concatenate([block @ vector for block in blocks])[:self.size])
+
+    def memory_bytes(self) -> int:
+        return len(self._blocks) * BLOCK_ROWS * DIMENSIONS * 4
@@ -0,0 +1,360 @@
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Generic, Iterator, List, MutableSequence, Optional, Sequence, Set, Tuple, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class CopyOnWriteDict(Generic[K, V]):
+    """Dict whose copies share their entries until one side writes.
+
+    Keys are spread over hash buckets, about sqrt(len) of them. copy() only
+    copies the bucket list, and afterwards neither side owns any bucket: the
+    first write to one replaces it with a private duplicate. A version copy
+    and each write after it so cost O(sqrt(n)) rather than O(n). Iteration
+    follows the buckets, not insertion order.
+    """
+
+    __slots__ = ("_buckets", "_mask", "_owned_buckets", "_len")
+
+    MIN_BUCKETS = 8
+
+    def __init__(self):
+        self._buckets: List[Dict[K, V]] = [{} for _ in range(self.MIN_BUCKETS)]
+        self._mask = self.MIN_BUCKETS - 1
+        self._owned_buckets: Set[int] = set(range(self.MIN_BUCKETS))
+        self._len = 0
+
+    def copy(self):
+        clone = self.__class__.__new__(self.__class__)
+        clone._buckets = list(self._buckets)
+        clone._mask = self._mask
+        clone._owned_buckets = set()
+        clone._len = self._len
+        # Everything is shared now, so this side must copy before writing too
+        self._owned_buckets = set()
+        return clone
+
+    def _writable_bucket(self, key: K) -> Dict[K, V]:
+        i = hash(key) & self._mask
+        if i in self._owned_buckets:
+            return self._buckets[i]
+        bucket = self._buckets[i] = dict(self._buckets[i])
+        self._owned_buckets.add(i)
+        return bucket
+
+    def _rehash(self) -> None:
+        """Double the buckets once there are more entries than buckets squared"""
+        count = 2 * len(self._buckets)
+        buckets: List[Dict[K, V]] = [{} for _ in range(count)]
+        for key, value in self.items():
+            buckets[hash(key) & (count - 1)][key] = value
+        self._buckets, self._mask, self._owned_buckets = buckets, count - 1, set(range(count))
+
+    def __setitem__(self, key: K, value: V) -> None:
+        bucket = self._writable_bucket(key)
+        if key not in bucket:
+            self._len += 1
+        bucket[key] = value
+        if self._len > len(self._buckets) ** 2:
+            self._rehash()
+
+    def pop(self, key: K, *default):
+        bucket = self._buckets[hash(key) & self._mask]
+        if key not in bucket:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        self._len -= 1
+        return self._writable_bucket(key).pop(key)
+
+    def __delitem__(self, key: K) -> None:
+        self.pop(key)
+
+    def clear(self) -> None:
+        CopyOnWriteDict.__init__(self)
+
+    def __getitem__(self, key: K) -> V:
+        return self._buckets[hash(key) & self._mask][key]
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        return self._buckets[hash(key) & self._mask].get(key, default)
+
+    def items(self) -> Iterator[Tuple[K, V]]:
+        for bucket in self._buckets:
+            yield from bucket.items()
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._buckets[hash(key) & self._mask]
+
+    def __iter__(self) -> Iterator[K]:
+        for bucket in self._buckets:
+            yield from bucket
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __sizeof__(self) -> int:
+        return (object.__sizeof__(self) + sys.getsizeof(self._buckets) + sys.getsizeof(self._owned_buckets)
+                + sum(sys.getsizeof(bucket) for bucket in self._buckets))
+
+
+class CopyOnWriteMap(CopyOnWriteDict[K, V]):
+    """CopyOnWriteDict of mutable containers (posting sets, bitsets, ...).
+
+    Copies share the containers as well as the buckets. Writers change one
+    through writable(), which first replaces it with a private duplicate
+    unless this side already owns it. Readers use the plain mapping methods.
+    """
+
+    __slots__ = ("_owned", "_new", "_duplicate")
+
+    def __init__(self, new: Callable[[], V], duplicate: Callable[[V], V]):
+        super().__init__()
+        self._owned: Set[K] = set()
+        self._new = new
+        self._duplicate = duplicate
+
+    def copy(self) -> "CopyOnWriteMap[K, V]":
+        clone = super().copy()
+        clone._owned = set()
+        clone._new = self._new
+        clone._duplicate = self._duplicate
+        self._owned = set()
+        return clone
+
+    def writable(self, key: K) -> V:
+        """The container for key, safe to change in place; created if missing"""
+        if key in self._owned:
+            return self._buckets[hash(key) & self._mask][key]
+        bucket = self._writable_bucket(key)
+        value = bucket.get(key)
+        if value is None:
+            value = bucket[key] = self._new()
+            self._len += 1
+        else:
+            value = bucket[key] = self._duplicate(value)
+        self._owned.add(key)
+        if self._len > len(self._buckets) ** 2:
+            self._rehash()
+        return value
+
+    def pop(self, key: K, *default):
+        self._owned.discard(key)
+        return super().pop(key, *default)
+
+    def clear(self) -> None:
+        super().clear()
+        self._owned = set()
+
+
+class CopyOnWriteList(Generic[V]):
+    """List in CHUNK-sized chunks shared between copies until one side writes to a chunk.
+
+    new makes an empty chunk: list, array("I"), bytearray, ... Like
+    CopyOnWriteDict, copy() only copies the chunk list, O(n / CHUNK), and
+    the first write to a shared chunk duplicates just that chunk.
+    """
+
+    __slots__ = ("_chunks", "_owned", "_len", "_new")
+
+    CHUNK = 1024
+
+    def __init__(self, new: Callable[[], MutableSequence] = list):
+        self._chunks: List[MutableSequence] = []
+        self._owned: Set[int] = set()
+        self._len = 0
+        self._new = new
+
+    def copy(self) -> "CopyOnWriteList[V]":
+        clone = CopyOnWriteList(self._new)
+        clone._chunks = list(self._chunks)
+        clone._len = self._len
+        self._owned = set()
+        return clone
+
+    def _writable_chunk(self, i: int) -> MutableSequence:
+        if i in self._owned:
+            return self._chunks[i]
+        chunk = self._chunks[i] = self._chunks[i][:]
+        self._owned.add(i)
+        return chunk
+
+    def __getitem__(self, index: int) -> V:
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        return self._chunks[index // self.CHUNK][index % self.CHUNK]
+
+    def __setitem__(self, index: int, value: V) -> None:
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        self._writable_chunk(index // self.CHUNK)[index % self.CHUNK] = value
+
+    def append(self, value: V) -> None:
+        if self._len % self.CHUNK == 0:
+            self._chunks.append(self._new())
+            self._owned.add(len(self._chunks) - 1)
+        self._writable_chunk(len(self._chunks) - 1).append(value)
+        self._len += 1
+
+    def grow(self, length: int, fill: V) -> None:
+        """Extend to length items with fill"""
+        while self._len < length:
+            if self._len % self.CHUNK == 0:
+                self._chunks.append(self._new())
+                self._owned.add(len(self._chunks) - 1)
+            chunk = self._writable_chunk(len(self._chunks) - 1)
+            count = min(self.CHUNK - len(chunk), length - self._len)
+            chunk.extend([fill] * count)
+            self._len += count
+
+    def extend(self, values: Sequence[V]) -> None:
+        """Append values, a chunk's worth at a time"""
+        start = 0
+        while start < len(values):
+            if self._len % self.CHUNK == 0:
+                self._chunks.append(self._new())
+                self._owned.add(len(self._chunks) - 1)
+            chunk = self._writable_chunk(len(self._chunks) - 1)
+            count = min(self.CHUNK - len(chunk), len(values) - start)
+            chunk.extend(values[start:start + count])
+            self._len += count
+            start += count
+
+    def clear(self) -> None:
+        self._chunks, self._owned, self._len = [], set(), 0
+
+    def chunks(self) -> List[MutableSequence]:
+        """The items as consecutive chunks, for bulk readers; don't change them"""
+        return self._chunks
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[V]:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sys.getsizeof(self._chunks) + sum(map(sys.getsizeof, self._chunks))
+
+
+class CatalogVersion:
+    """One published, never-modified state of the catalog"""
+
+    __slots__ = ("number", "store", "__weakref__")
+
+    def __init__(self, number: int, store):
+        self.number = number
+        self.store = store
+
+
+class VersionedCatalog:
+    """MVCC wrapper that gives every request an immutable catalog version.
+
+    Readers call current() once and scan that version's store without any
+    lock, however long they take. Writers serialize on lock and make their
+    changes inside write() to a copy-on-write copy of the head, the latest
+    version written; an exception discards it. When the block exits the
+    new version becomes the head, and is published to readers by a single
+    pointer swap. A writer that must make its write durable first passes
+    publish=False and calls publish() afterwards; later writes build on the
+    head meanwhile, and versions are published in write order. If the write
+    cannot be made durable, discard() rolls the head back to the current
+    version, dropping every unpublished version built on the failed one.
+
+    Nothing frees old versions explicitly:
+    each one goes away with the last reader holding it, and live_versions()
+    reports how many are still around.
+
+    Pagination cursors name the version their first page came from. pin()
+    keeps the PINNED_VERSIONS most recently paged versions alive so later
+    pages can be served from the same snapshot.
+    """
+
+    PINNED_VERSIONS = 8
+
+    def __init__(self, store):
+        self.lock = threading.Lock()
+        self._live: "weakref.WeakSet[CatalogVersion]" = weakref.WeakSet()
+        self._current = self._head = self._version(0, store)
+        self._publish_lock = threading.Lock()
+        self._pinned: "OrderedDict[int, CatalogVersion]" = OrderedDict()
+        self._pins_lock = threading.Lock()
+        # Versions numbered up to this were discarded and are never published
+        self._discarded = 0
+
+    def _version(self, number: int, store) -> CatalogVersion:
+        version = CatalogVersion(number, store)
+        self._live.add(version)
+        return version
+
+    def current(self) -> CatalogVersion:
+        """The latest published version"""
+        return self._current
+
+    def head(self) -> CatalogVersion:
+        """The latest version written, published or not"""
+        return self._head
+
+    @contextmanager
+    def write(self, publish: bool = True) -> Iterator[CatalogVersion]:
+        """Yield the next version to modify; it becomes the head when the block exits, and current unless publish=False"""
+        with self.lock:
+            draft = self._version(self._head.number + 1, self._head.store.copy())
+            # Stores backed by a database (SQLiteRecipeStore) make the block one transaction
+            transaction = getattr(draft.store, "transaction", None)
+            with nullcontext() if transaction is None else transaction():
+                yield draft
+                # Stores that buffer writes (ShardedRecipeStore) apply them before anyone can read
+                flush = getattr(draft.store, "flush", None)
+                if flush is not None:
+                    flush()
+            self._head = draft
+        if publish:
+            self.publish(draft)
+
+    def publish(self, version: CatalogVersion) -> None:
+        """Make a written version current, unless a later one already is; raises ValueError if it was discarded"""
+        with self._publish_lock:
+            if version.number <= self._current.number:
+                return
+            if version.number <= self._discarded:
+                raise ValueError(f"catalog version {version.number} was discarded")
+            self._current = version
+
+    def discard(self, version: CatalogVersion) -> None:
+        """Roll the head back to the current version, dropping version and the unpublished versions after it"""
+        with self.lock, self._publish_lock:
+            if version.number <= max(self._current.number, self._discarded):
+                return
+            self._discarded = self._head.number
+            # Keep numbering past the dropped versions so cursors never name two different states
+            self._head = self._version(self._head.number, self._current.store)
+
+    def pin(self, version: CatalogVersion) -> None:
+        """Keep version available to pinned(), dropping the least recently used pin if full"""
+        with self._pins_lock:
+            self._pinned[version.number] = version
+            self._pinned.move_to_end(version.number)
+            while len(self._pinned) > self.PINNED_VERSIONS:
+                self._pinned.popitem(last=False)
+
+    def pinned(self, number: int) -> Optional[CatalogVersion]:
+        """The version with this number if it is current or pinned, else None"""
+        current = self._current
+        if current.number == number:
+            return current
+        with self._pins_lock:
+            version = self._pinned.get(number)
+            if version is not None:
+                self._pinned.move_to_end(number)
+            return version
+
+    def live_versions(self) -> int:
+        """Versions still referenced by the catalog or by a reader"""
+        return len(self._live)